@@ -0,0 +1,57 @@
+"""Workflows completed per second, one `Workflow(...).run()` at a time and on a WorkflowExecutor.
+
+    PYTHONPATH=src python -m benchmarks.bench_executor
+"""
+import time
+
+from yanwf.executor import WorkflowExecutor
+from yanwf.tasks import BaseTask, String
+from yanwf.workflows import Workflow
+
+
+class NoopTask(BaseTask):
+    text = String()
+
+    def run(self):
+        pass
+
+
+class IOTask(BaseTask):
+    text = String()
+
+    def run(self):
+        time.sleep(0.001)
+
+
+def make_definitions(task_count, io_every):
+    tasks = {}
+    for i in range(task_count):
+        cls = "IOTask" if io_every and i % io_every == 0 else "NoopTask"
+        tasks[f"task{i}"] = {"cls": cls, "parameters": {"text": "$context.value"}}
+    return {"modules": ["benchmarks.bench_executor"], "context": {"value": "x"}, "tasks": tasks}
+
+
+def measure(definitions, count, max_workers):
+    start = time.perf_counter()
+    for i in range(count):
+        Workflow(raise_on_error=True, definitions=definitions).run()
+    separate = count / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with WorkflowExecutor(max_workers=max_workers, raise_on_error=True) as executor:
+        futures = [executor.submit(definitions, {"value": str(i)}) for i in range(count)]
+        for future in futures:
+            future.result()
+    pooled = count / (time.perf_counter() - start)
+    return separate, pooled
+
+
+def main(count=2000, max_workers=16):
+    for name, io_every in (("cpu only", 0), ("1 io task", 10)):
+        separate, pooled = measure(make_definitions(10, io_every), count, max_workers)
+        speedup = pooled / separate
+        print(f"10 tasks, {name}: separate {separate:8.0f}/s  executor {pooled:8.0f}/s  {speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
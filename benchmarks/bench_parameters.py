@@ -0,0 +1,33 @@
+"""Measure reading task parameters: literal values, `$context.key` and dotted `$context.a.b.c` references.
+
+    PYTHONPATH=src python -m benchmarks.bench_parameters
+"""
+import timeit
+
+from yanwf.tasks import BaseTask, String, WorkflowContext
+
+
+class ParameterTask(BaseTask):
+    literal = String()
+    flat = String()
+    dotted = String()
+
+    def run(self):
+        pass
+
+
+def make_task():
+    task = ParameterTask(literal="value", flat="$context.flat", dotted="$context.a.b.c")
+    task.workflow_context = WorkflowContext({"flat": "value", "a": {"b": {"c": "value"}}})
+    return task
+
+
+def main(number=500000):
+    task = make_task()
+    for name in ("literal", "flat", "dotted"):
+        elapsed = min(timeit.repeat(f"task.{name}", globals={"task": task}, number=number, repeat=5))
+        print(f"{name:8}: {elapsed / number * 1e9:8.1f} ns/access")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Size and encode/decode time of workflow states, pickle and yanwf.serialization.
+
+    PYTHONPATH=src python -m benchmarks.bench_serialization
+"""
+import pickle
+import timeit
+
+from benchmarks.suite import make_definitions
+from yanwf.serialization import dump_state, load_state
+from yanwf.workflows import Workflow
+
+
+def best_of(function, repeat=3) -> float:
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def main(sizes=(1000, 100000)):
+    for size in sizes:
+        workflow_instance = Workflow(definitions=make_definitions(size))
+        workflow_instance.run()
+        state = workflow_instance.state
+
+        pickled = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        encoded = dump_state(state)
+        last = f"task{size - 1}"
+        results = {
+            "pickle": (
+                len(pickled),
+                best_of(lambda: pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)),
+                best_of(lambda: pickle.loads(pickled)),
+                best_of(lambda: pickle.loads(pickled).task_run_stats[last]),
+            ),
+            "serialization": (
+                len(encoded),
+                best_of(lambda: dump_state(state)),
+                best_of(lambda: load_state(encoded)),
+                best_of(lambda: load_state(encoded).task_run_stats[last]),
+            ),
+            "serialization (eager)": (
+                len(encoded),
+                best_of(lambda: dump_state(state)),
+                best_of(lambda: load_state(encoded, lazy=False)),
+                best_of(lambda: load_state(encoded, lazy=False).task_run_stats[last]),
+            ),
+        }
+        print(f"{size} tasks")
+        for name, (length, dump, load, load_one) in results.items():
+            print(
+                f"  {name:22} {length:12,} B  dump {dump * 1e3:8.2f} ms  load {load * 1e3:8.2f} ms"
+                f"  load + 1 stat {load_one * 1e3:8.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Throughput of saving and loading workflow states in the state stores.
+
+    PYTHONPATH=src python -m benchmarks.bench_stores
+"""
+import random
+import threading
+import time
+
+from yanwf.stores import MemoryStateStore, SQLiteStateStore
+from yanwf.workflows import RunStatus, TaskRunStat, WorkflowState
+
+
+def make_state(task_count=20):
+    state = WorkflowState(status=RunStatus.PAUSED)
+    for i in range(task_count):
+        state.task_run_stats[f"task{i}"] = TaskRunStat(status=RunStatus.SUCCESS, output={"value": i})
+        state.context[f"task{i}"] = {"value": i}
+    return state
+
+
+def measure(store, count=20000, threads=8):
+    state = make_state()
+    per_thread = count // threads
+
+    def save(thread_index):
+        for i in range(per_thread):
+            store.save(f"wf{thread_index}-{i}", state)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=save, args=(index,)) for index in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    store.flush()
+    save_rate = count / (time.perf_counter() - start)
+
+    ids = [f"wf{random.randrange(threads)}-{random.randrange(per_thread)}" for _ in range(count)]
+    start = time.perf_counter()
+    for workflow_id in ids:
+        store.load(workflow_id)
+    load_rate = count / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    found = len(store.find(status=RunStatus.PAUSED, task_status=RunStatus.SUCCESS, task_name="task3"))
+    find_time = time.perf_counter() - start
+
+    print(f"{type(store).__name__:18}: {save_rate:10.0f} saves/s {load_rate:10.0f} loads/s "
+          f"find {found} in {find_time * 1000:.1f} ms")
+
+
+def main():
+    for store in (MemoryStateStore(), SQLiteStateStore()):
+        with store:
+            measure(store)
+
+
+if __name__ == "__main__":
+    main()
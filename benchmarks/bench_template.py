@@ -0,0 +1,45 @@
+"""Compare creating workflows from definitions and from a compiled WorkflowTemplate.
+
+    PYTHONPATH=src python -m benchmarks.bench_template
+"""
+import timeit
+
+from yanwf.tasks import BaseTask, Number, String
+from yanwf.templates import WorkflowTemplate
+from yanwf.workflows import Workflow
+
+
+class NoopTask(BaseTask):
+    text = String()
+    count = Number(default_value=1)
+
+    def run(self):
+        pass
+
+
+def make_definitions(task_count):
+    return {
+        "modules": ["yanwf.tasks", "benchmarks.bench_template"],
+        "context": {"value": "x"},
+        "tasks": {
+            f"task{i}": {"cls": "NoopTask", "parameters": {"text": "$context.value", "count": i}}
+            for i in range(task_count)
+        },
+    }
+
+
+def main(task_count=20, number=2000):
+    definitions = make_definitions(task_count)
+    template = WorkflowTemplate(definitions)
+
+    constructor = min(timeit.repeat(lambda: Workflow(definitions=definitions), number=number, repeat=3))
+    stamped = min(timeit.repeat(template.create, number=number, repeat=3))
+
+    print(f"{task_count} tasks, {number} workflows")
+    print(f"Workflow(definitions=...): {constructor / number * 1e6:10.1f} us/workflow")
+    print(f"WorkflowTemplate.create(): {stamped / number * 1e6:10.1f} us/workflow")
+    print(f"speedup: {constructor / stamped:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
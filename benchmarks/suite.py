@@ -0,0 +1,256 @@
+"""Benchmark suite of the engine hot paths, compared with a saved baseline.
+
+Synthetic workflows of 10, 1k and 100k no-op tasks, each task reading the output of the previous one:
+construction, run, pickled resume after a pause, checkpoint size and time, plus per-access context
+lookups, parameter reads and task class lookups.
+
+    PYTHONPATH=src python -m benchmarks.suite --save            # write benchmarks/baseline.json
+    PYTHONPATH=src python -m benchmarks.suite                   # compare, exit 1 on regressions
+    PYTHONPATH=src python -m benchmarks.suite --sizes 10 1000 --threshold 0.25 --filter run
+
+Timings are the best of a few repeats, the baselines are specific to the machine they were saved on.
+"""
+import argparse
+import json
+import os
+import pickle
+import sys
+import time
+import timeit
+from typing import Callable, Dict, List, Tuple
+
+from yanwf.exceptions import PauseWorkflowException
+from yanwf.initializer import get_task_cls
+from yanwf.tasks import BaseTask, String, WorkflowContext
+from yanwf.workflows import RunStatus, Workflow
+
+DEFAULT_SIZES = (10, 1000, 100000)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_THRESHOLD = 0.2
+MODULES = ["benchmarks.suite"]
+
+
+class NoopTask(BaseTask):
+    previous = String()
+
+    def run(self):
+        pass
+
+    def output(self):
+        return self.name
+
+
+class WaitTask(BaseTask):
+    """Pauses until `ready` is set in the context"""
+
+    previous = String()
+
+    def run(self):
+        if not self.workflow_context.get("ready"):
+            raise PauseWorkflowException("not ready")
+
+
+def make_definitions(task_count, last_cls="NoopTask"):
+    tasks = {"task0": {"cls": "NoopTask", "parameters": {}}}
+    for i in range(1, task_count):
+        tasks[f"task{i}"] = {"cls": "NoopTask", "parameters": {"previous": f"$context.task{i - 1}"}}
+    tasks[f"task{task_count - 1}"]["cls"] = last_cls
+    return {"modules": MODULES, "tasks": tasks}
+
+
+def best_of(function: Callable[[], object], repeat: int) -> float:
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def repeats(size):
+    return 5 if size <= 1000 else 1
+
+
+# benchmarks, each returns {metric: value}, times in seconds
+
+
+def bench_construct(size):
+    definitions = make_definitions(size)
+    return {"seconds": best_of(lambda: Workflow(definitions=definitions), repeats(size))}
+
+
+def bench_run(size):
+    definitions = make_definitions(size)
+
+    def run():
+        workflow_instance = Workflow(raise_on_error=True, definitions=definitions)
+        start = time.perf_counter()
+        workflow_instance.run()
+        return time.perf_counter() - start
+
+    elapsed = min(run() for _ in range(repeats(size)))
+    return {"seconds": elapsed, "per_task_seconds": elapsed / size}
+
+
+def bench_resume(size):
+    """Load the pickled workflow paused at its last task and resume it"""
+    workflow_instance = Workflow(definitions=make_definitions(size, last_cls="WaitTask"))
+    workflow_instance.run()
+    assert workflow_instance.status == RunStatus.PAUSED
+    data = pickle.dumps(workflow_instance, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def resume():
+        start = time.perf_counter()
+        resumed = pickle.loads(data)
+        resumed.context["ready"] = True
+        run_start = time.perf_counter()
+        resumed.resume()
+        end = time.perf_counter()
+        assert resumed.status == RunStatus.SUCCESS
+        return end - start, end - run_start
+
+    timings = [resume() for _ in range(repeats(size))]
+    # run_seconds excludes loading the workflow, it grows with the remaining tasks only
+    return {"seconds": min(t[0] for t in timings), "run_seconds": min(t[1] for t in timings)}
+
+
+def bench_restore(size):
+    """Create the workflow of a state paused at its last task, the done tasks are not created"""
+    workflow_instance = Workflow(definitions=make_definitions(size, last_cls="WaitTask"))
+    workflow_instance.run()
+    state = workflow_instance.state
+    definitions = workflow_instance.definitions
+
+    restore = best_of(lambda: Workflow(definitions=definitions, state=state), repeats(size))
+    return {"seconds": restore, "per_task_seconds": restore / size}
+
+
+def bench_checkpoint(size):
+    workflow_instance = Workflow(definitions=make_definitions(size))
+    workflow_instance.run()
+    state = workflow_instance.state
+
+    data = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+    dump = best_of(lambda: pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), repeats(size))
+    load = best_of(lambda: pickle.loads(data), repeats(size))
+    return {"dump_seconds": dump, "load_seconds": load, "bytes": len(data)}
+
+
+def _per_call(statement, namespace, number=200000) -> float:
+    return min(timeit.repeat(statement, globals=namespace, number=number, repeat=5)) / number
+
+
+def bench_context_lookup():
+    context = WorkflowContext({"flat": 1, "a": {"b": {"c": 1}}})
+    namespace = {"context": context}
+    return {
+        "flat_seconds": _per_call('context["flat"]', namespace),
+        "dotted_seconds": _per_call('context["a.b.c"]', namespace),
+    }
+
+
+def bench_parameter_get():
+    task = NoopTask(name="task", previous="$context.a.b.c")
+    task.workflow_context = WorkflowContext({"a": {"b": {"c": 1}}})
+    literal = NoopTask(name="literal", previous="value")
+    namespace = {"task": task, "literal": literal}
+    return {
+        "context_seconds": _per_call("task.previous", namespace),
+        "literal_seconds": _per_call("literal.previous", namespace),
+    }
+
+
+def bench_get_task_cls():
+    namespace = {"get_task_cls": get_task_cls, "modules": MODULES}
+    return {"seconds": _per_call('get_task_cls(modules, "NoopTask")', namespace, number=50000)}
+
+
+SIZED_BENCHMARKS = {
+    "construct": bench_construct,
+    "run": bench_run,
+    "resume": bench_resume,
+    "restore": bench_restore,
+    "checkpoint": bench_checkpoint,
+}
+BENCHMARKS = {
+    "context_lookup": bench_context_lookup,
+    "parameter_get": bench_parameter_get,
+    "get_task_cls": bench_get_task_cls,
+}
+
+
+def run_suite(sizes=DEFAULT_SIZES, name_filter: str = None) -> Dict[str, float]:
+    results = {}
+    for name, benchmark in SIZED_BENCHMARKS.items():
+        for size in sizes:
+            key = f"{name}[{size}]"
+            if name_filter and name_filter not in key:
+                continue
+            for metric, value in benchmark(size).items():
+                results[f"{key}.{metric}"] = value
+    for name, benchmark in BENCHMARKS.items():
+        if name_filter and name_filter not in name:
+            continue
+        for metric, value in benchmark().items():
+            results[f"{name}.{metric}"] = value
+    return results
+
+
+def compare(
+    results: Dict[str, float], baseline: Dict[str, float], threshold: float
+) -> List[Tuple[str, float, float, float]]:
+    """Return (metric, baseline, result, ratio) of the metrics above the baseline by the threshold"""
+    regressions = []
+    for metric, value in results.items():
+        base = baseline.get(metric)
+        if not base:
+            continue
+        ratio = value / base
+        if ratio > 1 + threshold:
+            regressions.append((metric, base, value, ratio))
+    return regressions
+
+
+def _format(metric, value):
+    if metric.endswith("bytes"):
+        return f"{value:12,.0f} B "
+    if value < 1e-3:
+        return f"{value * 1e6:12.3f} us"
+    return f"{value * 1e3:12.3f} ms"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the workflow engine hot paths")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--filter", help="run the benchmarks with this text in their name")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="save the results as the baseline")
+    parser.add_argument(
+        "--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed slowdown ratio"
+    )
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.sizes, args.filter)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    for metric, value in results.items():
+        base = baseline.get(metric)
+        change = f"{(value / base - 1) * 100:+7.1f}%" if base else ""
+        print(f"{metric:40} {_format(metric, value)} {change}")
+
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            saved = {"python": sys.version.split()[0], "results": baseline}
+            json.dump(saved, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    for metric, base, value, ratio in regressions:
+        change = f"{_format(metric, base)} -> {_format(metric, value)}"
+        print(f"REGRESSION {metric}: {change} ({ratio:.2f}x)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,7 @@ from celery import Celery
 from urllib.parse import quote
 from time import sleep
 
+from yanwf.celery_backend import CeleryWorkflowBackend
 from yanwf.workflows import Workflow
 from yanwf.tasks import Number, String, BaseTask
 from yanwf.exceptions import PauseWorkflowException
@@ -18,6 +19,10 @@ class MyWorkflow(Workflow):
         super(MyWorkflow, self).__init__(**kwargs)
 
 
+# runs each task of a workflow as its own celery task: workflow_backend.start(definitions)
+workflow_backend = CeleryWorkflowBackend(app, workflow_cls=MyWorkflow)
+
+
 @app.task
 def reverse(text):
     sleep(5)
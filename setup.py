@@ -33,5 +33,5 @@ setuptools.setup(
 
     ],
 
-    python_requires='>=3.6',
+    python_requires='>=3.9',
 )
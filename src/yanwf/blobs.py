@@ -0,0 +1,193 @@
+"""Out-of-band storage of large task outputs.
+
+Values of task outputs larger than a threshold are appended to a content-addressed blob file and the
+workflow context, `TaskRunStat.output` and the checkpoints only hold a small `BlobRef`. Parameters
+resolving to a `BlobRef` get a zero-copy `memoryview` of the memory-mapped file for bytes, a `str`
+decoded from it for text.
+
+One process writes to a blob file, other processes may read the refs it created. The store of the
+writer locks the file at its first `put`, the stores of the readers never change the file.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, Tuple, Union
+
+try:
+    import fcntl
+except ImportError:
+    # no lock of the writer
+    fcntl = None
+
+# digest, size, kind
+_HEADER = struct.Struct("<32sQB")
+BYTES = 0
+STR = 1
+
+_stores: Dict[str, "BlobStore"] = {}
+_stores_lock = threading.Lock()
+
+
+def open_blob_store(path: str, threshold: int = None) -> "BlobStore":
+    """Return the open store of a blob file of this process"""
+    path = os.path.abspath(path)
+    store = _stores.get(path)
+    if store is None:
+        BlobStore(path)
+        # the first store registered if another thread opened the file at the same time
+        store = _stores[path]
+    if threshold is not None:
+        store.threshold = threshold
+    return store
+
+
+class BlobRef:
+    __slots__ = ("path", "digest", "offset", "size", "kind")
+
+    def __init__(self, path: str, digest: bytes, offset: int, size: int, kind: int):
+        self.path = path
+        self.digest = digest
+        self.offset = offset
+        self.size = size
+        self.kind = kind
+
+    def __getstate__(self):
+        return (self.path, self.digest, self.offset, self.size, self.kind)
+
+    def __setstate__(self, state):
+        self.path, self.digest, self.offset, self.size, self.kind = state
+
+    def load(self) -> Union[memoryview, str]:
+        """Return a memoryview of the blob for bytes, the decoded text for str"""
+        view = open_blob_store(self.path).view(self)
+        if self.kind == STR:
+            return str(view, "utf-8")
+        return view
+
+    def __eq__(self, other):
+        return isinstance(other, BlobRef) and other.digest == self.digest
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return f"BlobRef({self.digest.hex()[:12]}, {self.size} bytes)"
+
+
+class BlobStore:
+    def __init__(self, path: str, threshold: int = 1 << 20):
+        """
+        Args:
+            path: blob file, created if not exists
+            threshold: min size in bytes of the values stored out of band
+        """
+        self.path = os.path.abspath(path)
+        self.threshold = threshold
+        self._index: Dict[bytes, Tuple[int, int, int]] = {}
+        self._lock = threading.Lock()
+        self._mmap = None
+        self._mapped_size = 0
+        self._writer = False
+
+        self._file = open(self.path, "a+b")
+        self._load_index()
+        with _stores_lock:
+            # the refs of this store are loaded with it
+            _stores.setdefault(self.path, self)
+
+    def __reduce__(self):
+        # unpickled as the open store of the file in this process
+        return open_blob_store, (self.path, self.threshold)
+
+    def _load_index(self, offset=0):
+        """Index the complete blobs from offset, the blob of a write in progress is not indexed"""
+        file_size = os.fstat(self._file.fileno()).st_size
+        self._file.seek(offset)
+        while True:
+            header = self._file.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                break
+            digest, size, kind = _HEADER.unpack(header)
+            if offset + _HEADER.size + size > file_size:
+                # incomplete blob of an interrupted or running write
+                break
+            self._index[digest] = (offset + _HEADER.size, size, kind)
+            offset += _HEADER.size + size
+            self._file.seek(offset)
+        self._end = offset
+
+    def _open_writer(self):
+        # must be called with the lock, the store writes to the file until it is closed
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise RuntimeError(f"{self.path} is written by another process") from None
+        # blobs appended by the previous writer since the store was opened
+        self._load_index(self._end)
+        # drop an incomplete blob so the next one is appended right after the last complete one
+        self._file.truncate(self._end)
+        self._writer = True
+
+    def put(self, value: Union[bytes, bytearray, memoryview, str]) -> BlobRef:
+        if isinstance(value, str):
+            data, kind = value.encode("utf-8"), STR
+        else:
+            data, kind = value, BYTES
+        digest = hashlib.sha256(data).digest()
+
+        with self._lock:
+            location = self._index.get(digest)
+            if (location is None or location[2] != kind) and not self._writer:
+                self._open_writer()
+                location = self._index.get(digest)
+            if location is None or location[2] != kind:
+                self._file.seek(self._end)
+                self._file.write(_HEADER.pack(digest, len(data), kind))
+                self._file.write(data)
+                self._file.flush()
+                location = (self._end + _HEADER.size, len(data), kind)
+                self._end += _HEADER.size + len(data)
+                self._index[digest] = location
+        offset, size, kind = location
+        return BlobRef(self.path, digest, offset, size, kind)
+
+    def view(self, ref: BlobRef) -> memoryview:
+        end = ref.offset + ref.size
+        if end > self._mapped_size:
+            with self._lock:
+                if end > self._mapped_size:
+                    self._file.flush()
+                    # views of the previous map keep it open until they are released
+                    self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._mapped_size = len(self._mmap)
+        return memoryview(self._mmap)[ref.offset:end]
+
+    def externalize(self, value):
+        """Return a BlobRef for a bytes or str value larger than the threshold, other values as is"""
+        if isinstance(value, (bytes, bytearray, memoryview, str)) and len(value) >= self.threshold:
+            return self.put(value)
+        return value
+
+    def externalize_output(self, output):
+        """Replace the large values of a task output, the values of a dict output one by one"""
+        if isinstance(output, dict):
+            return {key: self.externalize(value) for key, value in output.items()}
+        return self.externalize(output)
+
+    def __contains__(self, ref: BlobRef):
+        return ref.digest in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def close(self):
+        with _stores_lock:
+            if _stores.get(self.path) is self:
+                del _stores[self.path]
+        self._file.close()
@@ -0,0 +1,198 @@
+"""Cache of task outputs shared across workflow runs.
+
+A task opts in with `cacheable = True` (or `"cache": true` in its definition). The cache key is built
+from the task class, its `cache_version` and its resolved parameter values, so a task with the same
+parameters replays the cached output instead of running again. Bump `cache_version` when the output of
+a task changes for the same parameters.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from yanwf.tasks import BaseTask
+
+logger = logging.getLogger(__name__)
+
+MISS = object()
+
+
+def make_cache_key(task: BaseTask) -> Optional[str]:
+    """Return the cache key of a task, None if its parameters cannot be pickled"""
+    task_cls = type(task)
+    parameters = sorted(task.resolve_parameters(load_blobs=False).items())
+    try:
+        data = pickle.dumps(
+            (task_cls.__module__, task_cls.__qualname__, task.cache_version, parameters),
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+    except (pickle.PicklingError, TypeError, AttributeError) as e:
+        logger.warning("Cannot cache %s: %s", task, e)
+        return None
+    return hashlib.sha256(data).hexdigest()
+
+
+class ResultCache(ABC):
+    def __init__(self, ttl: float = None):
+        """
+        Args:
+            ttl: seconds an output stays in the cache, None to keep it until evicted
+        """
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        """Return the cached output, `MISS` if not found or expired"""
+        data = self._get(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return MISS
+            self.hits += 1
+        return pickle.loads(data)
+
+    def set(self, key: str, output: Any):
+        self._set(key, pickle.dumps(output, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def _expires(self) -> float:
+        return time.time() + self.ttl if self.ttl is not None else float("inf")
+
+    @abstractmethod
+    def _get(self, key: str) -> Optional[bytes]:
+        pass
+
+    @abstractmethod
+    def _set(self, key: str, data: bytes):
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+    @property
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class MemoryResultCache(ResultCache):
+    """LRU cache of pickled outputs in memory"""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = None, ttl: float = None):
+        super().__init__(ttl=ttl)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, data = entry
+            if expires < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return data
+
+    def _set(self, key, data):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self._expires(), data)
+            self.size += len(data)
+            while self._entries and (
+                len(self._entries) > self.max_entries or (self.max_bytes and self.size > self.max_bytes)
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, data = self._entries.pop(key)
+        self.size -= len(data)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskResultCache(ResultCache):
+    """Cache of pickled outputs in a directory, one file per key, least recently used evicted first"""
+
+    SUFFIX = ".result"
+
+    def __init__(self, directory: str, max_bytes: int = 1 << 30, ttl: float = None):
+        super().__init__(ttl=ttl)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in self._scan())
+
+    def _scan(self):
+        return [entry for entry in os.scandir(self.directory) if entry.name.endswith(self.SUFFIX)]
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def _get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        if self.ttl is not None and os.path.getmtime(path) + self.ttl < time.time():
+            self._remove(path)
+            return None
+        # access time for LRU, the modified time is the time the output was cached
+        os.utime(path, (time.time(), os.path.getmtime(path)))
+        return data
+
+    def _set(self, key, data):
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        with self._lock:
+            if os.path.exists(path):
+                self.size -= os.path.getsize(path)
+            os.replace(temp_path, path)
+            self.size += len(data)
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._scan(), key=lambda entry: entry.stat().st_atime)
+        for entry in entries:
+            if self.size <= self.max_bytes:
+                break
+            self._remove(entry.path)
+            self.evictions += 1
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            self.size -= size
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            for entry in self._scan():
+                os.remove(entry.path)
+            self.size = 0
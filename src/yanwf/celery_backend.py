@@ -0,0 +1,129 @@
+"""Run the tasks of a workflow as separate Celery tasks.
+
+Each step sends every ready task of the workflow to the worker pool as a group, a chord callback
+merges the task stats and outputs back into the workflow state and starts the next step. The state
+travels with the messages as a checkpoint, so any worker can continue a workflow.
+"""
+import base64
+import pickle
+import traceback
+import uuid
+from typing import Dict, MutableMapping
+
+from celery import chord
+
+from yanwf.dag import ReadyTracker
+from yanwf.workflows import RunStatus, Workflow, WorkflowState
+
+
+def encode(value) -> str:
+    return base64.b64encode(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)).decode("ascii")
+
+
+def decode(value: str):
+    return pickle.loads(base64.b64decode(value))
+
+
+class CeleryWorkflowBackend:
+    def __init__(self, app, workflow_cls=Workflow, checkpoints: MutableMapping = None, name="yanwf"):
+        """
+        Args:
+            app: Celery app, workers must create the backend with the same app and name
+            workflow_cls: class of the workflows rebuilt from checkpoints
+            checkpoints: optional mapping of workflow id to the latest checkpoint, shared by the workers
+            name: prefix of the Celery task names
+        """
+        self.app = app
+        self.workflow_cls = workflow_cls
+        self.checkpoints = checkpoints
+
+        self.advance = app.task(name=f"{name}.advance", typing=False)(self._advance)
+        self.run_task = app.task(name=f"{name}.run_task", typing=False)(self._run_task)
+        self.join = app.task(name=f"{name}.join", typing=False)(self._join)
+
+    def start(self, definitions, workflow_id: str = None) -> str:
+        """Start a workflow on the workers
+
+        Returns:
+            str: workflow id
+        """
+        workflow_id = workflow_id or uuid.uuid4().hex
+        workflow_instance = self.workflow_cls(definitions=definitions)
+        checkpoint = self._checkpoint(workflow_id, definitions, workflow_instance.state)
+        self.advance.delay(checkpoint)
+        return workflow_id
+
+    def resume(self, workflow_id: str):
+        """Continue a paused workflow from its saved checkpoint"""
+        self.advance.delay(self.checkpoints[workflow_id])
+
+    def get_workflow(self, workflow_id: str) -> Workflow:
+        """Rebuild a workflow from its saved checkpoint"""
+        return self._load(self.checkpoints[workflow_id])
+
+    def save_workflow(self, workflow_id: str, workflow_instance: Workflow):
+        """Save a workflow changed outside the workers, e.g. its context before resume"""
+        self._checkpoint(workflow_id, workflow_instance.definitions, workflow_instance.state)
+
+    def _checkpoint(self, workflow_id, definitions, state: WorkflowState) -> Dict:
+        checkpoint = {"workflow_id": workflow_id, "definitions": definitions, "state": encode(state)}
+        if self.checkpoints is not None:
+            self.checkpoints[workflow_id] = checkpoint
+        return checkpoint
+
+    def _load(self, checkpoint) -> Workflow:
+        state = decode(checkpoint["state"])
+        return self.workflow_cls(definitions=checkpoint["definitions"], state=state)
+
+    def _advance(self, checkpoint):
+        workflow_instance = self._load(checkpoint)
+        succeeded = workflow_instance._get_succeeded_tasks()
+        ready = ReadyTracker(workflow_instance.graph, done=succeeded).pop_ready()
+
+        if not ready:
+            workflow_instance.status = RunStatus.SUCCESS
+            self.save_workflow(checkpoint["workflow_id"], workflow_instance)
+            return workflow_instance.status.name
+
+        header = [self.run_task.s(checkpoint, task_name) for task_name in ready]
+        chord(header)(self.join.s(checkpoint))
+        return RunStatus.RUNNING.name
+
+    def _run_task(self, checkpoint, task_name):
+        workflow_instance = self._load(checkpoint)
+        trace = None
+        try:
+            with workflow_instance.trace_memory():
+                workflow_instance._run_task(task_name)
+        except Exception:
+            trace = traceback.format_exc()
+        return {
+            "task_name": task_name,
+            "stat": encode(workflow_instance.task_run_stats[task_name]),
+            "trace": trace,
+        }
+
+    def _join(self, results, checkpoint):
+        workflow_instance = self._load(checkpoint)
+        workflow_instance.status = RunStatus.RUNNING
+
+        for result in results:
+            task_name = result["task_name"]
+            stat = decode(result["stat"])
+            workflow_instance.task_run_stats[task_name] = stat
+            if stat.status == RunStatus.SUCCESS:
+                workflow_instance._merge_output(task_name, stat.output)
+            elif stat.status == RunStatus.ERROR and workflow_instance.status != RunStatus.ERROR:
+                workflow_instance.status = RunStatus.ERROR
+                workflow_instance.error = stat.status_text
+                workflow_instance.trace = result["trace"]
+            elif stat.status == RunStatus.PAUSED and workflow_instance.status != RunStatus.ERROR:
+                workflow_instance.status = RunStatus.PAUSED
+
+        checkpoint = self._checkpoint(
+            checkpoint["workflow_id"], checkpoint["definitions"], workflow_instance.state
+        )
+
+        if workflow_instance.status == RunStatus.RUNNING:
+            self.advance.delay(checkpoint)
+        return workflow_instance.status.name
@@ -0,0 +1,162 @@
+import heapq
+from typing import Dict, Iterable, List
+
+from yanwf.tasks import CONTEXT_PREFIX
+
+
+def get_context_root(value):
+    """Return the top level context key referenced by a `$context.` parameter value, or None"""
+    if isinstance(value, str) and value.startswith(CONTEXT_PREFIX):
+        return value[len(CONTEXT_PREFIX):].split(".", 1)[0]
+    return None
+
+
+def infer_dependencies(definitions) -> Dict[str, List[str]]:
+    """Build the dependencies of every task in the definitions.
+
+    `depends_on` in a task definition is used as is. Otherwise dependencies are inferred from the
+    `$context.` references in the task parameters and the collection of a `map`:
+     - the key is a task name or listed in a task's `outputs`: depends on that task
+     - no task produces the key, e.g. a key of the initial context: no dependency
+    """
+    task_definitions = definitions["tasks"]
+    task_names = list(task_definitions)
+
+    producers = {}
+    for task_name in task_names:
+        producers[task_name] = task_name
+        for key in task_definitions[task_name].get("outputs", ()):
+            producers[key] = task_name
+
+    dependencies = {}
+    for task_name in task_names:
+        task_definition = task_definitions[task_name]
+        if "depends_on" in task_definition:
+            dependencies[task_name] = list(task_definition["depends_on"])
+            continue
+
+        task_dependencies = []
+        values = list(task_definition.get("parameters", {}).values())
+        if "map" in task_definition:
+            values.append(task_definition["map"].get("over"))
+        for value in values:
+            root = get_context_root(value)
+            if root is None:
+                continue
+            producer = producers.get(root)
+            if producer is not None and producer != task_name and producer not in task_dependencies:
+                task_dependencies.append(producer)
+        dependencies[task_name] = task_dependencies
+    return dependencies
+
+
+class TaskGraph:
+    def __init__(self, dependencies: Dict[str, List[str]] = None):
+        self.dependencies: Dict[str, List[str]] = dict(dependencies or {})
+        self.dependents: Dict[str, List[str]] = {name: [] for name in self.dependencies}
+        # position of the tasks in the definitions, the ready task defined first runs first
+        self.positions: Dict[str, int] = {name: index for index, name in enumerate(self.dependencies)}
+
+        for task_name, task_dependencies in self.dependencies.items():
+            for dependency in task_dependencies:
+                if dependency not in self.dependencies:
+                    raise ValueError(f"{task_name} depends on unknown task: {dependency}")
+                self.dependents[dependency].append(task_name)
+
+        self.order: List[str] = self._sort()
+
+    @classmethod
+    def from_definitions(cls, definitions) -> "TaskGraph":
+        return cls(infer_dependencies(definitions))
+
+    def _sort(self) -> List[str]:
+        # Kahn's algorithm, the ready task defined first is taken first
+        tracker = ReadyTracker(self)
+        order = []
+        while tracker.has_ready():
+            task_name = tracker.pop_next()
+            order.append(task_name)
+            tracker.mark_done(task_name)
+
+        if len(order) != len(self.dependencies):
+            cyclic = [name for name in self.dependencies if name not in order]
+            raise ValueError(f"Cyclic task dependencies: {cyclic}")
+        return order
+
+    def __len__(self):
+        return len(self.dependencies)
+
+
+class ReadyTracker:
+    """Track which tasks of a graph have all their dependencies done
+
+    The frontier is the number of dependencies not done of every task not done, a tracker created from
+    a saved frontier only visits the remaining tasks.
+    """
+
+    def __init__(self, graph: TaskGraph, done: Iterable[str] = (), frontier: Dict[str, int] = None):
+        self.graph = graph
+        # heap of (position, task name)
+        self._ready = []
+
+        if frontier is not None:
+            self._waiting = dict(frontier)
+            for task_name, count in frontier.items():
+                if not count:
+                    self._push(task_name)
+            return
+
+        done = set(done)
+        self._waiting = {}
+        for task_name, task_dependencies in graph.dependencies.items():
+            if task_name in done:
+                continue
+            count = sum(1 for dependency in task_dependencies if dependency not in done)
+            self._waiting[task_name] = count
+            if not count:
+                self._push(task_name)
+
+    def _push(self, task_name):
+        heapq.heappush(self._ready, (self.graph.positions[task_name], task_name))
+
+    def has_ready(self) -> bool:
+        return bool(self._ready)
+
+    def pop_next(self) -> str:
+        """Return the ready task defined first, it stays in the frontier until marked done"""
+        return heapq.heappop(self._ready)[1]
+
+    def pop_ready(self) -> List[str]:
+        """Return the ready tasks in definition order, they stay in the frontier until marked done"""
+        ready = [task_name for _, task_name in sorted(self._ready)]
+        self._ready.clear()
+        return ready
+
+    def mark_done(self, task_name):
+        self._waiting.pop(task_name, None)
+        for dependent in self.graph.dependents[task_name]:
+            if dependent not in self._waiting:
+                continue
+            self._waiting[dependent] -= 1
+            if not self._waiting[dependent]:
+                self._push(dependent)
+
+    def reopen(self, task_name):
+        """Run a done task again before its dependents not done yet"""
+        if task_name in self._waiting:
+            return
+        self._waiting[task_name] = 0
+        self._push(task_name)
+        for dependent in self.graph.dependents[task_name]:
+            if dependent in self._waiting:
+                self._waiting[dependent] += 1
+
+    @property
+    def frontier(self) -> Dict[str, int]:
+        """Copy of the frontier, to save with the state of the workflow"""
+        return dict(self._waiting)
+
+    @property
+    def remaining(self) -> int:
+        """Number of tasks not done"""
+        return len(self._waiting)
@@ -1,8 +1,38 @@
+from datetime import datetime, timedelta
 
 
 class PauseWorkflowException(Exception):
-    pass
+    def __init__(self, message="", wake_at=None, wait_for: str = None):
+        """
+        Args:
+            message: status text of the paused task
+            wake_at: UTC datetime, or seconds from now, when a WakeupScheduler resumes the workflow
+            wait_for: event name, `WakeupScheduler.signal` of it resumes the workflow
+        """
+        super().__init__(message)
+        if isinstance(wake_at, (int, float)):
+            wake_at = datetime.utcnow() + timedelta(seconds=wake_at)
+        self.wake_at = wake_at
+        self.wait_for = wait_for
 
 
 class TaskRunningException(Exception):
     pass
+
+
+class TaskTimeoutException(Exception):
+    pass
+
+
+class TaskCancelledException(Exception):
+    pass
+
+
+class ContextConflictException(Exception):
+    def __init__(self, keys):
+        """
+        Args:
+            keys: keys written by a task that were written in the workflow context while it ran
+        """
+        super().__init__(f"context keys written concurrently: {', '.join(keys)}")
+        self.keys = list(keys)
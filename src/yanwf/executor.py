@@ -0,0 +1,255 @@
+"""Run many workflow instances on a shared pool of worker threads.
+
+    with WorkflowExecutor(max_workers=16, queue_size=1000, tenant_limits={"batch": 2}) as executor:
+        futures = [executor.submit(definitions, {"path": path}, tenant="batch") for path in paths]
+        statuses = [future.result().status for future in futures]
+
+Submissions wait in a bounded queue, `submit` blocks (or raises `queue.Full`) while it is full. The
+workers take the submissions of the tenants in turn, skipping the tenants that already run their limit of
+workflows. The definitions are compiled once into a `WorkflowTemplate`, task classes included.
+"""
+import itertools
+import queue
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Deque, Dict, Hashable, Optional
+
+from yanwf.templates import WorkflowTemplate
+from yanwf.workflows import Workflow
+
+
+class _Submission:
+    __slots__ = ("template", "context", "tenant", "future")
+
+    def __init__(self, template: WorkflowTemplate, context, tenant, future: Future):
+        self.template = template
+        self.context = context
+        self.tenant = tenant
+        self.future = future
+
+
+class WorkflowExecutor:
+    def __init__(
+        self,
+        max_workers=8,
+        queue_size=1000,
+        tenant_limit: Optional[int] = None,
+        tenant_limits: Dict[Hashable, int] = None,
+        workflow_cls=Workflow,
+        template_cache_size=128,
+        **workflow_kwargs,
+    ):
+        """
+        Args:
+            max_workers: number of worker threads, each runs one workflow at a time
+            queue_size: max number of submissions waiting for a worker
+            tenant_limit: max number of workflows run at the same time per tenant, None for no limit
+            tenant_limits: limits of specific tenants, override `tenant_limit`
+            workflow_cls: class of the created workflows
+            template_cache_size: number of compiled definitions kept
+            workflow_kwargs: passed to every created workflow, e.g. `raise_on_error` or `result_cache`
+        """
+        if max_workers < 1 or queue_size < 1:
+            raise ValueError("max_workers and queue_size must be at least 1")
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.tenant_limit = tenant_limit
+        self.tenant_limits = dict(tenant_limits or {})
+        self.workflow_cls = workflow_cls
+        self.template_cache_size = template_cache_size
+        self.workflow_kwargs = workflow_kwargs
+
+        self._templates: "OrderedDict[Hashable, WorkflowTemplate]" = OrderedDict()
+        self._templates_lock = threading.Lock()
+
+        self._pending: Dict[Hashable, Deque[_Submission]] = {}
+        # tenants with pending submissions, in the order the workers take them
+        self._tenants: Deque[Hashable] = deque()
+        self._pending_count = 0
+        self._running: Dict[Hashable, int] = {}
+        self._shutdown = False
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._work = threading.Condition(self._lock)
+
+        self._workers = []
+        for index in range(max_workers):
+            worker = threading.Thread(
+                target=self._work_loop, name=f"yanwf-executor-{index}", daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def get_template(self, definitions, key: Hashable = None) -> WorkflowTemplate:
+        """Compiled template of the definitions, kept in a LRU cache.
+
+        The cache is keyed by `key` or else by the definitions object, definitions changed after they
+        were submitted need a new key (or a new dict).
+        """
+        cache_key = ("key", key) if key is not None else ("id", id(definitions))
+        with self._templates_lock:
+            template = self._templates.get(cache_key)
+            if template is not None and (key is not None or template.definitions is definitions):
+                self._templates.move_to_end(cache_key)
+                return template
+
+        template = WorkflowTemplate(definitions, workflow_cls=self.workflow_cls)
+        with self._templates_lock:
+            # the cached template keeps the definitions alive, their id is not reused while cached
+            self._templates[cache_key] = template
+            while len(self._templates) > self.template_cache_size:
+                self._templates.popitem(last=False)
+        return template
+
+    def submit(
+        self,
+        definitions,
+        context=None,
+        tenant: Hashable = None,
+        key: Hashable = None,
+        block=True,
+        timeout: float = None,
+    ) -> Future:
+        """Queue a workflow
+
+        Args:
+            definitions: workflow definitions, or a `WorkflowTemplate`
+            context: values added to the context of the definitions
+            tenant: submissions of a tenant run at most its limit of workflows at the same time
+            key: cache key of the compiled definitions, see `get_template`
+            block: wait for a free place in the queue, else raise `queue.Full`
+            timeout: max seconds to wait for a free place, then raise `queue.Full`
+
+        Returns:
+            Future: result is the workflow once run, or the exception raised by its run
+        """
+        if isinstance(definitions, WorkflowTemplate):
+            template = definitions
+        else:
+            template = self.get_template(definitions, key)
+        future = Future()
+        submission = _Submission(template, context, tenant, future)
+
+        with self._not_full:
+            if self._shutdown:
+                raise RuntimeError("cannot submit a workflow after shutdown")
+            if self._pending_count >= self.queue_size:
+                if not block:
+                    raise queue.Full
+                if not self._not_full.wait_for(self._has_room, timeout):
+                    raise queue.Full
+                if self._shutdown:
+                    raise RuntimeError("cannot submit a workflow after shutdown")
+            pending = self._pending.get(tenant)
+            if pending is None:
+                pending = self._pending[tenant] = deque()
+                self._tenants.append(tenant)
+            pending.append(submission)
+            self._pending_count += 1
+            self._work.notify()
+        return future
+
+    def map(self, submissions, tenant: Hashable = None, key: Hashable = None):
+        """Submit (definitions, context) pairs, yield the futures while the submissions are accepted"""
+        for definitions, context in submissions:
+            yield self.submit(definitions, context, tenant=tenant, key=key)
+
+    def _has_room(self):
+        return self._pending_count < self.queue_size or self._shutdown
+
+    def _limit(self, tenant) -> Optional[int]:
+        return self.tenant_limits.get(tenant, self.tenant_limit)
+
+    def _take(self) -> Optional[_Submission]:
+        """Next submission of a tenant below its limit, called under the lock"""
+        tenants = self._tenants
+        for _ in range(len(tenants)):
+            tenant = tenants[0]
+            limit = self._limit(tenant)
+            if limit is not None and self._running.get(tenant, 0) >= limit:
+                tenants.rotate(-1)
+                continue
+            pending = self._pending[tenant]
+            submission = pending.popleft()
+            if pending:
+                # round robin, the next submission of this tenant goes after the other tenants
+                tenants.rotate(-1)
+            else:
+                tenants.popleft()
+                del self._pending[tenant]
+            self._pending_count -= 1
+            self._running[tenant] = self._running.get(tenant, 0) + 1
+            self._not_full.notify()
+            return submission
+        return None
+
+    def _work_loop(self):
+        while True:
+            with self._work:
+                submission = self._take()
+                while submission is None:
+                    if self._shutdown and not self._pending_count:
+                        return
+                    self._work.wait()
+                    submission = self._take()
+
+            self._run(submission)
+
+            with self._work:
+                tenant = submission.tenant
+                self._running[tenant] -= 1
+                if not self._running[tenant]:
+                    del self._running[tenant]
+                if tenant in self._pending:
+                    # a submission of this tenant may have been waiting for the limit
+                    self._work.notify()
+
+    def _run(self, submission: _Submission):
+        future = submission.future
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            template = submission.template
+            workflow_instance = template.create(context=submission.context, **self.workflow_kwargs)
+            workflow_instance.run()
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(workflow_instance)
+
+    @property
+    def pending(self) -> int:
+        """Number of submissions waiting for a worker"""
+        return self._pending_count
+
+    def running(self, tenant: Hashable = None) -> int:
+        """Number of workflows running, of a tenant or of all tenants"""
+        with self._lock:
+            if tenant is None:
+                return sum(self._running.values())
+            return self._running.get(tenant, 0)
+
+    def shutdown(self, wait=True, cancel_pending=False):
+        """Stop the workers once the queue is empty
+
+        Args:
+            wait: wait until the workers have stopped
+            cancel_pending: cancel the futures of the submissions not started
+        """
+        with self._lock:
+            self._shutdown = True
+            if cancel_pending:
+                for submission in itertools.chain.from_iterable(self._pending.values()):
+                    submission.future.cancel()
+            self._work.notify_all()
+            self._not_full.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
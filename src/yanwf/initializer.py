@@ -1,26 +1,61 @@
 from importlib import import_module
 from typing import Dict, List
 
+from yanwf.mapping import MapTask
+from yanwf.registry import default_registry
+from yanwf.tasks import BaseTask
 
-def get_task_cls(module_names: List[str], task_cls: Dict):
+# classes found by looking up modules, per (modules, class name)
+_resolved_classes = {}
+# modules failed to import, not tried again
+_failed_imports = set()
+
+
+def get_task_cls(module_names: List[str], task_cls: Dict, registry=default_registry):
 
     try:
         if "." in task_cls:
             module_path, class_name = task_cls.rsplit(".", 1)
             module = import_module(module_path)
             return getattr(module, class_name)
-        else:
-            for module_name in module_names:
-                module = try_import_module(module_name)
-                if module and hasattr(module, task_cls):
-                    return getattr(module, task_cls)
-            raise ValueError(f"Cannot get tasks class: {task_cls}. " f"Looks up in {module_names}")
+
+        registered_cls = registry.resolve(task_cls, module_names)
+        if registered_cls is not None:
+            return registered_cls
+
+        key = (tuple(module_names), task_cls)
+        if key in _resolved_classes:
+            return _resolved_classes[key]
+
+        for module_name in module_names:
+            module = try_import_module(module_name)
+            if module and hasattr(module, task_cls):
+                _resolved_classes[key] = getattr(module, task_cls)
+                return _resolved_classes[key]
+
+        # registered in modules not listed by the definitions
+        registered_cls = registry.resolve(task_cls)
+        if registered_cls is not None:
+            return registered_cls
+        raise ValueError(f"Cannot get tasks class: {task_cls}. " f"Looks up in {module_names}")
     except (ImportError, AttributeError) as e:
         raise ImportError(task_cls) from e
 
 
 def try_import_module(name):
+    if name in _failed_imports:
+        return None
     try:
         return import_module(name)
     except ImportError:
+        _failed_imports.add(name)
         return None
+
+
+def create_task(task_name: str, task_definition: Dict, module_names: List[str]) -> BaseTask:
+    """Create the task of a task definition, a MapTask if the definition has a `map`"""
+    task_cls = get_task_cls(module_names=module_names, task_cls=task_definition.get("cls", task_name))
+    name = task_definition.get("name", task_name)
+    if "map" in task_definition:
+        return MapTask(name, task_cls, task_definition["parameters"], **task_definition["map"])
+    return task_cls(name=name, **task_definition["parameters"])
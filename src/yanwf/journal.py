@@ -0,0 +1,257 @@
+"""Append-only checkpoint journal of a workflow.
+
+Every task start, finish, pause or error and every workflow status change is appended to the journal
+file as a small record, the output of a finished task is the context delta. After `compact_every`
+records the whole state is written once to a snapshot file and the journal is truncated.
+
+A workflow is restored from the snapshot plus the records appended after it. The tasks running when
+the process stopped are restored as paused, `resume()` runs them again:
+
+    journal = CheckpointJournal("wf1.journal")
+    workflow = Workflow(definitions=definitions, journal=journal)
+    workflow.run()
+    ...
+    workflow = CheckpointJournal("wf1.journal").restore(definitions=definitions)
+    workflow.resume()
+"""
+import os
+import pickle
+import struct
+import threading
+
+from yanwf.listeners import WorkflowListener
+from yanwf.workflows import RunStatus, TaskRunStat, Workflow, WorkflowState, merge_output
+
+_HEADER = struct.Struct("<I")
+
+TASK_STARTED = 1
+TASK_FINISHED = 2
+TASK_FAILED = 3
+WORKFLOW_FINISHED = 4
+CONTEXT_UPDATED = 5
+STREAM_CLOSED = 6
+TASKS_RESET = 7
+
+
+class CheckpointJournal(WorkflowListener):
+    def __init__(self, path: str, compact_every: int = 1000, fsync: bool = False):
+        """
+        Args:
+            path: journal file, the snapshot is written to `path + ".snapshot"`
+            compact_every: number of records appended before writing a new snapshot
+            fsync: flush every record to disk, safer but slower
+        """
+        self.path = path
+        self.snapshot_path = path + ".snapshot"
+        self.compact_every = compact_every
+        self.fsync = fsync
+
+        self._file = None
+        self._seq = None
+        self._records_since_snapshot = 0
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        return {"path": self.path, "compact_every": self.compact_every, "fsync": self.fsync}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    # events of Workflow
+
+    def task_started(self, workflow: Workflow, task_name):
+        stat = workflow.task_run_stats[task_name]
+        self.append(workflow, (TASK_STARTED, task_name, stat.start_time))
+
+    def task_finished(self, workflow: Workflow, task_name):
+        stat = workflow.task_run_stats[task_name]
+        record = (TASK_FINISHED, task_name, stat.end_time, stat.output)
+        if stat.reads is not None or stat.profile_path is not None:
+            record += (stat.reads, stat.writes, stat.profile_path)
+        self.append(workflow, record)
+
+    def task_failed(self, workflow: Workflow, task_name):
+        stat = workflow.task_run_stats[task_name]
+        record = (TASK_FAILED, task_name, stat.status.value, stat.end_time, stat.status_text)
+        if stat.wake_at is not None or stat.wait_for is not None:
+            record += (stat.wake_at, stat.wait_for)
+        self.append(workflow, record)
+
+    def workflow_finished(self, workflow: Workflow):
+        error = str(workflow.error) if workflow.error is not None else None
+        self.append(workflow, (WORKFLOW_FINISHED, workflow.status.value, error, workflow.trace))
+
+    def stream_closed(self, workflow: Workflow, task_name):
+        stat = workflow.task_run_stats[task_name]
+        self.append(workflow, (STREAM_CLOSED, task_name, stat.stream_position, stat.stream_done))
+
+    def tasks_reset(self, workflow: Workflow, task_names):
+        self.append(workflow, (TASKS_RESET, list(task_names)))
+
+    def update_context(self, workflow: Workflow, delta: dict):
+        """Update the context outside of the tasks, e.g. before resume, and record the change"""
+        with workflow._lock:
+            workflow.context.update(delta)
+            self.append(workflow, (CONTEXT_UPDATED, delta))
+
+    # writing
+
+    def append(self, workflow: Workflow, record: tuple):
+        with self._lock:
+            if self._seq is None:
+                self._seq = self._load_seq()
+            self._seq += 1
+            data = pickle.dumps((self._seq,) + record, protocol=pickle.HIGHEST_PROTOCOL)
+
+            if self._file is None:
+                self._file = open(self.path, "ab")
+            self._file.write(_HEADER.pack(len(data)) + data)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+            self._records_since_snapshot += 1
+            if self._records_since_snapshot >= self.compact_every:
+                self.compact(workflow.state)
+
+    def compact(self, state: WorkflowState):
+        """Write the state to the snapshot file and truncate the journal"""
+        with self._lock:
+            if self._seq is None:
+                self._seq = self._load_seq()
+
+            temp_path = self.snapshot_path + ".tmp"
+            with open(temp_path, "wb") as f:
+                pickle.dump((self._seq, state), f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            os.replace(temp_path, self.snapshot_path)
+
+            # records up to the snapshot seq are skipped on load if truncating is interrupted
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self.path, "wb")
+            self._records_since_snapshot = 0
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    # reading
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return 0, WorkflowState()
+        with open(self.snapshot_path, "rb") as f:
+            return pickle.load(f)
+
+    def _read_records(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            while True:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    return
+                (size,) = _HEADER.unpack(header)
+                data = f.read(size)
+                if len(data) < size:
+                    # incomplete last record of an interrupted write
+                    return
+                yield pickle.loads(data)
+
+    def _load_seq(self):
+        seq, _ = self._read_snapshot()
+        for record in self._read_records():
+            seq = max(seq, record[0])
+        return seq
+
+    def load(self) -> WorkflowState:
+        """Rebuild the state from the snapshot and the journal records appended after it"""
+        with self._lock:
+            seq, state = self._read_snapshot()
+            records = 0
+            for record in self._read_records():
+                if record[0] <= seq:
+                    continue
+                apply_record(state, record)
+                seq = record[0]
+                records += 1
+            _reset_interrupted(state, records)
+            self._seq = seq
+            self._records_since_snapshot = records
+            return state
+
+    def restore(self, definitions=None, template=None, workflow_cls=Workflow, **kwargs) -> Workflow:
+        """Rebuild a workflow recording to this journal
+
+        Args:
+            definitions: definitions of the workflow, or
+            template: WorkflowTemplate of the workflow
+            kwargs: passed to the workflow class
+        """
+        state = self.load()
+        if template is not None:
+            return template.create(state=state, journal=self, **kwargs)
+        return workflow_cls(definitions=definitions, state=state, journal=self, **kwargs)
+
+
+def _reset_interrupted(state: WorkflowState, records: int):
+    # a task still running in the restored state was interrupted by the end of the process
+    interrupted = state.task_run_stats.with_status(RunStatus.RUNNING)
+    for task_name in interrupted:
+        stat = state.task_run_stats[task_name]
+        stat.status = RunStatus.PAUSED
+        stat.status_text = "interrupted"
+    if state.status == RunStatus.RUNNING:
+        state.status = RunStatus.PAUSED
+    # the frontier is saved at the end of a run, not journaled
+    if interrupted or records:
+        state.frontier = None
+
+
+def apply_record(state: WorkflowState, record: tuple):
+    kind = record[1]
+    if kind == TASK_STARTED:
+        _, _, task_name, start_time = record
+        stat = state.task_run_stats.get(task_name)
+        if stat is None:
+            stat = state.task_run_stats[task_name] = TaskRunStat(start_time=start_time)
+        stat.status = RunStatus.RUNNING
+    elif kind == TASK_FINISHED:
+        _, _, task_name, end_time, output = record[:5]
+        merge_output(state.context, task_name, output)
+        stat = state.task_run_stats[task_name]
+        stat.status = RunStatus.SUCCESS
+        stat.end_time = end_time
+        stat.output = output
+        # (reads, writes, profile path) of the tasks tracked or profiled, (reads, writes) before
+        stat.reads, stat.writes, stat.profile_path = (record[5:] + (None, None, None))[:3]
+    elif kind == TASK_FAILED:
+        _, _, task_name, status, end_time, status_text = record[:6]
+        stat = state.task_run_stats[task_name]
+        stat.status = RunStatus(status)
+        stat.end_time = end_time
+        stat.status_text = status_text
+        stat.wake_at, stat.wait_for = record[6:] or (None, None)
+    elif kind == WORKFLOW_FINISHED:
+        _, _, status, error, trace = record
+        state.status = RunStatus(status)
+        state.error = error
+        state.trace = trace
+    elif kind == CONTEXT_UPDATED:
+        state.context.update(record[2])
+    elif kind == STREAM_CLOSED:
+        _, _, task_name, position, done = record
+        stat = state.task_run_stats[task_name]
+        stat.stream_position = position
+        stat.stream_done = done
+    elif kind == TASKS_RESET:
+        for task_name in record[2]:
+            state.task_run_stats.pop(task_name, None)
+        state.frontier = None
+    else:
+        raise ValueError(f"Unknown journal record: {kind}")
@@ -0,0 +1,226 @@
+"""Listeners of the task lifecycle events of a workflow.
+
+A listener is called by the workflow, under its lock, after the stat of a task is updated:
+
+    listeners = [PrometheusExporter("metrics.prom"), SpanExporter("spans.jsonl")]
+    Workflow(definitions=definitions, listeners=listeners)
+
+`CheckpointJournal` is a listener too. Listeners are pickled with the workflow, keep only their
+settings in the pickled state.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+import weakref
+from collections import defaultdict
+from datetime import timezone
+
+
+class WorkflowListener:
+    def task_started(self, workflow, task_name):
+        pass
+
+    def task_finished(self, workflow, task_name):
+        pass
+
+    def task_failed(self, workflow, task_name):
+        pass
+
+    def stream_closed(self, workflow, task_name):
+        pass
+
+    def tasks_reset(self, workflow, task_names):
+        pass
+
+    def workflow_finished(self, workflow):
+        pass
+
+
+class PrometheusExporter(WorkflowListener):
+    """Metrics of the tasks in the Prometheus text format, for the node exporter textfile collector.
+
+    The file is written when a workflow finishes, with the totals of all workflows since the exporter
+    was created.
+    """
+
+    def __init__(self, path: str, prefix: str = "yanwf"):
+        self.path = path
+        self.prefix = prefix
+        self._runs = defaultdict(int)
+        self._phase_seconds = defaultdict(float)
+        self._phase_counts = defaultdict(int)
+        self._cpu_seconds = defaultdict(float)
+        self._peak_memory = {}
+        self._workflows = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {"path": self.path, "prefix": self.prefix}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def task_finished(self, workflow, task_name):
+        self._add(task_name, workflow.task_run_stats[task_name])
+
+    def task_failed(self, workflow, task_name):
+        self._add(task_name, workflow.task_run_stats[task_name])
+
+    def _add(self, task_name, stat):
+        with self._lock:
+            self._runs[(task_name, stat.status.name.lower())] += 1
+            phases = dict(stat.timings)
+            if stat.duration is not None:
+                phases["total"] = stat.duration
+            for phase, seconds in phases.items():
+                self._phase_seconds[(task_name, phase)] += seconds
+                self._phase_counts[(task_name, phase)] += 1
+            if stat.cpu_time is not None:
+                self._cpu_seconds[task_name] += stat.cpu_time
+            if stat.peak_memory is not None:
+                self._peak_memory[task_name] = max(self._peak_memory.get(task_name, 0), stat.peak_memory)
+
+    def workflow_finished(self, workflow):
+        with self._lock:
+            self._workflows[workflow.status.name.lower()] += 1
+            text = self.render()
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(text)
+        os.replace(temp_path, self.path)
+
+    def render(self) -> str:
+        prefix = self.prefix
+        lines = [
+            f"# HELP {prefix}_workflows_total Finished workflow runs by status.",
+            f"# TYPE {prefix}_workflows_total counter",
+        ]
+        for status, count in sorted(self._workflows.items()):
+            lines.append(f'{prefix}_workflows_total{{status="{status}"}} {count}')
+
+        lines += [
+            f"# HELP {prefix}_task_runs_total Finished task runs by status.",
+            f"# TYPE {prefix}_task_runs_total counter",
+        ]
+        for (task_name, status), count in sorted(self._runs.items()):
+            labels = f'task="{_escape(task_name)}",status="{status}"'
+            lines.append(f"{prefix}_task_runs_total{{{labels}}} {count}")
+
+        lines += [
+            f"# HELP {prefix}_task_phase_seconds Time spent in the phases of the task runs.",
+            f"# TYPE {prefix}_task_phase_seconds summary",
+        ]
+        for (task_name, phase), seconds in sorted(self._phase_seconds.items()):
+            labels = f'task="{_escape(task_name)}",phase="{phase}"'
+            lines.append(f"{prefix}_task_phase_seconds_sum{{{labels}}} {seconds!r}")
+            count = self._phase_counts[(task_name, phase)]
+            lines.append(f"{prefix}_task_phase_seconds_count{{{labels}}} {count}")
+
+        if self._cpu_seconds:
+            lines += [
+                f"# HELP {prefix}_task_cpu_seconds_total CPU time of the task runs.",
+                f"# TYPE {prefix}_task_cpu_seconds_total counter",
+            ]
+            for task_name, seconds in sorted(self._cpu_seconds.items()):
+                labels = f'task="{_escape(task_name)}"'
+                lines.append(f"{prefix}_task_cpu_seconds_total{{{labels}}} {seconds!r}")
+
+        if self._peak_memory:
+            lines += [
+                f"# HELP {prefix}_task_peak_memory_bytes Max peak memory allocated by a task run.",
+                f"# TYPE {prefix}_task_peak_memory_bytes gauge",
+            ]
+            for task_name, size in sorted(self._peak_memory.items()):
+                lines.append(f'{prefix}_task_peak_memory_bytes{{task="{_escape(task_name)}"}} {size}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class SpanExporter(WorkflowListener):
+    """Trace spans of the task runs and workflow runs appended as JSON lines.
+
+    The spans of one workflow run share a `trace_id`, the task spans have the workflow span as parent.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._traces = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _trace(self, workflow):
+        trace = self._traces.get(workflow)
+        if trace is None:
+            trace = self._traces[workflow] = (uuid.uuid4().hex, uuid.uuid4().hex[:16], time.time())
+        return trace
+
+    def task_started(self, workflow, task_name):
+        self._trace(workflow)
+
+    def task_finished(self, workflow, task_name):
+        self._write_task_span(workflow, task_name)
+
+    def task_failed(self, workflow, task_name):
+        self._write_task_span(workflow, task_name)
+
+    def _write_task_span(self, workflow, task_name):
+        trace_id, parent_id, _ = self._trace(workflow)
+        stat = workflow.task_run_stats[task_name]
+        start = stat.start_time.replace(tzinfo=timezone.utc).timestamp()
+        span = {
+            "trace_id": trace_id,
+            "span_id": uuid.uuid4().hex[:16],
+            "parent_id": parent_id,
+            "name": task_name,
+            "kind": "task",
+            "start": start,
+            "duration": stat.duration,
+            "status": stat.status.name,
+            "status_text": stat.status_text,
+            "timings": stat.timings,
+            "cpu_time": stat.cpu_time,
+            "peak_memory": stat.peak_memory,
+            "cache_hit": stat.cache_hit,
+        }
+        self._write(span)
+
+    def workflow_finished(self, workflow):
+        trace_id, span_id, start = self._trace(workflow)
+        self._traces.pop(workflow, None)
+        span = {
+            "trace_id": trace_id,
+            "span_id": span_id,
+            "parent_id": None,
+            "name": type(workflow).__name__,
+            "kind": "workflow",
+            "start": start,
+            "duration": time.time() - start,
+            "status": workflow.status.name,
+            "status_text": str(workflow.error) if workflow.error is not None else None,
+        }
+        self._write(span)
+
+    def _write(self, span):
+        line = json.dumps(span, default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a")
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
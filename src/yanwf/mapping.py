@@ -0,0 +1,275 @@
+"""Map a task class over the items of a context collection.
+
+A task definition with a `map` runs its class once per item of the collection, the item is set to the
+`item` parameter and the other parameters are shared:
+
+    "fetch_all": {
+        "cls": "FetchTask",
+        "parameters": {"timeout": 10},
+        "map": {"over": "$context.urls", "item": "url", "chunk_size": 10, "concurrency": 4},
+    }
+
+The outputs of the items are set in order to `context["fetch_all"]` (or the `output` key of the map).
+The items are run by chunks on `concurrency` threads, processes (`"executor": "process"`) or
+coroutines (`"executor": "async"`). The status of every item is kept in `TaskRunStat.items`, a resumed
+workflow only runs the items that failed or did not run.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import Context, copy_context
+from typing import Any, Dict, List, Optional
+
+from yanwf import process_pool
+from yanwf.exceptions import PauseWorkflowException
+from yanwf.tasks import AsyncBaseTask, BaseTask, ContextRef, WorkflowContext, bind_value, get_parameters
+from yanwf.utils import run_coroutine
+
+THREAD_EXECUTOR = "thread"
+ASYNC_EXECUTOR = "async"
+EXECUTORS = (THREAD_EXECUTOR, process_pool.PROCESS_EXECUTOR, ASYNC_EXECUTOR)
+
+# status codes of the items, same as RunStatus.code
+_SUCCESS = 0
+_ERROR = 3
+_PAUSED = 4
+_NOT_STARTED = 1
+
+
+class MapItemStats:
+    """Status of the items of a map task: one byte per item, the error texts and outputs of the items"""
+
+    __slots__ = ("statuses", "errors", "outputs")
+
+    def __init__(self, size: int):
+        self.statuses = bytearray([_NOT_STARTED]) * size
+        self.errors: Dict[int, str] = {}
+        self.outputs: List[Any] = [None] * size
+
+    def __getstate__(self):
+        return (bytes(self.statuses), self.errors, self.outputs)
+
+    def __setstate__(self, state):
+        statuses, self.errors, self.outputs = state
+        self.statuses = bytearray(statuses)
+
+    def __len__(self):
+        return len(self.statuses)
+
+    def pending(self) -> List[int]:
+        """Indexes of the items not succeeded"""
+        return [index for index, status in enumerate(self.statuses) if status != _SUCCESS]
+
+    def count(self, status_code: int) -> int:
+        return self.statuses.count(status_code)
+
+    def set_result(self, index, status_code, output=None, error: str = None):
+        self.statuses[index] = status_code
+        self.outputs[index] = output
+        if error is None:
+            self.errors.pop(index, None)
+        else:
+            self.errors[index] = error
+
+
+class MapTask(BaseTask):
+    def __init__(
+        self,
+        name: str,
+        task_cls: type,
+        parameters: Dict[str, Any],
+        over: str,
+        item: str = "item",
+        chunk_size: int = 1,
+        concurrency: int = 1,
+        executor: str = THREAD_EXECUTOR,
+        output: str = None,
+        context_keys=(),
+    ):
+        """
+        Args:
+            name: name of the map task
+            task_cls: task class run for every item
+            parameters: parameters of the task class shared by the items
+            over: `$context.` reference of the collection
+            item: parameter of the task class set to the item
+            chunk_size: number of items run one after another by a worker
+            concurrency: number of chunks run at the same time
+            executor: thread, process or async
+            output: context key of the outputs, the name of the task by default
+            context_keys: top level context keys sent to the process workers
+        """
+        self.over = bind_value(over)
+        if self.over.__class__ is not ContextRef:
+            raise ValueError(f"{name}: map over must be a $context. reference, got {over}")
+        if item not in get_parameters(task_cls):
+            raise ValueError(f"{name}: {task_cls.__name__} has no parameter {item}")
+        if executor not in EXECUTORS:
+            raise ValueError(f"{name}: unknown map executor {executor}, expected one of {EXECUTORS}")
+
+        self.task_cls = task_cls
+        self.parameters = parameters
+        self.item = item
+        self.chunk_size = max(int(chunk_size), 1)
+        self.concurrency = max(int(concurrency), 1)
+        self.executor = executor
+        self.output_key = output or name
+        self.context_keys = tuple(context_keys)
+        self.prototype = task_cls(name=name, **parameters)
+        self.results = None
+        self.item_stats = None
+        super().__init__(name=name)
+
+    @property
+    def workflow_context(self):
+        return self._workflow_context
+
+    @workflow_context.setter
+    def workflow_context(self, value):
+        self._workflow_context = value
+        if getattr(self, "prototype", None) is not None:
+            self.prototype.workflow_context = value
+
+    def run(self):
+        self.run_items(None)
+
+    def run_items(self, item_stats: Optional[MapItemStats]) -> MapItemStats:
+        """Run the items not succeeded in `item_stats`, all items if None
+
+        Returns:
+            MapItemStats: status of all items, the failed items are raised after the others ran
+        """
+        items = list(self.workflow_context.resolve(self.over))
+        if item_stats is None or len(item_stats) != len(items):
+            item_stats = MapItemStats(len(items))
+        self.item_stats = item_stats
+
+        pending = item_stats.pending()
+        chunks = [pending[i:i + self.chunk_size] for i in range(0, len(pending), self.chunk_size)]
+        chunks = [[(index, items[index]) for index in chunk] for chunk in chunks]
+
+        if self.executor == ASYNC_EXECUTOR:
+            results = run_coroutine(self._arun_chunks(chunks))
+        else:
+            in_thread = self.executor == THREAD_EXECUTOR
+            run_chunk = self._run_chunk if in_thread else self._run_chunk_in_process
+            # the context variables of the caller in every chunk, e.g. the tracked context reads
+            contexts = [copy_context() for _ in chunks]
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                chunk_results = pool.map(Context.run, contexts, [run_chunk] * len(chunks), chunks)
+                results = [result for results in chunk_results for result in results]
+
+        errors = []
+        for index, status_code, output, error in results:
+            item_stats.set_result(index, status_code, output, None if error is None else str(error))
+            if error is not None:
+                errors.append(error)
+        self.results = item_stats.outputs
+
+        if errors:
+            # a failure wins over a pause
+            errors.sort(key=lambda e: isinstance(e, PauseWorkflowException))
+            raise errors[0]
+        return item_stats
+
+    def output(self):
+        return {self.output_key: self.results}
+
+    def resolve_parameters(self, load_blobs: bool = True) -> Dict[str, Any]:
+        """Return the task class, the items and the shared parameters, the cache key of the map"""
+        task_cls = self.task_cls
+        parameters = {
+            name: parameter.get_value(self.prototype, load_blobs)
+            for name, parameter in get_parameters(task_cls).items()
+            if name != self.item
+        }
+        return {
+            "task_cls": (task_cls.__module__, task_cls.__qualname__, task_cls.cache_version),
+            "over": list(self.workflow_context.resolve(self.over)),
+            "item": self.item,
+            "output": self.output_key,
+            "parameters": sorted(parameters.items()),
+        }
+
+    # items
+
+    def create_item_task(self, index, value) -> BaseTask:
+        return _create_item_task(self.prototype, f"{self.name}[{index}]", self.item, value)
+
+    def _run_chunk(self, chunk):
+        return [_run_item(self.create_item_task(index, value), index) for index, value in chunk]
+
+    def _run_chunk_in_process(self, chunk):
+        parameters = {
+            name: parameter.get_value(self.prototype, load_blobs=False)
+            for name, parameter in get_parameters(self.task_cls).items()
+            if name != self.item
+        }
+        context = self.workflow_context or {}
+        partial_context = {key: context[key] for key in self.context_keys if key in context}
+        digest, data = process_pool.dump_task(self.prototype)
+        future = process_pool.get_process_pool().submit(
+            _run_chunk_in_worker, digest, data, parameters, partial_context, self.name, self.item, chunk
+        )
+        return future.result()
+
+    async def _arun_chunks(self, chunks):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_chunk(chunk):
+            async with semaphore:
+                results = []
+                for index, value in chunk:
+                    task = self.create_item_task(index, value)
+                    results.append(await _arun_item(task, index))
+                return results
+
+        chunk_results = await asyncio.gather(*(run_chunk(chunk) for chunk in chunks))
+        return [result for results in chunk_results for result in results]
+
+
+def _create_item_task(prototype: BaseTask, name, item, value) -> BaseTask:
+    # same steps as BaseTask.__init__ without validating the shared parameters again
+    task_cls = type(prototype)
+    task = task_cls.__new__(task_cls)
+    task.__dict__.update(prototype.__dict__)
+    task.name = name
+    # the item is data, a "$context." string item is not a reference
+    setattr(task, get_parameters(task_cls)[item].private_name, value)
+    task.init()
+    return task
+
+
+def _run_item(task: BaseTask, index):
+    try:
+        result = task.run()
+        if hasattr(result, "__await__"):
+            run_coroutine(result)
+        return index, _SUCCESS, task.output(), None
+    except Exception as e:
+        return index, _PAUSED if isinstance(e, PauseWorkflowException) else _ERROR, None, e
+
+
+async def _arun_item(task: BaseTask, index):
+    try:
+        if isinstance(task, AsyncBaseTask):
+            await task.run()
+        else:
+            await asyncio.get_event_loop().run_in_executor(None, task.run)
+        return index, _SUCCESS, task.output(), None
+    except Exception as e:
+        return index, _PAUSED if isinstance(e, PauseWorkflowException) else _ERROR, None, e
+
+
+def _run_chunk_in_worker(digest, data, parameters, context, name, item, chunk):
+    task_cls, attributes = process_pool._load_worker_task(digest, data)
+
+    prototype = task_cls.__new__(task_cls)
+    prototype.__dict__.update(attributes)
+    prototype.workflow_context = WorkflowContext(context)
+    for parameter_name, value in parameters.items():
+        setattr(prototype, parameter_name, value)
+
+    return [
+        _run_item(_create_item_task(prototype, f"{name}[{index}]", item, value), index)
+        for index, value in chunk
+    ]
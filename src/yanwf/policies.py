@@ -0,0 +1,275 @@
+"""Timeouts, retries and hedged attempts of the task runs.
+
+Set as task class attributes or overridden in the task definition:
+
+    "FetchTask": {"run_timeout": 2.0, "max_retries": 3, "retry_backoff": 0.1, "hedge_after": "p95"}
+
+- `run_timeout`: seconds allowed for an attempt (run and output), the attempt is cancelled after it
+- `max_retries`: attempts run again after an error or a timeout, `PauseWorkflowException` is not retried
+- `retry_backoff`: seconds before the first retry, doubled before each next retry
+- `hedge_after`: seconds, or a percentile of the previous durations of the task like "p95", after which
+  a duplicate attempt starts if the first one has not finished, the first to finish wins. Only for
+  idempotent tasks, both attempts may have run.
+
+Cancellation is cooperative: a sync `run()` checks `self.cancelled` (or calls `self.check_cancelled()`)
+and returns, the attempt is abandoned otherwise. Async tasks are cancelled at their next `await`.
+Attempts with a timeout or a hedge run in their own thread.
+"""
+import asyncio
+import bisect
+import contextvars
+import copy
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+import attr
+
+from yanwf.exceptions import PauseWorkflowException, TaskTimeoutException
+from yanwf.tasks import BaseTask
+
+@attr.s(slots=True, frozen=True)
+class RunPolicy:
+    run_timeout = attr.ib(type=float, default=None)
+    max_retries = attr.ib(type=int, default=0)
+    retry_backoff = attr.ib(type=float, default=0.1)
+    # seconds or "p<percentile>"
+    hedge_after = attr.ib(default=None)
+
+    def __attrs_post_init__(self):
+        hedge_after = self.hedge_after
+        if isinstance(hedge_after, str) and not (
+            hedge_after.startswith("p") and 0 < float(hedge_after[1:]) < 100
+        ):
+            raise ValueError(f"hedge_after must be seconds or a percentile like p95: {hedge_after}")
+        if self.max_retries < 0:
+            raise ValueError("max_retries must not be negative")
+
+
+def get_run_policy(task_definition: Dict, task: BaseTask) -> Optional[RunPolicy]:
+    """Policy of a task, None when it has no timeout, retries or hedge"""
+    run_timeout = task_definition.get("run_timeout", task.run_timeout)
+    max_retries = task_definition.get("max_retries", task.max_retries)
+    hedge_after = task_definition.get("hedge_after", task.hedge_after)
+    if run_timeout is None and not max_retries and hedge_after is None:
+        return None
+    retry_backoff = task_definition.get("retry_backoff", task.retry_backoff)
+    return RunPolicy(run_timeout, max_retries, retry_backoff, hedge_after)
+
+
+class LatencyHistory:
+    """Durations of the last successful attempts per task, for the percentile hedge delays"""
+
+    def __init__(self, size=1000, min_samples=20):
+        self.size = size
+        self.min_samples = min_samples
+        self._durations: Dict[Any, deque] = {}
+        self._sorted: Dict[Any, list] = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, duration: float):
+        with self._lock:
+            durations = self._durations.get(key)
+            if durations is None:
+                durations = self._durations[key] = deque(maxlen=self.size)
+            ordered = self._sorted.setdefault(key, [])
+            if len(durations) == self.size:
+                del ordered[bisect.bisect_left(ordered, durations[0])]
+            durations.append(duration)
+            bisect.insort(ordered, duration)
+
+    def percentile(self, key, percent: float) -> Optional[float]:
+        """None until `min_samples` durations are known"""
+        with self._lock:
+            ordered = self._sorted.get(key)
+            if not ordered or len(ordered) < self.min_samples:
+                return None
+            return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+default_latency_history = LatencyHistory()
+
+
+def _hedge_delay(policy: RunPolicy, key, history: LatencyHistory) -> Optional[float]:
+    hedge_after = policy.hedge_after
+    if isinstance(hedge_after, str):
+        return history.percentile(key, float(hedge_after[1:]))
+    return hedge_after
+
+
+def run_with_policy(
+    task: BaseTask,
+    attempt: Callable[[BaseTask], Any],
+    policy: RunPolicy,
+    stat,
+    history: LatencyHistory = default_latency_history,
+):
+    """Run the attempts of a task, return the output of the first successful attempt
+
+    Args:
+        task: the task, the attempts after the first one run on copies of it
+        attempt: run a task and return its output
+        stat: TaskRunStat updated with the attempts, timeouts and hedge_won
+    """
+    stat.attempts = stat.timeouts = 0
+    stat.hedge_won = False
+    key = (type(task), task.name)
+    backoff = policy.retry_backoff
+    for retry in range(policy.max_retries + 1):
+        try:
+            attempt_task = task if retry == 0 else copy.copy(task)
+            return _run_attempts(attempt_task, attempt, policy, stat, key, history)
+        except PauseWorkflowException:
+            raise
+        except Exception:
+            if retry == policy.max_retries:
+                raise
+        time.sleep(backoff)
+        backoff *= 2
+
+
+def _run_attempts(task, attempt, policy: RunPolicy, stat, key, history: LatencyHistory):
+    hedge_delay = _hedge_delay(policy, key, history)
+    start = time.perf_counter()
+    if policy.run_timeout is None and hedge_delay is None:
+        stat.attempts += 1
+        output = attempt(task)
+        history.add(key, time.perf_counter() - start)
+        return output
+
+    results = queue.Queue()
+    running = {}
+
+    def start_attempt(attempt_task):
+        attempt_task._cancelled = False
+        stat.attempts += 1
+
+        def target():
+            try:
+                results.put((attempt_task, True, attempt(attempt_task)))
+            except BaseException as e:
+                results.put((attempt_task, False, e))
+
+        running[attempt_task] = time.perf_counter()
+        # the context variables of the caller, e.g. the tracked context reads
+        context = contextvars.copy_context()
+        threading.Thread(
+            target=context.run, args=(target,), name=f"yanwf-attempt-{task.name}", daemon=True
+        ).start()
+
+    def cancel_all():
+        for attempt_task in running:
+            attempt_task._cancelled = True
+
+    start_attempt(task)
+    deadline = start + policy.run_timeout if policy.run_timeout is not None else None
+    hedge_at = start + hedge_delay if hedge_delay is not None else None
+    error = None
+    while running:
+        now = time.perf_counter()
+        wake_times = [t for t in (deadline, hedge_at) if t is not None]
+        timeout = max(0.0, min(wake_times) - now) if wake_times else None
+        try:
+            attempt_task, succeeded, value = results.get(timeout=timeout)
+        except queue.Empty:
+            now = time.perf_counter()
+            if deadline is not None and now >= deadline:
+                cancel_all()
+                stat.timeouts += 1
+                raise TaskTimeoutException(f"{task.name} timed out after {policy.run_timeout}s")
+            if hedge_at is not None and now >= hedge_at:
+                hedge_at = None
+                start_attempt(copy.copy(task))
+            continue
+
+        attempt_start = running.pop(attempt_task)
+        if succeeded:
+            cancel_all()
+            stat.hedge_won = attempt_task is not task
+            history.add(key, time.perf_counter() - attempt_start)
+            return value
+        if isinstance(value, PauseWorkflowException):
+            cancel_all()
+            raise value
+        # wait for the other attempt still running, if any
+        error = value
+    raise error
+
+
+async def arun_with_policy(
+    task: BaseTask,
+    attempt: Callable[[BaseTask], Any],
+    policy: RunPolicy,
+    stat,
+    history: LatencyHistory = default_latency_history,
+):
+    """Async `run_with_policy`, `attempt` returns a coroutine. Timed out attempts are cancelled."""
+    stat.attempts = stat.timeouts = 0
+    stat.hedge_won = False
+    key = (type(task), task.name)
+    backoff = policy.retry_backoff
+    for retry in range(policy.max_retries + 1):
+        try:
+            attempt_task = task if retry == 0 else copy.copy(task)
+            return await _arun_attempts(attempt_task, attempt, policy, stat, key, history)
+        except PauseWorkflowException:
+            raise
+        except Exception:
+            if retry == policy.max_retries:
+                raise
+        await asyncio.sleep(backoff)
+        backoff *= 2
+
+
+async def _arun_attempts(task, attempt, policy: RunPolicy, stat, key, history: LatencyHistory):
+    hedge_delay = _hedge_delay(policy, key, history)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    running = {}
+
+    def start_attempt(attempt_task):
+        attempt_task._cancelled = False
+        stat.attempts += 1
+        running[asyncio.ensure_future(attempt(attempt_task))] = (attempt_task, loop.time())
+
+    def cancel_all():
+        for future, (attempt_task, _) in running.items():
+            attempt_task._cancelled = True
+            future.cancel()
+
+    start_attempt(task)
+    deadline = start + policy.run_timeout if policy.run_timeout is not None else None
+    hedge_at = start + hedge_delay if hedge_delay is not None else None
+    error = None
+    try:
+        while running:
+            wake_times = [t for t in (deadline, hedge_at) if t is not None]
+            timeout = max(0.0, min(wake_times) - loop.time()) if wake_times else None
+            finished, _ = await asyncio.wait(
+                running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not finished:
+                now = loop.time()
+                if deadline is not None and now >= deadline:
+                    stat.timeouts += 1
+                    raise TaskTimeoutException(f"{task.name} timed out after {policy.run_timeout}s")
+                if hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    start_attempt(copy.copy(task))
+                continue
+
+            for future in finished:
+                attempt_task, attempt_start = running.pop(future)
+                value = future.exception()
+                if value is None:
+                    stat.hedge_won = attempt_task is not task
+                    history.add(key, loop.time() - attempt_start)
+                    return future.result()
+                if isinstance(value, PauseWorkflowException):
+                    raise value
+                error = value
+        raise error
+    finally:
+        cancel_all()
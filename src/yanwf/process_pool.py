@@ -0,0 +1,114 @@
+import hashlib
+import pickle
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Iterable
+
+from yanwf.tasks import BaseTask, WorkflowContext
+from yanwf.utils import run_coroutine
+
+PROCESS_EXECUTOR = "process"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# pickled task per task instance, built once in the workflow process
+_task_payloads = weakref.WeakKeyDictionary()
+
+# unpickled tasks per payload digest, built once in each pool worker
+_WORKER_CACHE_SIZE = 256
+_worker_tasks = OrderedDict()
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Return the process pool shared by all workflows, created on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor()
+    return _pool
+
+
+def configure_process_pool(max_workers=None, **kwargs) -> ProcessPoolExecutor:
+    """Replace the shared process pool, kwargs are passed to ProcessPoolExecutor"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+        _pool = ProcessPoolExecutor(max_workers=max_workers, **kwargs)
+    return _pool
+
+
+def shutdown_process_pool(wait=True):
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=wait)
+        _pool = None
+
+
+def dump_task(task: BaseTask):
+    """Pickle a task without its workflow context
+
+    Returns:
+        tuple: (digest, pickled task), cached for the lifetime of the task instance
+    """
+    payload = _task_payloads.get(task)
+    if payload is None:
+        attributes = {name: value for name, value in vars(task).items() if name != "_workflow_context"}
+        data = pickle.dumps((type(task), attributes), protocol=pickle.HIGHEST_PROTOCOL)
+        payload = (hashlib.sha1(data).hexdigest(), data)
+        _task_payloads[task] = payload
+    return payload
+
+
+def submit_task(task: BaseTask, context_keys: Iterable[str] = (), pool=None) -> Future:
+    """Run `run()` and `output()` of a task in a worker process
+
+    Only the resolved parameter values and the top level context keys in `context_keys` are sent to
+    the worker. Changes of the task instance made in the worker are not sent back, use `output()`.
+
+    Returns:
+        Future: result is the output of the task
+    """
+    parameters = task.resolve_parameters(load_blobs=False)
+    context = task.workflow_context or {}
+    partial_context = {key: context[key] for key in context_keys if key in context}
+    digest, data = dump_task(task)
+    return (pool or get_process_pool()).submit(_run_in_worker, digest, data, parameters, partial_context)
+
+
+def run_task(task: BaseTask, context_keys: Iterable[str] = (), pool=None) -> Any:
+    return submit_task(task, context_keys, pool).result()
+
+
+def _load_worker_task(digest, data):
+    template = _worker_tasks.get(digest)
+    if template is None:
+        template = pickle.loads(data)
+        _worker_tasks[digest] = template
+        if len(_worker_tasks) > _WORKER_CACHE_SIZE:
+            _worker_tasks.popitem(last=False)
+    else:
+        _worker_tasks.move_to_end(digest)
+    return template
+
+
+def _run_in_worker(digest, data, parameters, context):
+    task_cls, attributes = _load_worker_task(digest, data)
+
+    # same steps as BaseTask.__init__ without pickling the task again
+    task = task_cls.__new__(task_cls)
+    task.__dict__.update(attributes)
+    task.workflow_context = WorkflowContext(context)
+    for name, value in parameters.items():
+        setattr(task, name, value)
+    task.init()
+
+    result = task.run()
+    if hasattr(result, "__await__"):
+        run_coroutine(result)
+    return task.output()
@@ -0,0 +1,183 @@
+"""Profiles of the slow tasks and of a sample of the tasks.
+
+    profiler = TaskProfiler("profiles", threshold=2.0, sample_rate=0.01)
+    Workflow(definitions=definitions, profiler=profiler).run()
+
+A task running longer than `threshold` seconds, or one of the `sample_rate` fraction of the tasks, gets
+its profile written to `directory` and the path in `TaskRunStat.profile_path`:
+
+- `collector="sampling"`: a background thread samples the stack of the thread running the task every
+  `interval` seconds, the profile is a collapsed stack file (`frame;frame;frame count` lines) for
+  flamegraph.pl, speedscope or inferno. The sampling thread only runs while tasks are profiled.
+- `collector="cprofile"`: the task thread is profiled with `cProfile`, slower, the profile is a pstats
+  file for snakeviz or flameprof.
+
+With a threshold every task is collected and the profile is dropped when the task was fast. The thread
+running the task is profiled: async tasks share the samples of the event loop thread, the attempts with a
+timeout or a hedge (see yanwf.policies) run in threads that are not profiled.
+"""
+import cProfile
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+SAMPLING = "sampling"
+CPROFILE = "cprofile"
+COLLECTORS = (SAMPLING, CPROFILE)
+
+_UNSAFE_CHARACTERS = re.compile(r"[^\w.\-\[\]]")
+
+
+class StackSampler:
+    """Count the stacks of the registered threads, sampled from a background thread"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        # counters of the profiles collected per thread id
+        self._threads: Dict[int, List[Counter]] = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._thread = None
+
+    def add(self, thread_id: int) -> Counter:
+        """Start counting the stacks of a thread, in a new counter"""
+        counts = Counter()
+        with self._changed:
+            self._threads.setdefault(thread_id, []).append(counts)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="yanwf-sampler", daemon=True)
+                self._thread.start()
+            self._changed.notify()
+        return counts
+
+    def remove(self, thread_id: int, counts: Counter):
+        with self._lock:
+            counters = self._threads.get(thread_id)
+            if counters is not None:
+                # by identity, counters with the same counts are equal
+                counters[:] = [counter for counter in counters if counter is not counts]
+                if not counters:
+                    del self._threads[thread_id]
+
+    def _loop(self):
+        while True:
+            with self._changed:
+                while not self._threads:
+                    self._changed.wait()
+                # under the lock, a removed counter is not changed anymore
+                frames = sys._current_frames()
+                for thread_id, counters in self._threads.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stack = collapse_stack(frame)
+                        for counts in counters:
+                            counts[stack] += 1
+                del frames
+            time.sleep(self.interval)
+
+
+def collapse_stack(frame) -> str:
+    """Frames of a stack from the outermost one, separated by ;"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class TaskProfiler:
+    def __init__(
+        self,
+        directory: str,
+        threshold: Optional[float] = None,
+        sample_rate: float = 0.0,
+        collector: str = SAMPLING,
+        interval: float = 0.005,
+    ):
+        """
+        Args:
+            directory: where the profiles are written, created if needed
+            threshold: seconds, the tasks running longer get their profile written
+            sample_rate: fraction of the tasks profiled whatever their duration
+            collector: `sampling` or `cprofile`
+            interval: seconds between two samples of the sampling collector
+        """
+        if collector not in COLLECTORS:
+            raise ValueError(f"unknown profile collector {collector}, expected one of {COLLECTORS}")
+        if threshold is None and not sample_rate:
+            raise ValueError("a threshold or a sample_rate is required")
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("sample_rate must be between 0 and 1")
+        self.directory = directory
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.collector = collector
+        self._sampler = StackSampler(interval) if collector == SAMPLING else None
+        # (workflow id, task name) -> (thread id, sampled, counter or cProfile.Profile)
+        self._running: Dict[tuple, tuple] = {}
+        # threads with an enabled cProfile, one per thread
+        self._profiled_threads = set()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self, workflow, task_name):
+        """Start collecting the profile of a task, in the thread running it"""
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled and self.threshold is None:
+            return
+        thread_id = threading.get_ident()
+        if self._sampler is not None:
+            collected = self._sampler.add(thread_id)
+        else:
+            with self._lock:
+                if thread_id in self._profiled_threads:
+                    return
+                self._profiled_threads.add(thread_id)
+            collected = cProfile.Profile()
+            collected.enable()
+        with self._lock:
+            self._running[(id(workflow), task_name)] = (thread_id, sampled, collected)
+
+    def stop(self, workflow, task_name, duration: float) -> Optional[str]:
+        """Stop collecting the profile of a task, in the thread running it
+
+        Returns:
+            str: path of the profile written, None if the task was not profiled or was fast
+        """
+        with self._lock:
+            running = self._running.pop((id(workflow), task_name), None)
+        if running is None:
+            return None
+        thread_id, sampled, collected = running
+        if self._sampler is not None:
+            self._sampler.remove(thread_id, collected)
+        else:
+            collected.disable()
+            with self._lock:
+                self._profiled_threads.discard(thread_id)
+
+        if not sampled and (duration is None or duration < self.threshold):
+            return None
+        return self._write(task_name, collected)
+
+    def _write(self, task_name, collected) -> Optional[str]:
+        name = f"{_UNSAFE_CHARACTERS.sub('_', task_name)}.{datetime.utcnow():%Y%m%dT%H%M%S%f}"
+        if self._sampler is None:
+            path = os.path.join(self.directory, name + ".prof")
+            collected.dump_stats(path)
+            return path
+        if not collected:
+            # faster than the sampling interval
+            return None
+        path = os.path.join(self.directory, name + ".collapsed")
+        with open(path, "w") as f:
+            for stack, count in collected.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
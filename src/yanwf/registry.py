@@ -0,0 +1,133 @@
+"""Index of task class names to the modules defining them.
+
+The index is filled by the `register` decorator, the `yanwf.tasks` entry points of installed packages
+or a manifest file built ahead of time, so a worker resolves a task class with a dict lookup and imports
+only the modules of the tasks it runs:
+
+    python -m yanwf.registry my.tasks other.tasks -o tasks_manifest.json
+"""
+import argparse
+import inspect
+import json
+import threading
+from importlib import import_module
+from typing import Dict, Iterable, List, Optional, Tuple
+
+ENTRY_POINT_GROUP = "yanwf.tasks"
+MANIFEST_VERSION = 1
+
+
+class TaskRegistry:
+    def __init__(self):
+        # name -> [(module name, class name)], in registration order
+        self._locations: Dict[str, List[Tuple[str, str]]] = {}
+        self._classes: Dict[Tuple[str, str], type] = {}
+        self._lock = threading.Lock()
+
+    def register(self, task_cls=None, name: str = None):
+        """Register a task class, usable as `@register` or `@register(name="alias")`"""
+        if task_cls is None:
+            return lambda cls: self.register(cls, name=name)
+
+        location = (task_cls.__module__, task_cls.__qualname__)
+        self.add(name or task_cls.__name__, *location)
+        self._classes[location] = task_cls
+        return task_cls
+
+    def add(self, name: str, module_name: str, class_name: str = None):
+        """Register where a task class is defined without importing it"""
+        location = (module_name, class_name or name)
+        with self._lock:
+            locations = self._locations.setdefault(name, [])
+            if location not in locations:
+                locations.append(location)
+
+    def load_entry_points(self, group: str = ENTRY_POINT_GROUP):
+        """Register the task classes of the `name = module:Class` entry points of installed packages"""
+        from importlib import metadata
+
+        entry_points = metadata.entry_points()
+        if hasattr(entry_points, "select"):
+            entry_points = entry_points.select(group=group)
+        else:
+            entry_points = entry_points.get(group, [])
+
+        for entry_point in entry_points:
+            module_name, _, class_name = entry_point.value.partition(":")
+            self.add(entry_point.name, module_name.strip(), class_name.strip() or entry_point.name)
+
+    def load_manifest(self, path: str):
+        with open(path) as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported task manifest version: {manifest.get('version')}")
+
+        for name, locations in manifest["tasks"].items():
+            for module_name, class_name in locations:
+                self.add(name, module_name, class_name)
+
+    def resolve(self, name: str, module_names: Iterable[str] = ()) -> Optional[type]:
+        """Return the registered class of a name, None if the name is not registered
+
+        With `module_names`, only a class defined in one of them is returned, the first one in their
+        order, None if the name is registered in other modules only.
+        """
+        locations = self._locations.get(name)
+        if not locations:
+            return None
+
+        location = locations[0]
+        if module_names:
+            modules = {module_name: index for index, module_name in enumerate(module_names)}
+            preferred = [loc for loc in locations if loc[0] in modules]
+            if not preferred:
+                return None
+            location = min(preferred, key=lambda loc: modules[loc[0]])
+
+        task_cls = self._classes.get(location)
+        if task_cls is None:
+            module_name, class_name = location
+            task_cls = import_module(module_name)
+            for part in class_name.split("."):
+                task_cls = getattr(task_cls, part)
+            self._classes[location] = task_cls
+        return task_cls
+
+    def __contains__(self, name):
+        return name in self._locations
+
+    def clear(self):
+        with self._lock:
+            self._locations.clear()
+            self._classes.clear()
+
+
+def build_manifest(module_names: Iterable[str], path: str = None) -> Dict:
+    """Index the task classes defined in modules, written to `path` as json if set"""
+    from yanwf.tasks import BaseTask
+
+    tasks: Dict[str, List[Tuple[str, str]]] = {}
+    for module_name in module_names:
+        module = import_module(module_name)
+        for name, value in vars(module).items():
+            is_task = inspect.isclass(value) and issubclass(value, BaseTask)
+            if is_task and value.__module__ == module_name and not inspect.isabstract(value):
+                tasks.setdefault(name, []).append((module_name, value.__qualname__))
+
+    manifest = {"version": MANIFEST_VERSION, "tasks": tasks}
+    if path:
+        with open(path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+default_registry = TaskRegistry()
+register = default_registry.register
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a task manifest of modules")
+    parser.add_argument("modules", nargs="+")
+    parser.add_argument("-o", "--output", default="tasks_manifest.json")
+    args = parser.parse_args()
+    build_manifest(args.modules, args.output)
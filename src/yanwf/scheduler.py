@@ -0,0 +1,219 @@
+"""Resume paused workflows when their wake-up time comes or their event is signaled.
+
+A task pauses with a condition, the scheduler saves the paused state in a `StateStore` and keeps only
+the workflow id in a timer heap and an index of the events:
+
+    class HibernateTask(BaseTask):
+        def run(self):
+            if not self.workflow_context.get("approved"):
+                raise PauseWorkflowException("waiting", wake_at=3600, wait_for="approved")
+
+    scheduler = WakeupScheduler(store, lambda workflow_id, state: template.create(state=state))
+    workflow.run()
+    scheduler.schedule(workflow_id, workflow)
+    scheduler.start()                      # resume the due workflows in a background thread
+    scheduler.signal("approved", True)     # sets context["approved"] and resumes the waiting workflows
+
+Scheduling and waking a workflow cost O(log n) of the scheduled workflows, nothing scans them.
+"""
+import heapq
+import logging
+import threading
+import time
+from datetime import timezone
+from typing import Callable, Dict, List, Set, Tuple
+
+from yanwf.stores import StateStore
+from yanwf.workflows import RunStatus, Workflow, WorkflowState
+
+logger = logging.getLogger(__name__)
+
+
+class WakeupScheduler:
+    def __init__(
+        self,
+        store: StateStore,
+        factory: Callable[[str, WorkflowState], Workflow],
+        executor=None,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Args:
+            store: saved states of the scheduled workflows
+            factory: create the workflow of a saved state to resume it
+            executor: `concurrent.futures.Executor` resuming the workflows, default in the caller
+            clock: current time in seconds since the epoch
+        """
+        self.store = store
+        self.factory = factory
+        self.executor = executor
+        self.clock = clock
+
+        # (wake-up timestamp, workflow id), entries not matching _wake_times are stale and skipped
+        self._heap: List[Tuple[float, str]] = []
+        self._wake_times: Dict[str, float] = {}
+        self._waiting: Dict[str, Set[str]] = {}
+        self._events: Dict[str, Tuple[str, ...]] = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._thread = None
+        self._stopped = False
+
+    def __len__(self):
+        with self._lock:
+            return len(self._wake_times.keys() | self._events.keys())
+
+    def __contains__(self, workflow_id):
+        return workflow_id in self._wake_times or workflow_id in self._events
+
+    def schedule(self, workflow_id: str, workflow: Workflow) -> bool:
+        """Save the state of the workflow, schedule its wake-up if it is paused with a condition
+
+        The workflow object is not kept, the scheduler creates a new one from the saved state.
+
+        Returns:
+            bool: True if the workflow is scheduled
+        """
+        self.store.save(workflow_id, workflow.state)
+        return self._add(workflow_id, workflow)
+
+    def recover(self) -> int:
+        """Schedule the paused workflows of the store, after a restart
+
+        Returns:
+            int: number of workflows scheduled
+        """
+        count = 0
+        for workflow_id in self.store.find(status=RunStatus.PAUSED):
+            state = self.store.load(workflow_id)
+            if state is not None and self._add(workflow_id, self.factory(workflow_id, state)):
+                count += 1
+        return count
+
+    def _add(self, workflow_id, workflow: Workflow) -> bool:
+        wake_at, events = workflow.get_wakeup() if workflow.status == RunStatus.PAUSED else (None, [])
+        with self._changed:
+            self._remove(workflow_id)
+            if wake_at is not None:
+                timestamp = wake_at.replace(tzinfo=timezone.utc).timestamp()
+                self._wake_times[workflow_id] = timestamp
+                heapq.heappush(self._heap, (timestamp, workflow_id))
+                if self._heap[0][1] == workflow_id:
+                    # earlier than the time the thread waits for
+                    self._changed.notify()
+            if events:
+                self._events[workflow_id] = tuple(events)
+                for event in events:
+                    self._waiting.setdefault(event, set()).add(workflow_id)
+        return wake_at is not None or bool(events)
+
+    def _remove(self, workflow_id):
+        # called under the lock, the heap entry becomes stale
+        self._wake_times.pop(workflow_id, None)
+        for event in self._events.pop(workflow_id, ()):
+            waiting = self._waiting[event]
+            waiting.discard(workflow_id)
+            if not waiting:
+                del self._waiting[event]
+
+    def cancel(self, workflow_id: str):
+        """Unschedule a workflow, its saved state is kept"""
+        with self._lock:
+            self._remove(workflow_id)
+
+    def next_wake_time(self) -> float:
+        """Timestamp of the next wake-up, None if no workflow waits for a time"""
+        with self._lock:
+            self._drop_stale()
+            return self._heap[0][0] if self._heap else None
+
+    def _drop_stale(self):
+        heap = self._heap
+        while heap and self._wake_times.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+
+    def run_due(self, now: float = None) -> List[str]:
+        """Resume the workflows whose wake-up time has come
+
+        Returns:
+            List[str]: ids of the resumed workflows
+        """
+        now = self.clock() if now is None else now
+        due = []
+        with self._lock:
+            heap = self._heap
+            while True:
+                self._drop_stale()
+                if not heap or heap[0][0] > now:
+                    break
+                _, workflow_id = heapq.heappop(heap)
+                self._remove(workflow_id)
+                due.append(workflow_id)
+        for workflow_id in due:
+            self._wake(workflow_id)
+        return due
+
+    def signal(self, event: str, value=True) -> List[str]:
+        """Set `context[event]` of the workflows waiting for the event and resume them
+
+        Returns:
+            List[str]: ids of the resumed workflows
+        """
+        with self._lock:
+            workflow_ids = list(self._waiting.get(event, ()))
+            for workflow_id in workflow_ids:
+                self._remove(workflow_id)
+        for workflow_id in workflow_ids:
+            self._wake(workflow_id, {event: value})
+        return workflow_ids
+
+    def _wake(self, workflow_id, context=None):
+        if self.executor is not None:
+            self.executor.submit(self._resume, workflow_id, context)
+        else:
+            self._resume(workflow_id, context)
+
+    def _resume(self, workflow_id, context=None):
+        state = self.store.load(workflow_id)
+        if state is None:
+            return
+        workflow = self.factory(workflow_id, state)
+        if context:
+            workflow.context.update(context)
+        try:
+            workflow.resume()
+        except Exception:
+            # raise_on_error workflows, the error is in the saved state
+            logger.exception("Resumed workflow %s failed", workflow_id)
+        # paused again with a new condition, or done
+        self.schedule(workflow_id, workflow)
+
+    def start(self):
+        """Resume the due workflows in a background thread"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._loop, name="yanwf-wakeup", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._changed:
+            self._stopped = True
+            self._changed.notify_all()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+    def _loop(self):
+        while True:
+            with self._changed:
+                while not self._stopped:
+                    self._drop_stale()
+                    timeout = self._heap[0][0] - self.clock() if self._heap else None
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self._changed.wait(timeout)
+                if self._stopped:
+                    return
+            self.run_due()
@@ -0,0 +1,454 @@
+"""Compact versioned binary encoding of workflow states and definitions.
+
+    data = dump_state(workflow.state)
+    state = load_state(data)          # the stats are decoded when a task is accessed
+
+Layout of a state, all integers little-endian:
+
+    b"YWF" kind version
+    fields: names of the TaskRunStat fields of the task records, decoded by name
+    names: task names, the first interned strings
+    strings: the other interned strings (dict keys and short strings), referenced by index
+    status code, error, trace, frontier
+    tasks: one status code byte per task, start and end times as int64 microseconds, uint32 record
+           offsets, then one record per task with its fields that are not the default
+    context
+
+The task records are independent of each other, a task is decoded alone and a changed task changes its
+record only. Values are tagged: None, bool, int, float, str, bytes, list, tuple, dict, naive datetime,
+RunStatus, other values are pickled. Data of another schema version raises ValueError.
+"""
+import pickle
+import struct
+import sys
+import threading
+from array import array
+from datetime import datetime, timedelta
+from itertools import compress
+from operator import attrgetter, ne
+from typing import Any, Dict, List
+
+import attr
+
+from yanwf.tasks import WorkflowContext
+from yanwf.workflows import RunStatus, TaskRunStat, TaskRunStats, WorkflowState
+
+MAGIC = b"YWF"
+SCHEMA_VERSION = 1
+STATE = b"S"
+DEFINITIONS = b"D"
+
+_NONE, _FALSE, _TRUE, _INT, _FLOAT, _STR, _BYTES, _LIST, _TUPLE, _DICT = range(10)
+_DATETIME, _STATUS, _INTERNED, _PICKLE = range(10, 14)
+
+_DOUBLE = struct.Struct("<d")
+# strings up to this length are interned, a repeated string is encoded as its index
+_MAX_INTERNED = 64
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_NO_TIME = -(1 << 63)
+_BIG_ENDIAN = sys.byteorder == "big"
+# fields of the stats encoded in the columns, not in the task records
+_COLUMN_FIELDS = ("start_time", "end_time", "_status")
+_RECORD_FIELDS = tuple(
+    field.name for field in attr.fields(TaskRunStat) if field.init and field.name not in _COLUMN_FIELDS
+)
+_RECORD_DEFAULTS = {
+    field.name: field.default.factory() if isinstance(field.default, attr.Factory) else field.default
+    for field in attr.fields(TaskRunStat)
+    if field.name in _RECORD_FIELDS
+}
+
+
+def _column_bytes(typecode: str, values: List[int]) -> bytes:
+    column = array(typecode, values)
+    if _BIG_ENDIAN:
+        column.byteswap()
+    return column.tobytes()
+
+
+def _column(typecode: str, data) -> array:
+    column = array(typecode)
+    column.frombytes(data)
+    if _BIG_ENDIAN:
+        column.byteswap()
+    return column
+
+
+def _to_microseconds(value: datetime) -> int:
+    return _NO_TIME if value is None else (value - _EPOCH) // _MICROSECOND
+
+
+def _from_microseconds(value: int):
+    return None if value == _NO_TIME else _EPOCH + _MICROSECOND * value
+
+
+class _Encoder:
+    def __init__(self, strings: Dict[str, int] = None):
+        # interned strings by index, the task names first
+        self.strings: Dict[str, int] = strings if strings is not None else {}
+        # encoded references of the interned strings used
+        self.refs: Dict[str, bytes] = {}
+
+    def ref(self, value: str) -> bytes:
+        strings = self.strings
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        ref = bytearray([_INTERNED])
+        _write_size(ref, index)
+        ref = self.refs[value] = bytes(ref)
+        return ref
+
+    def value(self, out: bytearray, value):
+        # exact types, subclasses (bool of int, enums, mappings) are handled below
+        kind = type(value)
+        if kind is str:
+            if len(value) <= _MAX_INTERNED:
+                out += self.refs.get(value) or self.ref(value)
+            else:
+                data = value.encode("utf-8")
+                out.append(_STR)
+                _write_size(out, len(data))
+                out += data
+        elif value is None:
+            out.append(_NONE)
+        elif kind is float:
+            out.append(_FLOAT)
+            out += _DOUBLE.pack(value)
+        elif kind is dict or kind is WorkflowContext:
+            out.append(_DICT)
+            if len(value) < 0x80:
+                out.append(len(value))
+            else:
+                _write_size(out, len(value))
+            # the common str keys and float values inlined
+            encode = self.value
+            refs = self.refs
+            for key, item in value.items():
+                if type(key) is str and len(key) <= _MAX_INTERNED:
+                    out += refs.get(key) or self.ref(key)
+                else:
+                    encode(out, key)
+                if type(item) is float:
+                    out.append(_FLOAT)
+                    out += _DOUBLE.pack(item)
+                else:
+                    encode(out, item)
+        elif kind is int:
+            out.append(_INT)
+            _write_size(out, (value << 1) if value >= 0 else ((-value) << 1) - 1)
+        elif kind is bool:
+            out.append(_TRUE if value else _FALSE)
+        elif kind is list or kind is tuple:
+            out.append(_LIST if kind is list else _TUPLE)
+            _write_size(out, len(value))
+            for item in value:
+                self.value(out, item)
+        elif kind is bytes:
+            out.append(_BYTES)
+            _write_size(out, len(value))
+            out += value
+        elif kind is datetime and value.tzinfo is None:
+            out.append(_DATETIME)
+            out += _column_bytes("q", [_to_microseconds(value)])
+        elif kind is RunStatus:
+            out.append(_STATUS)
+            out.append(value.code)
+        else:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            out.append(_PICKLE)
+            _write_size(out, len(data))
+            out += data
+
+
+def _write_size(out: bytearray, size: int):
+    while size >= 0x80:
+        out.append((size & 0x7F) | 0x80)
+        size >>= 7
+    out.append(size)
+
+
+class _Decoder:
+    def __init__(self, data, position=0, strings=()):
+        self.data = data
+        self.position = position
+        self.strings = strings
+
+    def size(self) -> int:
+        data = self.data
+        position = self.position
+        byte = data[position]
+        position += 1
+        result = byte & 0x7F
+        shift = 7
+        while byte & 0x80:
+            byte = data[position]
+            position += 1
+            result |= (byte & 0x7F) << shift
+            shift += 7
+        self.position = position
+        return result
+
+    def raw(self, size) -> bytes:
+        start = self.position
+        self.position = start + size
+        return bytes(self.data[start:self.position])
+
+    def text(self) -> str:
+        return str(self.raw(self.size()), "utf-8")
+
+    def value(self) -> Any:
+        tag = self.data[self.position]
+        self.position += 1
+        if tag == _STR:
+            return self.text()
+        if tag == _INTERNED:
+            return self.strings[self.size()]
+        if tag == _INT:
+            value = self.size()
+            return -((value + 1) >> 1) if value & 1 else value >> 1
+        if tag == _DICT:
+            value = self.value
+            return {value(): value() for _ in range(self.size())}
+        if tag == _NONE:
+            return None
+        if tag == _TRUE or tag == _FALSE:
+            return tag == _TRUE
+        if tag == _FLOAT:
+            return _DOUBLE.unpack(self.raw(8))[0]
+        if tag == _LIST or tag == _TUPLE:
+            items = [self.value() for _ in range(self.size())]
+            return items if tag == _LIST else tuple(items)
+        if tag == _BYTES:
+            return self.raw(self.size())
+        if tag == _DATETIME:
+            return _from_microseconds(_column("q", self.raw(8))[0])
+        if tag == _STATUS:
+            self.position += 1
+            return RunStatus.from_code(self.data[self.position - 1])
+        if tag == _PICKLE:
+            return pickle.loads(self.raw(self.size()))
+        raise ValueError(f"Unknown value tag {tag} at {self.position - 1}")
+
+
+def _write_strings(out: bytearray, strings: List[str]):
+    _write_size(out, len(strings))
+    if not any("\0" in string for string in strings):
+        # joined, split at once when decoded
+        data = "\0".join(strings).encode("utf-8")
+        out.append(0)
+        _write_size(out, len(data))
+        out += data
+        return
+    out.append(1)
+    for string in strings:
+        data = string.encode("utf-8")
+        _write_size(out, len(data))
+        out += data
+
+
+def _read_strings(decoder: "_Decoder") -> List[str]:
+    count = decoder.size()
+    decoder.position += 1
+    if decoder.data[decoder.position - 1] == 0:
+        text = decoder.text()
+        return text.split("\0") if count else []
+    return [decoder.text() for _ in range(count)]
+
+
+def _header(kind: bytes) -> bytearray:
+    return bytearray(MAGIC + kind + bytes([SCHEMA_VERSION]))
+
+
+def _check_header(data, kind: bytes) -> int:
+    if bytes(data[:4]) != MAGIC + kind:
+        raise ValueError("Not an encoded workflow " + ("state" if kind == STATE else "definitions"))
+    if data[4] != SCHEMA_VERSION:
+        raise ValueError(f"Unsupported schema version {data[4]}, expected {SCHEMA_VERSION}")
+    return 5
+
+
+def is_encoded_state(data) -> bool:
+    return bytes(data[:4]) == MAGIC + STATE
+
+
+def dump_state(state: WorkflowState) -> bytes:
+    stats = state.task_run_stats
+    names = list(stats)
+    values = [stats[task_name] for task_name in names]
+    encoder = _Encoder(dict(zip(names, range(len(names)))))
+    encode = encoder.value
+
+    records = bytearray()
+    offsets = [0]
+    get_fields = attrgetter(*_RECORD_FIELDS)
+    defaults = [_RECORD_DEFAULTS[name] for name in _RECORD_FIELDS]
+    indexes = range(len(_RECORD_FIELDS))
+    for stat in values:
+        fields = get_fields(stat)
+        changed = list(compress(indexes, map(ne, fields, defaults)))
+        if changed:
+            records.append(len(changed))
+            for index in changed:
+                records.append(index)
+                encode(records, fields[index])
+        offsets.append(len(records))
+
+    body = bytearray()
+    body.append(state.status.code)
+    encode(body, state.error)
+    encode(body, state.trace)
+    encode(body, state.frontier)
+    body += bytes(stat.status.code for stat in values)
+    body += _column_bytes("q", [_to_microseconds(stat.start_time) for stat in values])
+    body += _column_bytes("q", [_to_microseconds(stat.end_time) for stat in values])
+    body += _column_bytes("I", offsets)
+    _write_size(body, len(records))
+    body += records
+    encode(body, dict(state.context.store))
+
+    out = _header(STATE)
+    _write_strings(out, list(_RECORD_FIELDS))
+    _write_strings(out, names)
+    _write_strings(out, list(encoder.strings)[len(names):])
+    out += body
+    return bytes(out)
+
+
+def load_state(data: bytes, lazy: bool = True) -> WorkflowState:
+    """Decode a state
+
+    Args:
+        lazy: decode the stat of a task when it is accessed, the names and statuses are decoded now
+    """
+    decoder = _Decoder(data, _check_header(data, STATE))
+    fields = _read_strings(decoder)
+    names = _read_strings(decoder)
+    decoder.strings = names + _read_strings(decoder)
+
+    status = RunStatus.from_code(data[decoder.position])
+    decoder.position += 1
+    error = decoder.value()
+    trace = decoder.value()
+    frontier = decoder.value()
+
+    count = len(names)
+    statuses = decoder.raw(count)
+    start_times = _column("q", decoder.raw(8 * count))
+    end_times = _column("q", decoder.raw(8 * count))
+    offsets = _column("I", decoder.raw(4 * (count + 1)))
+    records_size = decoder.size()
+    records = _Decoder(data, decoder.position, decoder.strings)
+    decoder.position += records_size
+    context = WorkflowContext(decoder.value())
+
+    stats = _LazyTaskRunStats(names, statuses, start_times, end_times, offsets, records, fields)
+    if not lazy:
+        stats = TaskRunStats({task_name: stats[task_name] for task_name in names})
+    return WorkflowState(
+        status=status,
+        trace=trace,
+        error=error,
+        context=context,
+        task_run_stats=stats,
+        frontier=frontier,
+    )
+
+
+class _LazyTaskRunStats(TaskRunStats):
+    """TaskRunStats decoding the stat of a task on its first access, indexed by status from the start"""
+
+    def __init__(self, names, statuses, start_times, end_times, offsets, records, fields):
+        super().__init__()
+        self._stats = dict.fromkeys(names)
+        self._rows = dict(zip(names, range(len(names))))
+        self._statuses = statuses
+        self._start_times = start_times
+        self._end_times = end_times
+        self._offsets = offsets
+        self._records = records
+        self._records_start = records.position
+        self._fields = fields
+        # the stats of a resumed workflow are decoded by the threads running its tasks
+        self._decode_lock = threading.Lock()
+        by_status = {code: self._by_status[RunStatus.from_code(code)] for code in set(statuses)}
+        for task_name, code in zip(names, statuses):
+            by_status[code][task_name] = None
+
+    def _decode(self, task_name) -> TaskRunStat:
+        with self._decode_lock:
+            stat = self._stats[task_name]
+            if stat is None:
+                stat = self._stats[task_name] = self._decode_row(task_name)
+        return stat
+
+    def _decode_row(self, task_name) -> TaskRunStat:
+        row = self._rows[task_name]
+        stat = TaskRunStat(
+            _from_microseconds(self._start_times[row]),
+            _from_microseconds(self._end_times[row]),
+            RunStatus.from_code(self._statuses[row]),
+        )
+        start = self._offsets[row]
+        if start != self._offsets[row + 1]:
+            data = self._records.data
+            position = self._records_start + start
+            # a decoder per call, the shared one only holds the data and the strings
+            records = _Decoder(data, position + 1, self._records.strings)
+            field_count = data[position]
+            for _ in range(field_count):
+                name = self._fields[data[records.position]]
+                records.position += 1
+                value = records.value()
+                # fields removed from TaskRunStat since the state was saved are dropped
+                if name in _RECORD_DEFAULTS:
+                    setattr(stat, name, value)
+        stat._owner = self
+        stat._name = task_name
+        return stat
+
+    def __getitem__(self, task_name) -> TaskRunStat:
+        stat = self._stats[task_name]
+        return stat if stat is not None else self._decode(task_name)
+
+    def get(self, task_name, default=None):
+        stat = self._stats.get(task_name, default)
+        return stat if stat is not None or task_name not in self._stats else self._decode(task_name)
+
+    def __setitem__(self, task_name, stat: TaskRunStat):
+        if task_name in self._stats:
+            # the index has the status of the stat replaced
+            self[task_name]
+        super().__setitem__(task_name, stat)
+
+    def __delitem__(self, task_name):
+        self[task_name]
+        super().__delitem__(task_name)
+
+    def decoded_count(self) -> int:
+        return sum(stat is not None for stat in self._stats.values())
+
+    def __repr__(self):
+        return f"TaskRunStats({dict(self.items())!r})"
+
+    def __reduce__(self):
+        # pickled as a TaskRunStats, with all the stats decoded
+        for task_name in self._stats:
+            self[task_name]
+        return TaskRunStats, (), TaskRunStats.__getstate__(self)
+
+
+def dump_definitions(definitions: Dict) -> bytes:
+    encoder = _Encoder()
+    body = bytearray()
+    encoder.value(body, definitions)
+    out = _header(DEFINITIONS)
+    _write_strings(out, list(encoder.strings))
+    return bytes(out + body)
+
+
+def load_definitions(data: bytes) -> Dict:
+    decoder = _Decoder(data, _check_header(data, DEFINITIONS))
+    decoder.strings = _read_strings(decoder)
+    return decoder.value()
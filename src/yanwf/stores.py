@@ -0,0 +1,300 @@
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+from yanwf import serialization
+from yanwf.workflows import RunStatus, WorkflowState
+
+
+def dump_state(state: WorkflowState) -> bytes:
+    # pickle is about 2x faster to write than yanwf.serialization, states are saved much more often
+    # than they are loaded
+    return pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_state(data: bytes) -> WorkflowState:
+    if serialization.is_encoded_state(data):
+        # saved with yanwf.serialization by an earlier version
+        return serialization.load_state(data)
+    return pickle.loads(data)
+
+
+def _task_status_rows(workflow_id, state: WorkflowState) -> List[Tuple[str, str, int]]:
+    stats = state.task_run_stats
+    return [(workflow_id, task_name, stat.status.code) for task_name, stat in stats.items()]
+
+
+class StateStore(ABC):
+    """Storage of workflow states by workflow id"""
+
+    @abstractmethod
+    def save(self, workflow_id: str, state: WorkflowState):
+        """Save a copy of the state, later changes of the state are not saved"""
+
+    @abstractmethod
+    def load(self, workflow_id: str) -> Optional[WorkflowState]:
+        """Return the saved state, None if the workflow is not found"""
+
+    @abstractmethod
+    def delete(self, workflow_id: str):
+        pass
+
+    @abstractmethod
+    def find(
+        self, status: RunStatus = None, task_status: RunStatus = None, task_name: str = None
+    ) -> List[str]:
+        """Return the ids of the workflows with a status and/or a task with a status"""
+
+    def flush(self):
+        """Wait until the saved states are written"""
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class MemoryStateStore(StateStore):
+    def __init__(self):
+        self._states: Dict[str, bytes] = {}
+        self._statuses: Dict[str, int] = {}
+        self._task_statuses: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def save(self, workflow_id, state):
+        data = dump_state(state)
+        task_statuses = {task_name: stat.status.code for task_name, stat in state.task_run_stats.items()}
+        with self._lock:
+            self._states[workflow_id] = data
+            self._statuses[workflow_id] = state.status.code
+            self._task_statuses[workflow_id] = task_statuses
+
+    def load(self, workflow_id):
+        data = self._states.get(workflow_id)
+        return load_state(data) if data is not None else None
+
+    def delete(self, workflow_id):
+        with self._lock:
+            self._states.pop(workflow_id, None)
+            self._statuses.pop(workflow_id, None)
+            self._task_statuses.pop(workflow_id, None)
+
+    def find(self, status=None, task_status=None, task_name=None):
+        with self._lock:
+            workflow_ids = list(self._states)
+            if status is not None:
+                workflow_ids = [id_ for id_ in workflow_ids if self._statuses[id_] == status.code]
+            if task_status is not None:
+                workflow_ids = [
+                    id_
+                    for id_ in workflow_ids
+                    if any(
+                        code == task_status.code and (task_name is None or name == task_name)
+                        for name, code in self._task_statuses[id_].items()
+                    )
+                ]
+            return workflow_ids
+
+
+class SQLiteStateStore(StateStore):
+    """States in a SQLite database, indexed by workflow status and task status.
+
+    `save` only queues the state, a writer thread writes the queued states of many workflows in one
+    transaction: states saved while a batch is written go to the next one. The latest queued state of a
+    workflow is returned by `load` before it is written. The error of a failed batch is raised by the
+    next `save`, `delete` or `flush`, the states of the batch are not written.
+    """
+
+    def __init__(self, path: str = None, batch_size: int = 1000):
+        """
+        Args:
+            path: database file, None for a temporary file deleted on close
+            batch_size: max number of states written in one transaction
+        """
+        self._temp_dir = None
+        if path is None:
+            self._temp_dir = tempfile.TemporaryDirectory(prefix="yanwf-")
+            path = os.path.join(self._temp_dir.name, "states.db")
+        self.path = path
+        self.batch_size = batch_size
+
+        self._local = threading.local()
+        self._create_tables(self._reader)
+
+        # workflow id -> (status code, data, task status rows); None to delete
+        self._pending: Dict[str, Optional[tuple]] = {}
+        self._writing: Dict[str, Optional[tuple]] = {}
+        self._condition = threading.Condition()
+        self._closed = False
+        # error of the last failed batch, raised by the next call
+        self._error: Optional[Exception] = None
+        self._writer = threading.Thread(target=self._write_loop, name="SQLiteStateStore", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    @property
+    def _reader(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    @staticmethod
+    def _create_tables(connection):
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS workflows (id TEXT PRIMARY KEY,"
+                " status INTEGER NOT NULL, updated REAL NOT NULL, state BLOB NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS workflows_status ON workflows (status)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS task_status"
+                " (workflow_id TEXT NOT NULL, task_name TEXT NOT NULL, status INTEGER NOT NULL,"
+                " PRIMARY KEY (workflow_id, task_name)) WITHOUT ROWID"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS task_status_status ON task_status (status, task_name)"
+            )
+
+    # writing
+
+    def save(self, workflow_id, state):
+        entry = (state.status.code, dump_state(state), _task_status_rows(workflow_id, state))
+        self._queue(workflow_id, entry)
+
+    def delete(self, workflow_id):
+        self._queue(workflow_id, None)
+
+    def _queue(self, workflow_id, entry):
+        with self._condition:
+            if self._closed:
+                raise ValueError("State store is closed")
+            self._raise_error()
+            self._pending[workflow_id] = entry
+            self._condition.notify_all()
+
+    def _write_loop(self):
+        connection = self._connect()
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    break
+                if len(self._pending) > self.batch_size:
+                    workflow_ids = list(self._pending)[: self.batch_size]
+                    self._writing = {id_: self._pending.pop(id_) for id_ in workflow_ids}
+                else:
+                    self._writing, self._pending = self._pending, {}
+
+            try:
+                self._write_batch(connection, self._writing)
+                error = None
+            except Exception as e:
+                error = e
+
+            with self._condition:
+                if error is not None:
+                    self._error = error
+                self._writing = {}
+                self._condition.notify_all()
+        connection.close()
+
+    @staticmethod
+    def _write_batch(connection, batch):
+        now = time.time()
+        with connection:
+            workflow_ids = [(workflow_id,) for workflow_id in batch]
+            connection.executemany("DELETE FROM task_status WHERE workflow_id = ?", workflow_ids)
+
+            saved = [(id_, entry) for id_, entry in batch.items() if entry is not None]
+            deleted = [(id_,) for id_, entry in batch.items() if entry is None]
+            connection.executemany("DELETE FROM workflows WHERE id = ?", deleted)
+            connection.executemany(
+                "INSERT OR REPLACE INTO workflows (id, status, updated, state) VALUES (?, ?, ?, ?)",
+                [(id_, status, now, data) for id_, (status, data, _) in saved],
+            )
+            connection.executemany(
+                "INSERT INTO task_status (workflow_id, task_name, status) VALUES (?, ?, ?)",
+                [row for _, (_, _, rows) in saved for row in rows],
+            )
+
+    def flush(self):
+        with self._condition:
+            self._condition.notify_all()
+            while self._pending or self._writing:
+                self._condition.wait()
+            self._raise_error()
+
+    def _raise_error(self):
+        # must be called with the condition
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def close(self):
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._writer.join()
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+        if self._temp_dir is not None:
+            self._temp_dir.cleanup()
+
+    # reading
+
+    def load(self, workflow_id):
+        with self._condition:
+            for queued in (self._pending, self._writing):
+                if workflow_id in queued:
+                    entry = queued[workflow_id]
+                    break
+            else:
+                entry = False
+        if entry is not False:
+            return load_state(entry[1]) if entry is not None else None
+
+        row = self._reader.execute("SELECT state FROM workflows WHERE id = ?", (workflow_id,)).fetchone()
+        return load_state(row[0]) if row else None
+
+    def find(self, status=None, task_status=None, task_name=None):
+        self.flush()
+
+        if task_status is None:
+            if status is None:
+                rows = self._reader.execute("SELECT id FROM workflows")
+            else:
+                rows = self._reader.execute("SELECT id FROM workflows WHERE status = ?", (status.code,))
+            return [row[0] for row in rows]
+
+        query = "SELECT DISTINCT t.workflow_id FROM task_status t"
+        params = [task_status.code]
+        where = ["t.status = ?"]
+        if task_name is not None:
+            where.append("t.task_name = ?")
+            params.append(task_name)
+        if status is not None:
+            query += " JOIN workflows w ON w.id = t.workflow_id"
+            where.append("w.status = ?")
+            params.append(status.code)
+        query += " WHERE " + " AND ".join(where)
+        return [row[0] for row in self._reader.execute(query, params)]
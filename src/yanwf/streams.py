@@ -0,0 +1,138 @@
+"""Streams of the items produced by `StreamingTask`.
+
+The stream of a streaming task is put in the context as soon as the task starts, a producer thread
+fills a bounded buffer from `stream()` while the consumer task iterates it: the producer blocks when the
+buffer is full. One task consumes a stream.
+
+The position of a stream is the number of items the consumer finished, an item counts as finished when
+the next one is requested. A resumed workflow restarts the stream after that position, so the item being
+processed when the workflow paused is delivered again.
+"""
+import asyncio
+import itertools
+import queue
+import threading
+
+from yanwf.utils import run_coroutine
+
+_END = object()
+
+
+class _Error:
+    def __init__(self, error):
+        self.error = error
+
+
+class TaskStream:
+    def __init__(self, task_name: str, iterator, buffer_size: int = 100, start: int = 0):
+        """
+        Args:
+            task_name: name of the streaming task
+            iterator: items of the stream, an iterator or an async iterator
+            buffer_size: max number of items produced ahead of the consumer
+            start: number of items already consumed by a previous run, skipped
+        """
+        self.task_name = task_name
+        self.buffer_size = buffer_size
+        self.position = start
+        self.done = False
+
+        self._queue = queue.Queue(maxsize=buffer_size)
+        self._closed = threading.Event()
+        self._in_flight = False
+        self._iterator = iterator
+        self._producer = None
+        if iterator is not None:
+            self._producer = threading.Thread(
+                target=self._produce, args=(start,), name=f"TaskStream-{task_name}", daemon=True
+            )
+            self._producer.start()
+
+    def __getstate__(self):
+        return {"task_name": self.task_name, "position": self.position, "done": self.done}
+
+    def __setstate__(self, state):
+        # the producer does not survive pickling, resume the workflow to reopen the stream
+        self.__init__(state["task_name"], None, start=state["position"])
+        self.done = state["done"]
+        self._closed.set()
+
+    # producer
+
+    def _produce(self, start):
+        try:
+            if hasattr(self._iterator, "__anext__"):
+                run_coroutine(self._produce_async(start))
+            else:
+                for item in itertools.islice(self._iterator, start, None):
+                    if not self._put(item):
+                        break
+                if hasattr(self._iterator, "close"):
+                    self._iterator.close()
+            self._put(_END)
+        except Exception as e:
+            self._put(_Error(e))
+
+    async def _produce_async(self, start):
+        skipped = 0
+        async for item in self._iterator:
+            if skipped < start:
+                skipped += 1
+                continue
+            if not self._put(item):
+                break
+        if hasattr(self._iterator, "aclose"):
+            await self._iterator.aclose()
+
+    def _put(self, item) -> bool:
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    # consumer
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._in_flight:
+            self.position += 1
+            self._in_flight = False
+        if self.done:
+            raise StopIteration
+        if self._producer is None:
+            raise ValueError(f"Stream of {self.task_name} is closed, resume the workflow to reopen it")
+
+        item = self._queue.get()
+        if item is _END:
+            self.done = True
+            raise StopIteration
+        if isinstance(item, _Error):
+            self.close()
+            raise item.error
+        self._in_flight = True
+        return item
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        # StopIteration cannot be set on a future
+        item = await asyncio.get_event_loop().run_in_executor(None, next, self, _END)
+        if item is _END:
+            raise StopAsyncIteration
+        return item
+
+    def close(self):
+        """Stop the producer, the items left in the buffer are dropped"""
+        self._closed.set()
+        if self._producer is not None:
+            self._producer.join()
+            self._producer = None
+
+    def __repr__(self):
+        return f"TaskStream({self.task_name}, position={self.position})"
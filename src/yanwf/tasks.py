@@ -1,46 +1,382 @@
 import logging
 from collections.abc import MutableMapping
 from abc import ABC, abstractmethod
-from typing import Any
+from contextlib import contextmanager
+from contextvars import ContextVar
+from math import isqrt
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Set, Union
 
+from yanwf.blobs import BlobRef
+from yanwf.exceptions import ContextConflictException, TaskCancelledException
 
 logger = logging.getLogger(__name__)
 
+CONTEXT_PREFIX = "$context."
+_NOT_FOUND = object()
+
+# keys of the context read by the running task, None when the reads are not tracked
+_context_reads: ContextVar[Optional[Set[str]]] = ContextVar("yanwf_context_reads", default=None)
+
+
+@contextmanager
+def track_context_reads() -> Iterator[Set[str]]:
+    """Collect the keys (dotted for nested values) read from the contexts in this thread or coroutine"""
+    reads = set()
+    token = _context_reads.set(reads)
+    try:
+        yield reads
+    finally:
+        _context_reads.reset(token)
+
+
+def _record_read(key: str):
+    reads = _context_reads.get()
+    if reads is not None:
+        reads.add(key)
+
+
+class ContextRef:
+    """`$context.` reference of a parameter, parsed once when the parameter is set"""
+
+    __slots__ = ("key", "root", "parts", "path")
+
+    def __init__(self, key: str):
+        self.key = key
+        parts = key.split(".")
+        self.root = parts[0]
+        # None for a top level key
+        self.parts = tuple(parts) if len(parts) > 1 else None
+        # keys under the root
+        self.path = tuple(parts[1:])
+
+    def __eq__(self, other):
+        return isinstance(other, ContextRef) and other.key == self.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return CONTEXT_PREFIX + self.key
+
+
+_compiled_keys: Dict[str, ContextRef] = {}
+_MAX_COMPILED_KEYS = 10000
+
+
+def compile_key(key: str) -> ContextRef:
+    """Parsed dotted key of the context, cached"""
+    ref = _compiled_keys.get(key)
+    if ref is None:
+        if len(_compiled_keys) >= _MAX_COMPILED_KEYS:
+            _compiled_keys.clear()
+        ref = _compiled_keys[key] = ContextRef(key)
+    return ref
+
+
+def _set_path(container, path, value, delete=False):
+    """Copy of the nested dicts along the path with the value set or deleted, the others are shared"""
+    copied = dict(container) if container is not None else {}
+    key = path[0]
+    if len(path) > 1:
+        copied[key] = _set_path(copied.get(key), path[1:], value, delete)
+    elif delete:
+        del copied[key]
+    else:
+        copied[key] = value
+    return copied
+
+
+# value of a deleted key in the overlay of a context
+_DELETED = object()
+
 
 class WorkflowContext(MutableMapping):
+    """Values of a workflow by key, nested values are read and written with dotted keys ("a.b.c").
+
+    Copy-on-write: `fork()` and `snapshot()` share the values with the context without copying them. The
+    keys written after a fork go to a small overlay of the base dict, folded into a new base dict once
+    it holds about the square root of the number of keys. A dotted write copies the nested dicts along
+    its path only. `merge(fork)` applies the writes of a fork and detects the keys written concurrently.
+    """
+
     def __init__(self, *args, **kwargs):
-        self.store = dict()
-        self.update(dict(*args, **kwargs))  # use the free update to set keys
+        self._reset(dict())
+        self.update(dict(*args, **kwargs))
+
+    def _reset(self, base: dict):
+        self._base = base
+        # keys written since the base is shared, _DELETED for a deleted key
+        self._top = dict()
+        self._base_shared = False
+        self._top_shared = False
+        # about the square root of the number of keys: copying the overlay after a fork and folding it
+        # into a new base dict both cost O(sqrt(n)) per write
+        self._max_top = max(32, isqrt(len(base)))
+        self._length = len(base)
+        # from the first fork, write version of the written keys and of the parents of the written dotted
+        # keys, to find the keys written concurrently with a fork
+        self._forked = False
+        self._version = 0
+        self._versions: Dict[str, int] = None
+        self._child_versions: Dict[str, int] = None
+        # keys written by a fork, in order, None if the context is not a fork
+        self._written: Optional[Dict[str, None]] = None
+        self._fork_version = 0
+        self._readonly = False
+
+    @property
+    def store(self) -> dict:
+        """The values as a dict, the overlay of the writes since a fork is folded first"""
+        if self._top:
+            self._compact()
+        return self._base
+
+    def _get(self, root):
+        top = self._top
+        if top:
+            value = top.get(root, _NOT_FOUND)
+            if value is not _NOT_FOUND:
+                if value is _DELETED:
+                    raise KeyError(root)
+                return value
+        return self._base[root]
+
+    def resolve(self, ref: ContextRef):
+        # _record_read inlined, called for every parameter read
+        reads = _context_reads.get()
+        if reads is not None:
+            reads.add(ref.key)
+        if ref.parts is None:
+            return self._base[ref.root] if not self._top else self._get(ref.root)
+
+        # the path is parsed once, the value is read every time: a nested value may be changed in place
+        current_value = self._get(ref.root)
+        for part in ref.path:
+            current_value = current_value[part]
+        return current_value
 
     def __getitem__(self, key):
+        reads = _context_reads.get()
+        if reads is not None:
+            reads.add(key)
+        return self._lookup(key)
+
+    def _lookup(self, key):
         if "." not in key:
-            return self.store[self._keytransform(key)]
+            return self._base[key] if not self._top else self._get(key)
 
-        current_value = self.store
-        for part in key.split("."):
+        ref = compile_key(key)
+        current_value = self._get(ref.root)
+        for part in ref.path:
             current_value = current_value[part]
         return current_value
 
     def __setitem__(self, key, value):
-        self.store[self._keytransform(key)] = value
+        if "." in key:
+            ref = compile_key(key)
+            self._set(ref.root, _set_path(self._get_root(ref.root), ref.path, value))
+        else:
+            self._set(key, value)
+        self._written_key(key)
 
     def __delitem__(self, key):
-        del self.store[self._keytransform(key)]
+        if "." in key:
+            ref = compile_key(key)
+            self._set(ref.root, _set_path(self._get(ref.root), ref.path, None, delete=True))
+        else:
+            self._set(key, _DELETED)
+        self._written_key(key)
+
+    def _get_root(self, root, default=None):
+        try:
+            return self._get(root)
+        except KeyError:
+            return default
+
+    def _set(self, root, value):
+        if self._readonly:
+            raise TypeError("a context snapshot is read-only")
+        if not self._base_shared:
+            # no fork, the overlay is empty
+            base = self._base
+            if value is _DELETED:
+                del base[root]
+                self._length -= 1
+            else:
+                if root not in base:
+                    self._length += 1
+                base[root] = value
+            return
+
+        top = self._top
+        if self._top_shared:
+            top = self._top = dict(top)
+            self._top_shared = False
+        previous = top.get(root, _NOT_FOUND)
+        exists = root in self._base if previous is _NOT_FOUND else previous is not _DELETED
+        if value is _DELETED:
+            if not exists:
+                raise KeyError(root)
+            self._length -= 1
+        elif not exists:
+            self._length += 1
+        top[root] = value
+        if len(top) > self._max_top:
+            self._compact()
+
+    def _compact(self):
+        base = dict(self._base)
+        for key, value in self._top.items():
+            if value is _DELETED:
+                base.pop(key, None)
+            else:
+                base[key] = value
+        self._base = base
+        self._top = dict()
+        self._base_shared = self._top_shared = False
+        self._max_top = max(32, isqrt(len(base)))
+
+    def _written_key(self, key):
+        if self._written is not None:
+            self._written[key] = None
+        if self._forked:
+            self._version += 1
+            version = self._version
+            self._versions[key] = version
+            while "." in key:
+                key = key.rpartition(".")[0]
+                self._child_versions[key] = version
+
+    def fork(self) -> "WorkflowContext":
+        """Copy of the context sharing its values, the writes of the copy are applied by `merge`"""
+        fork = WorkflowContext.__new__(WorkflowContext)
+        fork._reset(self._base)
+        fork._top = self._top
+        fork._length = self._length
+        fork._base_shared = fork._top_shared = True
+        fork._max_top = self._max_top
+        fork._written = dict()
+        fork._fork_version = self._version
+        if not self._forked:
+            self._forked = True
+            self._versions = {}
+            self._child_versions = {}
+        self._base_shared = self._top_shared = True
+        return fork
+
+    def snapshot(self) -> "WorkflowContext":
+        """Read-only copy of the context as it is now, sharing its values"""
+        snapshot = self.fork()
+        snapshot._readonly = True
+        return snapshot
+
+    def merge(self, fork: "WorkflowContext", strict: bool = True):
+        """Apply the writes of a fork of the context at once.
+
+        Not thread safe, the workflow merges the forks of its tasks under its lock.
+
+        Args:
+            strict: detect the conflicts, False to apply the writes of the fork over the writes made in
+                the context since the fork
+
+        Raises:
+            ContextConflictException: keys written by the fork were written in the context since the
+                fork (the key, a parent or a child of it) with another value, nothing is applied
+        """
+        written = fork._written
+        if not written:
+            return
+        if strict:
+            version = fork._fork_version
+            conflicts = [
+                key for key in written if self._written_since(key, version) and not self._same(fork, key)
+            ]
+            if conflicts:
+                raise ContextConflictException(conflicts)
+        for key in written:
+            try:
+                value = fork._lookup(key)
+            except KeyError:
+                try:
+                    del self[key]
+                except KeyError:
+                    pass
+            else:
+                self[key] = value
+
+    def _same(self, fork: "WorkflowContext", key) -> bool:
+        # the same value written by both, or deleted by both, is not a conflict
+        value = fork._get_value(key)
+        other = self._get_value(key)
+        if value is other:
+            return True
+        try:
+            return bool(value == other)
+        except Exception:
+            return False
+
+    def _get_value(self, key):
+        try:
+            return self._lookup(key)
+        except (KeyError, TypeError):
+            return _DELETED
+
+    def _written_since(self, key, version) -> bool:
+        if self._child_versions.get(key, 0) > version:
+            return True
+        versions = self._versions
+        while True:
+            if versions.get(key, 0) > version:
+                return True
+            if "." not in key:
+                return False
+            key = key.rpartition(".")[0]
 
     def __iter__(self):
-        return iter(self.store)
+        top = self._top
+        if not top:
+            return iter(self._base)
+        return self._iter_layers(top)
+
+    def _iter_layers(self, top):
+        # same order as a dict: the updated keys keep their place, the new keys come last
+        base = self._base
+        for key in base:
+            if top.get(key) is not _DELETED:
+                yield key
+        for key, value in top.items():
+            if value is not _DELETED and key not in base:
+                yield key
 
     def __len__(self):
-        return len(self.store)
+        return self._length
 
-    def _keytransform(self, key):
-        return key
+    def _to_dict(self) -> dict:
+        return {key: self._get(key) for key in self} if self._top else self._base
 
     def __repr__(self):
-        return str(self.store)
+        return str(self._to_dict())
+
+    def __getstate__(self):
+        return {"store": self._to_dict()}
+
+    def __setstate__(self, state):
+        self._reset(state["store"])
 
 
 class BaseTask(ABC):
+    # replay the output of a previous run with the same parameters from Workflow.result_cache
+    cacheable = False
+    # change it when the output of the task changes for the same parameters
+    cache_version = "1"
+    # timeout, retries and hedged attempts of the runs, see yanwf.policies
+    run_timeout = None
+    max_retries = 0
+    retry_backoff = 0.1
+    hedge_after = None
+    # set when the attempt running the task timed out or lost to a hedged attempt
+    _cancelled = False
+
     def __init__(self, name: str = None, **kwargs):
         if name:
             self.name = name
@@ -65,6 +401,15 @@ class BaseTask(ABC):
     def run(self):
         pass
 
+    @property
+    def cancelled(self) -> bool:
+        """True when the result of the running attempt is not used anymore, a long `run()` should stop"""
+        return self._cancelled
+
+    def check_cancelled(self):
+        if self._cancelled:
+            raise TaskCancelledException(f"{self} is cancelled")
+
     def output(self) -> Any:
         """Return value of output will be updated to workflow context
 
@@ -76,14 +421,58 @@ class BaseTask(ABC):
         """
         pass
 
+    def resolve_parameters(self, load_blobs: bool = True) -> Dict[str, Any]:
+        """Return the values of all parameters, with `$context.` references resolved
+
+        Args:
+            load_blobs: load the values stored out of band, False to keep the picklable BlobRefs
+        """
+        if load_blobs:
+            return {name: getattr(self, name) for name in get_parameters(type(self))}
+        parameters = get_parameters(type(self))
+        return {name: parameter.get_value(self, False) for name, parameter in parameters.items()}
+
     def __repr__(self):
         return getattr(self, "name", super().__repr__())
 
 
+class AsyncBaseTask(BaseTask):
+    """Task with a coroutine `run`, awaited by `Workflow.arun`"""
+
+    @abstractmethod
+    async def run(self):
+        pass
+
+
+class StreamingTask(BaseTask):
+    """Task producing items with `stream()`, consumed by the task referencing its `$context.` output
+
+    The stream is put in the context when the task starts, so the consumer runs while the items are
+    produced. `buffer_size` (or `"buffer_size"` in the definition) bounds the items produced ahead.
+    """
+
+    buffer_size = 100
+
+    def run(self):
+        pass
+
+    @abstractmethod
+    def stream(self) -> Union[Iterator, AsyncIterator]:
+        """Return the items, an iterator or an async iterator restarting from the first item"""
+
+
+def bind_value(value):
+    """Parse a `$context.` reference into a ContextRef, other values are returned as is"""
+    if isinstance(value, str) and value.startswith(CONTEXT_PREFIX):
+        return ContextRef(value[len(CONTEXT_PREFIX):])
+    return value
+
+
 class Parameter(ABC):
     def __init__(self, default_value=None, required=False):
         self.validate(default_value)
         self.default_value = default_value
+        self._default_binding = bind_value(default_value)
         self.required = required
 
     def __set_name__(self, owner, name):
@@ -91,24 +480,40 @@ class Parameter(ABC):
         self.original_name = name
 
     def __get__(self, obj, objtype=None):
-        result = self.default_value
-        if hasattr(obj, self.private_name):
-            result = getattr(obj, self.private_name)
+        result = getattr(obj, self.private_name, self._default_binding)
 
-        if isinstance(result, str) and result.startswith("$context."):
-            key = result[9:]
-            result = self._get_from_context(key, obj)
+        if result.__class__ is ContextRef:
+            result = self._get_from_context(result, obj)
+        if result.__class__ is BlobRef:
+            result = result.load()
 
-        self._validate_required(result)
+        if self.required and not result:
+            self._validate_required(result)
 
         return result
 
-    def _get_from_context(self, key, obj):
-        if not hasattr(obj, "workflow_context"):
+    def get_value(self, obj, load_blobs: bool = True):
+        """Return the value of the parameter of a task, a BlobRef as is unless `load_blobs`"""
+        if load_blobs:
+            return self.__get__(obj)
+
+        result = getattr(obj, self.private_name, self._default_binding)
+        if result.__class__ is ContextRef:
+            result = self._get_from_context(result, obj)
+        self._validate_required(result)
+        return result
+
+    def _get_from_context(self, ref: ContextRef, obj):
+        workflow_context = getattr(obj, "workflow_context", _NOT_FOUND)
+        if workflow_context is _NOT_FOUND:
             raise ValueError("workflow_context not found")
-        if not obj.workflow_context:
-            raise ValueError("workflow_context is not set. Cannot access with $context")
-        return obj.workflow_context[key]
+        if isinstance(workflow_context, WorkflowContext):
+            if workflow_context:
+                return workflow_context.resolve(ref)
+        elif workflow_context:
+            _record_read(ref.key)
+            return workflow_context[ref.key]
+        raise ValueError("workflow_context is not set. Cannot access with $context")
 
     def _validate_required(self, value):
         if self.required and not value:
@@ -116,8 +521,8 @@ class Parameter(ABC):
 
     def __set__(self, obj, value):
         self.validate(value)
-        logger.debug(f"Set value of {obj} to {value}")
-        setattr(obj, self.private_name, value)
+        logger.debug("Set value of %s to %s", obj, value)
+        setattr(obj, self.private_name, bind_value(value))
 
     @abstractmethod
     def validate(self, value):
@@ -133,3 +538,19 @@ class Number(Parameter):
     def validate(self, value):
         if value:
             int(value)
+
+
+_parameters_cache = {}
+
+
+def get_parameters(task_cls) -> Dict[str, Parameter]:
+    """Return the parameters declared on a task class and its bases"""
+    parameters = _parameters_cache.get(task_cls)
+    if parameters is None:
+        parameters = {}
+        for cls in reversed(task_cls.__mro__):
+            for name, value in vars(cls).items():
+                if isinstance(value, Parameter):
+                    parameters[name] = value
+        _parameters_cache[task_cls] = parameters
+    return parameters
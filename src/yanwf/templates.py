@@ -0,0 +1,73 @@
+from functools import partial
+from typing import Dict
+
+from yanwf.dag import TaskGraph
+from yanwf.initializer import create_task
+from yanwf.tasks import BaseTask
+from yanwf.workflows import TaskInstances, Workflow, WorkflowState
+
+
+class WorkflowTemplate:
+    """Definitions compiled once to create many workflows.
+
+    Task classes are resolved, parameters validated and the task order computed when the template is
+    built. `create` then copies the prepared tasks instead of constructing them again.
+    """
+
+    def __init__(self, definitions, workflow_cls=Workflow):
+        self.definitions = definitions
+        self.workflow_cls = workflow_cls
+        self.context = dict(definitions.get("context", {}))
+        self.graph = TaskGraph.from_definitions(definitions)
+        self.prototypes: Dict[str, BaseTask] = {}
+        self.constructed: Dict[str, dict] = {}
+
+        for task_name in definitions["tasks"]:
+            task_definition = definitions["tasks"][task_name]
+            prototype = create_task(task_name, task_definition, definitions.get("modules", []))
+            self.prototypes[task_name] = prototype
+            if type(prototype).__init__ is not BaseTask.__init__:
+                # a custom constructor may create state that must not be shared, construct it each time
+                self.constructed[task_name] = task_definition
+
+    def create(self, context=None, state: WorkflowState = None, **kwargs) -> Workflow:
+        """Create a workflow of the template
+
+        Args:
+            context: values added to the context of the definitions
+            state: saved state to continue, the context of the definitions is not applied
+            kwargs: passed to the workflow class
+        """
+        workflow_instance = self.workflow_cls(**kwargs)
+        if state is not None:
+            workflow_instance.state = state
+        else:
+            workflow_instance.context.update(self.context)
+            if context:
+                workflow_instance.context.update(context)
+
+        workflow_instance.definitions = self.definitions
+        workflow_instance.graph = self.graph
+        workflow_context = workflow_instance.context
+        tasks = workflow_instance.tasks = TaskInstances(
+            partial(self._copy_task, workflow_context=workflow_context), self.prototypes
+        )
+        if state is None:
+            # the tasks of a restored workflow are copied when they run
+            for task_name in self.prototypes:
+                tasks[task_name]
+        return workflow_instance
+
+    def _copy_task(self, task_name, workflow_context) -> BaseTask:
+        prototype = self.prototypes[task_name]
+        task_cls = type(prototype)
+        if task_name in self.constructed:
+            module_names = self.definitions.get("modules", [])
+            task = create_task(task_name, self.constructed[task_name], module_names)
+        else:
+            # same steps as BaseTask.__init__ without validating the parameters again
+            task = task_cls.__new__(task_cls)
+            task.__dict__.update(prototype.__dict__)
+            task.init()
+        task.workflow_context = workflow_context
+        return task
@@ -1,3 +1,15 @@
+import asyncio
+
+
 def guard_not_null(val):
     if not val:
         raise ValueError(f"Value {val} cannot be null")
+
+
+def run_coroutine(coroutine):
+    """Run a coroutine to the end on a new event loop of the current thread"""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
@@ -1,13 +1,36 @@
+import asyncio
+import threading
+import time
 import traceback
-from datetime import datetime
+import tracemalloc
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from array import array
+from collections.abc import MutableMapping
+from datetime import datetime, timedelta
 
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
 from enum import Enum
 
+from yanwf import process_pool
+from yanwf.cache import MISS, make_cache_key
+from yanwf.dag import ReadyTracker, TaskGraph
 from yanwf.exceptions import PauseWorkflowException, TaskRunningException
-from yanwf.utils import guard_not_null
-from yanwf.initializer import get_task_cls
-from yanwf.tasks import BaseTask, WorkflowContext
+from yanwf.initializer import create_task
+from yanwf.listeners import WorkflowListener
+from yanwf.mapping import MapItemStats, MapTask
+from yanwf.policies import arun_with_policy, get_run_policy, run_with_policy
+from yanwf.streams import TaskStream
+from yanwf.tasks import (
+    AsyncBaseTask,
+    BaseTask,
+    StreamingTask,
+    WorkflowContext,
+    bind_value,
+    get_parameters,
+    track_context_reads,
+)
+from yanwf.utils import guard_not_null, run_coroutine
 import attr
 
 
@@ -18,14 +41,251 @@ class RunStatus(Enum):
     PAUSED = (4,)
     RUNNING = 5
 
+    @property
+    def code(self) -> int:
+        """Integer code of the status, for storage"""
+        return _STATUS_CODES[self]
 
-@attr.s
+    @classmethod
+    def from_code(cls, code: int) -> "RunStatus":
+        return _CODE_STATUSES[code]
+
+
+_STATUS_CODES = {status: 4 if status.name == "PAUSED" else status.value for status in RunStatus}
+_CODE_STATUSES = {code: status for status, code in _STATUS_CODES.items()}
+
+
+@attr.s(slots=True, getstate_setstate=False)
 class TaskRunStat:
-    start_time = attr.ib(type=datetime, default=datetime.utcnow)
+    start_time = attr.ib(type=datetime, default=attr.Factory(datetime.utcnow))
     end_time = attr.ib(type=datetime, default=None)
-    status = attr.ib(type=RunStatus, default=RunStatus.NOT_STARTED)
+    # `status`, a property updating the index of the TaskRunStats of the stat
+    _status = attr.ib(type=RunStatus, default=RunStatus.NOT_STARTED)
     status_text = attr.ib(type=str, default=None)
     output = attr.ib(type=Any, default=None)
+    cache_hit = attr.ib(type=bool, default=False)
+    # items of the stream of a StreamingTask consumed, None for other tasks
+    stream_position = attr.ib(type=int, default=None)
+    stream_done = attr.ib(type=bool, default=False)
+    # status of the items of a MapTask, None for other tasks
+    items = attr.ib(type=MapItemStats, default=None)
+    # seconds spent in the phases of the last run: resolve, run, output, merge
+    timings = attr.ib(type=Dict[str, float], factory=dict)
+    # seconds from start to end of the last run, monotonic clock
+    duration = attr.ib(type=float, default=None)
+    # CPU seconds of the thread running the task and peak memory allocated, `Workflow(instrument=True)`
+    cpu_time = attr.ib(type=float, default=None)
+    peak_memory = attr.ib(type=int, default=None)
+    # wake-up time (UTC) and event of the last pause, see PauseWorkflowException
+    wake_at = attr.ib(type=datetime, default=None)
+    wait_for = attr.ib(type=str, default=None)
+    # attempts of the last run of a task with a timeout, retries or hedge (see yanwf.policies), the
+    # attempts that timed out and if a hedged attempt finished first
+    attempts = attr.ib(type=int, default=None)
+    timeouts = attr.ib(type=int, default=0)
+    hedge_won = attr.ib(type=bool, default=False)
+    # context keys read and written by the last successful run, `Workflow(track_reads=True)`, None when
+    # not tracked
+    reads = attr.ib(type=Tuple[str, ...], default=None)
+    writes = attr.ib(type=Tuple[str, ...], default=None)
+    # profile of the last run written by the TaskProfiler of the workflow, see yanwf.profiling
+    profile_path = attr.ib(type=str, default=None)
+    # TaskRunStats indexing the status of the stat
+    _owner = attr.ib(default=None, init=False, eq=False, repr=False)
+    _name = attr.ib(default=None, init=False, eq=False, repr=False)
+
+    @property
+    def status(self) -> RunStatus:
+        return self._status
+
+    @status.setter
+    def status(self, status: RunStatus):
+        if self._owner is not None:
+            self._owner._status_changed(self._name, self._status, status)
+        self._status = status
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in _STAT_FIELDS)
+
+    def __setstate__(self, state):
+        self._owner = None
+        self._name = None
+        if isinstance(state, dict):
+            # pickled before the stats were slotted
+            state = tuple(state.get(name.lstrip("_"), _STAT_DEFAULTS[name]) for name in _STAT_FIELDS)
+        for name, value in zip(_STAT_FIELDS, state):
+            setattr(self, name, value)
+
+
+_STAT_FIELDS = tuple(field.name for field in attr.fields(TaskRunStat) if field.init)
+_STAT_DEFAULTS = {
+    field.name: field.default.factory() if isinstance(field.default, attr.Factory) else field.default
+    for field in attr.fields(TaskRunStat)
+    if field.init
+}
+# pickled as columns by TaskRunStats, the other fields are pickled when they are not the default
+_COLUMN_FIELDS = ("start_time", "end_time", "_status")
+_SPARSE_FIELDS = tuple(name for name in _STAT_FIELDS if name not in _COLUMN_FIELDS)
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_NO_TIME = -(1 << 63)
+
+
+def _to_microseconds(value: datetime) -> int:
+    return _NO_TIME if value is None else (value - _EPOCH) // _MICROSECOND
+
+
+class TaskRunStats(MutableMapping):
+    """Stats of the tasks by task name, indexed by status.
+
+    The stats are slotted records, a status change of a stat in the mapping updates the index so the
+    tasks with a status are found without scanning. Pickled as columns: one byte per status, the
+    times as integer microseconds and only the other fields that are not the default.
+    """
+
+    def __init__(self, stats: Dict[str, TaskRunStat] = None):
+        self._stats: Dict[str, TaskRunStat] = {}
+        # task names per status, dicts keep the order the tasks got the status
+        self._by_status: Dict[RunStatus, Dict[str, None]] = {status: {} for status in RunStatus}
+        if stats:
+            self.update(stats)
+
+    def __getitem__(self, task_name) -> TaskRunStat:
+        return self._stats[task_name]
+
+    def get(self, task_name, default=None):
+        return self._stats.get(task_name, default)
+
+    def __contains__(self, task_name):
+        return task_name in self._stats
+
+    def __setitem__(self, task_name, stat: TaskRunStat):
+        previous = self._stats.get(task_name)
+        if previous is not None:
+            self._remove(task_name, previous)
+        stat._owner = self
+        stat._name = task_name
+        self._stats[task_name] = stat
+        self._by_status[stat.status][task_name] = None
+
+    def __delitem__(self, task_name):
+        self._remove(task_name, self._stats.pop(task_name))
+
+    def _remove(self, task_name, stat: TaskRunStat):
+        self._by_status[stat.status].pop(task_name, None)
+        stat._owner = None
+
+    def _status_changed(self, task_name, previous, status):
+        self._by_status[previous].pop(task_name, None)
+        self._by_status[status][task_name] = None
+
+    def __iter__(self):
+        return iter(self._stats)
+
+    def __len__(self):
+        return len(self._stats)
+
+    def with_status(self, status: RunStatus) -> List[str]:
+        """Names of the tasks with a status, in the order they got it"""
+        return list(self._by_status[status])
+
+    def first_with_status(self, status: RunStatus) -> Optional[str]:
+        return next(iter(self._by_status[status]), None)
+
+    def count(self, status: RunStatus) -> int:
+        return len(self._by_status[status])
+
+    def __repr__(self):
+        return f"TaskRunStats({self._stats!r})"
+
+    def __getstate__(self):
+        stats = list(self._stats.values())
+        sparse = {}
+        for name in _SPARSE_FIELDS:
+            default = _STAT_DEFAULTS[name]
+            values = {}
+            for index, stat in enumerate(stats):
+                value = getattr(stat, name)
+                if value is not default and value != default:
+                    values[index] = value
+            if values:
+                sparse[name] = values
+        return (
+            1,
+            list(self._stats),
+            bytes(stat.status.code for stat in stats),
+            array("q", [_to_microseconds(stat.start_time) for stat in stats]).tobytes(),
+            array("q", [_to_microseconds(stat.end_time) for stat in stats]).tobytes(),
+            sparse,
+        )
+
+    def __setstate__(self, state):
+        _, names, statuses, start_times, end_times, sparse = state
+        self.__init__()
+        stats = self._stats
+        by_status = self._by_status
+        for task_name, code, start, end in zip(
+            names, statuses, array("q", start_times), array("q", end_times)
+        ):
+            status = _CODE_STATUSES[code]
+            stat = TaskRunStat(
+                None if start == _NO_TIME else _EPOCH + _MICROSECOND * start,
+                None if end == _NO_TIME else _EPOCH + _MICROSECOND * end,
+                status,
+            )
+            stat._owner = self
+            stat._name = task_name
+            stats[task_name] = stat
+            by_status[status][task_name] = None
+
+        stats = list(stats.values())
+        for name, values in sparse.items():
+            for index, value in values.items():
+                setattr(stats[index], name, value)
+
+
+def _to_task_run_stats(stats) -> TaskRunStats:
+    return stats if isinstance(stats, TaskRunStats) else TaskRunStats(stats)
+
+
+class TaskInstances(MutableMapping):
+    """Tasks of a workflow by name, created from their definitions when first accessed.
+
+    A released task is created again the next time it is accessed.
+    """
+
+    def __init__(self, factory: Callable[[str], BaseTask] = None, task_names=()):
+        self._factory = factory
+        self._tasks: Dict[str, Optional[BaseTask]] = dict.fromkeys(task_names)
+
+    def __getitem__(self, task_name) -> BaseTask:
+        task = self._tasks[task_name]
+        if task is None:
+            task = self._tasks[task_name] = self._factory(task_name)
+        return task
+
+    def __setitem__(self, task_name, task: BaseTask):
+        self._tasks[task_name] = task
+
+    def __delitem__(self, task_name):
+        del self._tasks[task_name]
+
+    def __iter__(self):
+        return iter(self._tasks)
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def __contains__(self, task_name):
+        return task_name in self._tasks
+
+    def release(self, task_name):
+        if task_name in self._tasks:
+            self._tasks[task_name] = None
+
+    def created(self) -> List[str]:
+        """Names of the tasks currently created"""
+        return [task_name for task_name, task in self._tasks.items() if task is not None]
 
 
 @attr.s
@@ -34,20 +294,218 @@ class WorkflowState:
     trace = attr.ib(type=Any, default=None)
     error = attr.ib(type=Any, default=None)
     context = attr.ib(type=WorkflowContext, factory=WorkflowContext)
-    task_run_stats = attr.ib(type=Dict[str, TaskRunStat], factory=dict)
+    task_run_stats = attr.ib(type=TaskRunStats, factory=TaskRunStats, converter=_to_task_run_stats)
+    # dependencies not done per task not done at the end of the last run, see ReadyTracker
+    frontier = attr.ib(type=Dict[str, int], default=None)
+
+    def __setstate__(self, state):
+        state = dict(state)
+        # pickled before the stats were indexed or the frontier was saved
+        state["task_run_stats"] = _to_task_run_stats(state.get("task_run_stats", {}))
+        state.setdefault("frontier", None)
+        self.__dict__.update(state)
+
+
+# merge of the context writes of the tasks run concurrently: the last task completed wins, or a task
+# writing a key written with another value since it started fails with ContextConflictException
+LAST_WRITER_WINS = "last_writer_wins"
+STRICT = "strict"
+CONFLICT_POLICIES = (LAST_WRITER_WINS, STRICT)
+
+# attributes of the workflows pickled before they were added
+_WORKFLOW_DEFAULTS = {
+    "definitions": {},
+    "max_workers": 1,
+    "journal": None,
+    "result_cache": None,
+    "blob_store": None,
+    "listeners": [],
+    "instrument": False,
+    "release_completed": False,
+    "track_reads": False,
+    "profiler": None,
+    "context_conflicts": LAST_WRITER_WINS,
+}
+
+
+# instrumented runs of the process sharing tracemalloc, stopped with the last one if they started it
+_tracing_lock = threading.Lock()
+_tracing_runs = 0
+_tracing_started = False
+
+
+@contextmanager
+def _trace_memory(enabled=True):
+    """Trace the memory allocations while an instrumented run is running"""
+    global _tracing_runs, _tracing_started
+    if not enabled:
+        yield
+        return
+    with _tracing_lock:
+        if _tracing_runs == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_started = True
+        _tracing_runs += 1
+    try:
+        yield
+    finally:
+        with _tracing_lock:
+            _tracing_runs -= 1
+            if _tracing_runs == 0 and _tracing_started:
+                tracemalloc.stop()
+                _tracing_started = False
+
+
+def _run_and_output(task: BaseTask):
+    if isinstance(task, AsyncBaseTask):
+        run_coroutine(task.run())
+    else:
+        task.run()
+    return task.output()
+
+
+async def _arun_and_output(task: AsyncBaseTask):
+    await task.run()
+    return task.output()
+
+
+def merge_output(context: WorkflowContext, task_name, output):
+    if output:
+        if isinstance(output, dict):
+            context.update(output)
+        else:
+            context[task_name] = output
+
+
+def get_output_keys(task_name, output) -> Tuple[str, ...]:
+    """Keys of the context set by `merge_output`"""
+    if not output:
+        return ()
+    if isinstance(output, dict):
+        return tuple(output)
+    return (task_name,)
+
+
+def _is_key_changed(key: str, changed: Set[str], changed_parents: Set[str]) -> bool:
+    # the key, a parent or a child of the key changed
+    if key in changed or key in changed_parents:
+        return True
+    while "." in key:
+        key = key.rpartition(".")[0]
+        if key in changed:
+            return True
+    return False
+
+
+def _get_parents(keys: Iterable[str]) -> Set[str]:
+    parents = set()
+    for key in keys:
+        while "." in key:
+            key = key.rpartition(".")[0]
+            parents.add(key)
+    return parents
 
 
 class Workflow:
-    def __init__(self, raise_on_error=False, definitions=None):
+    def __init__(
+        self,
+        raise_on_error=False,
+        definitions=None,
+        max_workers=1,
+        state: WorkflowState = None,
+        journal=None,
+        result_cache=None,
+        blob_store=None,
+        listeners: List[WorkflowListener] = None,
+        instrument=False,
+        release_completed=False,
+        track_reads=False,
+        profiler=None,
+        context_conflicts=LAST_WRITER_WINS,
+    ):
+        if context_conflicts not in CONFLICT_POLICIES:
+            raise ValueError(f"Unknown context conflict policy: {context_conflicts}")
         self.raise_on_error = raise_on_error
+        # number of tasks run at the same time, 1 runs the tasks one by one in dependency order
+        self.max_workers = max_workers
+        # CheckpointJournal recording the changes of the state
+        self.journal = journal
+        # ResultCache of the outputs of cacheable tasks
+        self.result_cache = result_cache
+        # BlobStore of the output values larger than its threshold, the context holds BlobRefs of them
+        self.blob_store = blob_store
+        # WorkflowListeners called on the task lifecycle events, after the journal
+        self.listeners = list(listeners or [])
+        # measure the parameter resolution, CPU time and peak memory of the tasks, slower
+        self.instrument = instrument
+        # drop the instances of the succeeded tasks, `get_task` creates a new instance of them
+        self.release_completed = release_completed
+        # record the context keys read and written by the tasks, for `rerun`
+        self.track_reads = track_reads
+        # TaskProfiler writing the profiles of the slow or sampled tasks
+        self.profiler = profiler
+        # merge of the context writes of the tasks run concurrently, LAST_WRITER_WINS or STRICT
+        self.context_conflicts = context_conflicts
 
-        self.state = WorkflowState()
+        # a saved state continues a workflow, the context of the definitions is not applied again
+        restored = state is not None
+        self.state = state if restored else WorkflowState()
 
-        self.tasks: Dict[str, BaseTask] = {}
+        self.definitions = definitions or {}
+        self.tasks = TaskInstances(self._create_task)
+        self.graph = TaskGraph()
+        self._lock = threading.RLock()
+        # open streams of the streaming tasks of the current run
+        self._streams: Dict[str, TaskStream] = {}
+        # (perf counter, thread time, traced memory) at the start of the running tasks
+        self._usage: Dict[str, tuple] = {}
+        # forks of the context of the tasks running concurrently, merged when they complete
+        self._task_contexts: Dict[str, WorkflowContext] = {}
 
         if definitions:
-            self.context.update(definitions.get("context", {}))
-            self._create_tasks(definitions)
+            if not restored:
+                self.context.update(definitions.get("context", {}))
+            # the tasks of a new workflow are created to validate the definitions, the tasks of a
+            # restored one when they run
+            self._create_tasks(definitions, lazy=restored)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        del state["_streams"]
+        del state["_usage"]
+        del state["_task_contexts"]
+        # shared with other workflows, set them again after unpickling
+        state["result_cache"] = None
+        state["profiler"] = None
+        return state
+
+    def __setstate__(self, state):
+        for name, default in _WORKFLOW_DEFAULTS.items():
+            if name not in state:
+                state[name] = default.copy() if isinstance(default, (dict, list)) else default
+        self.__dict__.update(state)
+        if "graph" not in state:
+            self._upgrade_tasks()
+        self._lock = threading.RLock()
+        self._streams = {}
+        self._usage = {}
+        self._task_contexts = {}
+
+    def _upgrade_tasks(self):
+        # pickled before the DAG: the tasks in a dict ran one by one in their order, with the
+        # `$context.` references of their parameters not parsed
+        tasks = self.tasks
+        for task in tasks.values():
+            for parameter in get_parameters(type(task)).values():
+                value = task.__dict__.get(parameter.private_name)
+                if isinstance(value, str):
+                    task.__dict__[parameter.private_name] = bind_value(value)
+        self.tasks = TaskInstances(self._create_task, tasks)
+        self.tasks.update(tasks)
+        names = list(tasks)
+        # each task depends on the task before it
+        self.graph = TaskGraph({name: names[max(i - 1, 0):i] for i, name in enumerate(names)})
 
     @property
     def status(self):
@@ -78,86 +536,548 @@ class Workflow:
         return self.state.context
 
     @property
-    def task_run_stats(self) -> Dict[str, TaskRunStat]:
+    def task_run_stats(self) -> TaskRunStats:
         return self.state.task_run_stats
 
     def get_error_task(self) -> TaskRunStat:
-        for name in self.task_run_stats:
-            if self.task_run_stats[name].status == RunStatus.ERROR:
-                return self.task_run_stats[name]
-        return None
+        task_name = self.task_run_stats.first_with_status(RunStatus.ERROR)
+        return self.task_run_stats[task_name] if task_name is not None else None
 
-    def _create_tasks(self, definitions):
-        for task_name in definitions["tasks"]:
-            task_definition = definitions["tasks"][task_name]
-            cls_name = task_definition.get("cls", task_name)
+    def get_wakeup(self) -> Tuple[Optional[datetime], List[str]]:
+        """Earliest wake-up time (UTC) and the events of the paused tasks, see WakeupScheduler"""
+        wake_at = None
+        events = []
+        for task_name in self.task_run_stats.with_status(RunStatus.PAUSED):
+            stat = self.task_run_stats[task_name]
+            if stat.wake_at is not None and (wake_at is None or stat.wake_at < wake_at):
+                wake_at = stat.wake_at
+            if stat.wait_for is not None and stat.wait_for not in events:
+                events.append(stat.wait_for)
+        return wake_at, events
 
-            task_cls = get_task_cls(module_names=definitions["modules"], task_cls=cls_name)
+    def _create_tasks(self, definitions, lazy=False):
+        self.tasks = TaskInstances(self._create_task, definitions["tasks"])
+        if not lazy:
+            for task_name in definitions["tasks"]:
+                self.tasks[task_name]
 
-            task_instance = task_cls(
-                name=task_definition.get("name", task_name), **task_definition["parameters"]
-            )
+        self.graph = TaskGraph.from_definitions(definitions)
 
-            task_instance.workflow_context = self.context
-            self.tasks[task_name] = task_instance
+    def _create_task(self, task_name) -> BaseTask:
+        task_definition = self.definitions["tasks"][task_name]
+        task_instance = create_task(task_name, task_definition, self.definitions.get("modules", []))
+        task_instance.workflow_context = self.context
+        return task_instance
+
+    def get_task_definition(self, task_name) -> Dict:
+        return self.definitions.get("tasks", {}).get(task_name, {})
 
     def get_task(self, task_name) -> BaseTask:
         guard_not_null(task_name)
         return self.tasks.get(task_name, None)
 
     def run(self):
-        try:
-            for task_name in self.tasks:
-                self._run_task(task_name)
+        tracker = self._create_tracker()
+        with _trace_memory(self.instrument):
+            try:
+                if self.max_workers > 1:
+                    self._run_parallel(tracker)
+                else:
+                    # same order as graph.order, from the frontier of a resumed workflow
+                    while tracker.has_ready():
+                        task_name = tracker.pop_next()
+                        self._run_task(task_name)
+                        tracker.mark_done(task_name)
+
+                self.status = RunStatus.SUCCESS
+
+            except Exception as e:
+                self._handle_run_error(e)
+            finally:
+                self._finish_run(tracker)
+
+    async def arun(self, max_concurrency=None, executor=None):
+        """Run the tasks concurrently on the running event loop.
 
-            self.status = RunStatus.SUCCESS
+        Args:
+            max_concurrency: max number of tasks running at the same time, None for no limit
+            executor: executor to run sync tasks, None for the loop default executor
+        """
+        tracker = self._create_tracker()
+        with _trace_memory(self.instrument):
+            try:
+                await self._arun_tasks(tracker, max_concurrency, executor)
 
-        except PauseWorkflowException:
+                self.status = RunStatus.SUCCESS
+
+            except Exception as e:
+                self._handle_run_error(e)
+            finally:
+                self._finish_run(tracker)
+
+    def _create_tracker(self) -> ReadyTracker:
+        """Tracker of the remaining tasks, from the saved frontier without visiting the done tasks"""
+        frontier = self.state.frontier
+        if frontier is not None and self._is_frontier_of_graph(frontier):
+            return ReadyTracker(self.graph, frontier=frontier)
+        return ReadyTracker(self.graph, done=self._get_succeeded_tasks())
+
+    def _is_frontier_of_graph(self, frontier: Dict[str, int]) -> bool:
+        # the definitions may have changed since the frontier was saved: every task of the graph must
+        # be in the frontier or succeeded, counted without visiting the succeeded tasks
+        dependencies = self.graph.dependencies
+        stats = self.task_run_stats
+        reopened = 0
+        for task_name in frontier:
+            if task_name not in dependencies:
+                return False
+            stat = stats.get(task_name)
+            if stat is not None and stat.status == RunStatus.SUCCESS:
+                reopened += 1
+        return len(frontier) + stats.count(RunStatus.SUCCESS) - reopened == len(dependencies)
+
+    def _finish_run(self, tracker: ReadyTracker):
+        for task_name in self._close_streams():
+            tracker.reopen(task_name)
+        self.state.frontier = tracker.frontier
+        self._record("workflow_finished")
+
+    def _handle_run_error(self, error):
+        # must be called in an except block
+        if isinstance(error, PauseWorkflowException):
             self.status = RunStatus.PAUSED
-        except Exception as e:
-            self.trace = traceback.format_exc()
-            self.status = RunStatus.ERROR
-            self.error = e
-            if self.raise_on_error:
+            return
+
+        self.trace = traceback.format_exc()
+        self.status = RunStatus.ERROR
+        self.error = error
+        if self.raise_on_error:
+            raise
+
+    def _get_succeeded_tasks(self):
+        # a streaming task stopped before the end of its stream runs again to reopen it
+        stats = self.task_run_stats
+        return [
+            name
+            for name in stats.with_status(RunStatus.SUCCESS)
+            if stats[name].stream_position is None or stats[name].stream_done
+        ]
+
+    @staticmethod
+    def _raise_first(errors):
+        if errors:
+            # a failure wins over a pause
+            errors.sort(key=lambda e: isinstance(e, PauseWorkflowException))
+            raise errors[0]
+
+    def _run_parallel(self, tracker: ReadyTracker):
+        errors = []
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running = {}
+            while True:
+                # stop starting new tasks once a task paused or failed, let running ones finish
+                if not errors:
+                    for task_name in tracker.pop_ready():
+                        running[pool.submit(self._run_task, task_name, True)] = task_name
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task_name = running.pop(future)
+                    error = future.exception()
+                    if error:
+                        errors.append(error)
+                    else:
+                        tracker.mark_done(task_name)
+
+        self._raise_first(errors)
+
+    async def _arun_tasks(self, tracker: ReadyTracker, max_concurrency, executor):
+        semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        errors = []
+
+        running = {}
+        while True:
+            if not errors:
+                for task_name in tracker.pop_ready():
+                    future = asyncio.ensure_future(self._arun_task(task_name, semaphore, executor))
+                    running[future] = task_name
+            if not running:
+                break
+
+            finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for future in finished:
+                task_name = running.pop(future)
+                error = future.exception()
+                if error:
+                    errors.append(error)
+                else:
+                    tracker.mark_done(task_name)
+
+        self._raise_first(errors)
+
+    async def _arun_task(self, task_name, semaphore=None, executor=None):
+        if semaphore:
+            async with semaphore:
+                return await self._arun_task(task_name, executor=executor)
+
+        if self._is_done(task_name):
+            # not created for nothing
+            return
+        task = self.tasks[task_name]
+        task_definition = self.get_task_definition(task_name)
+        in_process = task_definition.get("executor") == process_pool.PROCESS_EXECUTOR
+        if not in_process and not isinstance(task, AsyncBaseTask):
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(executor, self._run_task, task_name, True)
+
+        if not self._start_task(task_name):
+            return
+        with self._tracked_reads(task_name):
+            try:
+                self._isolate(task_name, task)
+                cache_key = self._get_cache_key(task_name, task)
+                if cache_key is not None and self._complete_from_cache(task_name, cache_key):
+                    return
+
+                stat = self.task_run_stats[task_name]
+                if in_process:
+                    with self._timed(stat, "run"):
+                        future = process_pool.submit_task(task, task_definition.get("context_keys", ()))
+                        output = await asyncio.wrap_future(future)
+                else:
+                    self._resolve_parameters(stat, task)
+                    policy = get_run_policy(task_definition, task)
+                    if policy is not None:
+                        with self._timed(stat, "run"):
+                            output = await arun_with_policy(task, _arun_and_output, policy, stat)
+                    else:
+                        with self._timed(stat, "run"):
+                            await task.run()
+                        with self._timed(stat, "output"):
+                            output = task.output()
+
+                if cache_key is not None:
+                    self.result_cache.set(cache_key, output)
+                self._complete_task(task_name, output)
+            except Exception as e:
+                self._fail_task(task_name, e)
+                raise
+
+    def _run_task(self, task_name, isolated=False):
+        """Run a task, on a fork of the context when `isolated`, for the tasks run concurrently"""
+        if not self._start_task(task_name):
+            return
+        with self._tracked_reads(task_name):
+            try:
+                task = self.tasks[task_name]
+                if isolated:
+                    self._isolate(task_name, task)
+                cache_key = self._get_cache_key(task_name, task)
+                if cache_key is not None and self._complete_from_cache(task_name, cache_key):
+                    return
+
+                task_definition = self.get_task_definition(task_name)
+                stat = self.task_run_stats[task_name]
+                if task_definition.get("executor") == process_pool.PROCESS_EXECUTOR:
+                    with self._timed(stat, "run"):
+                        output = process_pool.run_task(task, task_definition.get("context_keys", ()))
+                else:
+                    self._resolve_parameters(stat, task)
+                    policy = None
+                    if not isinstance(task, (StreamingTask, MapTask)):
+                        policy = get_run_policy(task_definition, task)
+                    if policy is not None:
+                        with self._timed(stat, "run"):
+                            output = run_with_policy(task, _run_and_output, policy, stat)
+                    else:
+                        with self._timed(stat, "run"):
+                            if isinstance(task, StreamingTask):
+                                stream = self._open_stream(task_name, task)
+                            elif isinstance(task, MapTask):
+                                self._run_map(task_name, task)
+                            elif isinstance(task, AsyncBaseTask):
+                                run_coroutine(task.run())
+                            else:
+                                task.run()
+                        with self._timed(stat, "output"):
+                            output = stream if isinstance(task, StreamingTask) else task.output()
+
+                if cache_key is not None:
+                    self.result_cache.set(cache_key, output)
+                self._complete_task(task_name, output)
+            except Exception as e:
+                self._fail_task(task_name, e)
                 raise
 
-    def _run_task(self, task_name):
+    def _is_done(self, task_name) -> bool:
+        stat = self.task_run_stats.get(task_name)
+        if stat is None or stat.status != RunStatus.SUCCESS:
+            return False
+        return stat.stream_position is None or stat.stream_done
+
+    def _start_task(self, task_name) -> bool:
+        """Create or update the stat of a task before running it
+
+        Returns:
+            bool: False if the task already succeeded, skip it in case of resume
+        """
         if task_name in self.task_run_stats:
-            # skip in case of resume
-            if self.task_run_stats[task_name].status == RunStatus.SUCCESS:
-                return
+            if self._is_done(task_name):
+                return False
 
             if self.task_run_stats[task_name].status == RunStatus.RUNNING:
                 raise TaskRunningException(f"{task_name} is running")
+        else:
+            with self._lock:
+                self.task_run_stats[task_name] = TaskRunStat()
+
+        stat = self.task_run_stats[task_name]
+        stat.status = RunStatus.RUNNING
+        stat.start_time = datetime.utcnow()
+        stat.timings = {}
+        if stat.wake_at is not None or stat.wait_for is not None:
+            stat.wake_at = stat.wait_for = None
+        self._start_usage(task_name)
+        self._record("task_started", task_name)
+        return True
+
+    def _complete_task(self, task_name, output):
+        stat = self.task_run_stats[task_name]
+        with self._timed(stat, "merge"):
+            if self.blob_store is not None:
+                output = self.blob_store.externalize_output(output)
+            self._merge_output(task_name, output)
+
+        # update stat
+        stat.status = RunStatus.SUCCESS
+        stat.end_time = datetime.utcnow()
+        stat.output = output
+        if self.track_reads:
+            stat.reads = tuple(sorted(stat.reads or ()))
+            stat.writes = get_output_keys(task_name, output)
+        self._stop_usage(task_name)
+        self._record("task_finished", task_name)
+        if self.release_completed and stat.stream_position is None:
+            self.tasks.release(task_name)
+
+    @contextmanager
+    def _tracked_reads(self, task_name):
+        """Collect the context keys read by the task run in its stat, the set is frozen on success"""
+        if not self.track_reads:
+            yield
+            return
+        with track_context_reads() as reads:
+            self.task_run_stats[task_name].reads = reads
+            yield
 
+    def _resolve_parameters(self, stat: TaskRunStat, task: BaseTask):
+        # the parameters are resolved by the task when it reads them, resolving them first is measured
+        if self.instrument:
+            with self._timed(stat, "resolve"):
+                task.resolve_parameters()
+
+    @staticmethod
+    @contextmanager
+    def _timed(stat: TaskRunStat, phase):
+        start = time.perf_counter()
         try:
-            if task_name not in self.task_run_stats:
-                self.task_run_stats[task_name] = TaskRunStat()
+            yield
+        finally:
+            stat.timings[phase] = stat.timings.get(phase, 0.0) + time.perf_counter() - start
 
-            self.tasks[task_name].run()
+    def trace_memory(self):
+        """Context manager tracing the memory of the tasks run outside of `run`, if instrumented"""
+        return _trace_memory(self.instrument)
 
-            # process output
-            output = self.tasks[task_name].output()
-            if output:
-                if isinstance(output, dict):
-                    self.context.update(output)
-                else:
-                    self.context[task_name] = output
+    def _start_usage(self, task_name):
+        with self._lock:
+            memory = None
+            if self.instrument:
+                # the peak of tasks running at the same time is shared, reset it when none is running
+                if not self._usage:
+                    tracemalloc.reset_peak()
+                memory = tracemalloc.get_traced_memory()[0]
+            self._usage[task_name] = (time.perf_counter(), time.thread_time(), memory)
+        if self.profiler is not None:
+            self.profiler.start(self, task_name)
+
+    def _stop_usage(self, task_name):
+        with self._lock:
+            usage = self._usage.pop(task_name, None)
+        if usage is None:
+            return
+        start, thread_time, memory = usage
+        stat = self.task_run_stats[task_name]
+        stat.duration = time.perf_counter() - start
+        if self.profiler is not None:
+            stat.profile_path = self.profiler.stop(self, task_name, stat.duration)
+        if memory is not None:
+            # the thread time of the thread finishing the task, async tasks share the loop thread
+            stat.cpu_time = max(time.thread_time() - thread_time, 0.0)
+            stat.peak_memory = max(tracemalloc.get_traced_memory()[1] - memory, 0)
+
+    def _open_stream(self, task_name, task: StreamingTask) -> TaskStream:
+        stat = self.task_run_stats[task_name]
+        stat.stream_position = stat.stream_position or 0
+        buffer_size = self.get_task_definition(task_name).get("buffer_size", task.buffer_size)
+        stream = TaskStream(
+            task_name, task.stream(), buffer_size=buffer_size, start=stat.stream_position
+        )
+        with self._lock:
+            self._streams[task_name] = stream
+        return stream
+
+    def _run_map(self, task_name, task: MapTask):
+        stat = self.task_run_stats[task_name]
+        try:
+            task.run_items(stat.items)
+        finally:
+            if task.item_stats is not None:
+                stat.items = task.item_stats
+
+    def _close_streams(self) -> List[str]:
+        """Stop the producers of the run, the positions of the streams are saved for resume
+
+        Returns:
+            list: streaming tasks to run again to reopen their stream
+        """
+        with self._lock:
+            streams, self._streams = self._streams, {}
+        unfinished = []
+        for task_name, stream in streams.items():
+            stream.close()
+            stat = self.task_run_stats[task_name]
+            stat.stream_position = stream.position
+            # a stream not consumed to the end is not needed once the workflow succeeded
+            stat.stream_done = stream.done or self.status == RunStatus.SUCCESS
+            if not stat.stream_done:
+                unfinished.append(task_name)
+            self._record("stream_closed", task_name)
+        return unfinished
 
-            # update stat
-            self.task_run_stats[task_name].status = RunStatus.SUCCESS
-            self.task_run_stats[task_name].end_time = datetime.utcnow()
-            self.task_run_stats[task_name].output = output
-        except PauseWorkflowException as e:
+    def _get_cache_key(self, task_name, task):
+        if self.result_cache is None or isinstance(task, StreamingTask):
+            return None
+        if not self.get_task_definition(task_name).get("cache", task.cacheable):
+            return None
+        return make_cache_key(task)
+
+    def _complete_from_cache(self, task_name, cache_key) -> bool:
+        output = self.result_cache.get(cache_key)
+        if output is MISS:
+            return False
+        self.task_run_stats[task_name].cache_hit = True
+        self._complete_task(task_name, output)
+        return True
+
+    def _isolate(self, task_name, task: BaseTask):
+        with self._lock:
+            context = self._task_contexts[task_name] = self.context.fork()
+        task.workflow_context = context
+
+    def _end_isolation(self, task_name) -> Optional[WorkflowContext]:
+        context = self._task_contexts.pop(task_name, None)
+        if context is not None:
+            self.tasks[task_name].workflow_context = self.context
+        return context
+
+    def _merge_output(self, task_name, output):
+        task_context = self._end_isolation(task_name)
+        if task_context is not None:
+            # the writes of the task during its run and its output, at once
+            merge_output(task_context, task_name, output)
+            with self._lock:
+                self.context.merge(task_context, strict=self.context_conflicts == STRICT)
+        elif output:
+            with self._lock:
+                merge_output(self.context, task_name, output)
+
+    def _fail_task(self, task_name, error):
+        self._end_isolation(task_name)
+        if isinstance(error, PauseWorkflowException):
             self.task_run_stats[task_name].status = RunStatus.PAUSED
-            self.task_run_stats[task_name].status_text = str(e)
-            self.task_run_stats[task_name].end_time = datetime.utcnow()
-            raise
-        except Exception as e:
+            self.task_run_stats[task_name].wake_at = error.wake_at
+            self.task_run_stats[task_name].wait_for = error.wait_for
+        else:
             self.task_run_stats[task_name].status = RunStatus.ERROR
-            self.task_run_stats[task_name].status_text = str(e)
-            self.task_run_stats[task_name].end_time = datetime.utcnow()
-            raise
+        if self.track_reads:
+            self.task_run_stats[task_name].reads = None
+        self.task_run_stats[task_name].status_text = str(error)
+        self.task_run_stats[task_name].end_time = datetime.utcnow()
+        self._stop_usage(task_name)
+        self._record("task_failed", task_name)
+
+    def _record(self, event, *args):
+        if self.journal is not None or self.listeners:
+            with self._lock:
+                if self.journal is not None:
+                    getattr(self.journal, event)(self, *args)
+                for listener in self.listeners:
+                    getattr(listener, event)(self, *args)
+
+    def get_affected_tasks(self, changed_keys: Iterable[str]) -> List[str]:
+        """Succeeded tasks to run again after a change of context keys, in dependency order
+
+        A task is affected when it read a changed key (or a parent or a child of it), the keys it wrote
+        are changed in turn. A task without tracked reads is always affected, the tasks depending on an
+        affected task without tracked writes too.
+        """
+        changed = set(changed_keys)
+        changed_parents = _get_parents(changed)
+        affected = []
+        forced = set()
+        for task_name in self.graph.order:
+            if not self._is_done(task_name):
+                continue
+            stat = self.task_run_stats[task_name]
+            if task_name not in forced and stat.reads is not None:
+                if not any(_is_key_changed(key, changed, changed_parents) for key in stat.reads):
+                    continue
+            affected.append(task_name)
+            if stat.writes is None:
+                forced.update(self.graph.dependents[task_name])
+            elif stat.writes:
+                changed.update(stat.writes)
+                changed_parents |= _get_parents(stat.writes)
+        return affected
+
+    def invalidate(self, changed_keys: Iterable[str]) -> List[str]:
+        """Reset the stats of the tasks affected by a change of context keys, `run` or `arun` runs them
+
+        Returns:
+            List[str]: names of the reset tasks
+        """
+        changed_keys = list(changed_keys)
+        affected = self.get_affected_tasks(changed_keys)
+        with self._lock:
+            for task_name in affected:
+                del self.task_run_stats[task_name]
+        # the saved frontier does not have the reset tasks
+        self.state.frontier = None
+        if affected:
+            self._record("tasks_reset", affected)
+        return affected
+
+    def rerun(self, changed_keys: Iterable[str]) -> List[str]:
+        """Run again only the tasks affected by a change of context keys, `Workflow(track_reads=True)`
+
+            workflow.context["threshold"] = 0.5
+            workflow.rerun(["threshold"])
+
+        The other tasks keep their stats and the outputs they merged in the context.
+
+        Returns:
+            List[str]: names of the tasks run again
+        """
+        affected = self.invalidate(changed_keys)
+        self.run()
+        return affected
 
     def resume(self):
         self.run()
+
+    async def aresume(self, max_concurrency=None, executor=None):
+        await self.arun(max_concurrency=max_concurrency, executor=executor)
@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+from yanwf.tasks import AsyncBaseTask, BaseTask, Number, String
+from yanwf.workflows import RunStatus, Workflow
+from yanwf.exceptions import PauseWorkflowException
+
+
+class AsyncSleepTask(AsyncBaseTask):
+    seconds = Number(default_value=0)
+    text = String()
+
+    async def run(self):
+        await asyncio.sleep(float(self.seconds) / 1000)
+
+    def output(self):
+        return self.text
+
+
+class SyncUpperTask(BaseTask):
+    text = String()
+
+    def run(self):
+        self.result = self.text.upper()
+
+    def output(self):
+        return self.result
+
+
+class AsyncPauseOnceTask(AsyncBaseTask):
+    def init(self):
+        self.paused = False
+
+    async def run(self):
+        if not self.paused:
+            self.paused = True
+            raise PauseWorkflowException("pause once")
+
+
+class AsyncFailTask(AsyncBaseTask):
+    async def run(self):
+        raise ValueError("async fail")
+
+
+def sleep_definitions(count, seconds=200):
+    tasks = {
+        f"t{i}": {"cls": "AsyncSleepTask", "parameters": {"seconds": seconds, "text": f"t{i}"}}
+        for i in range(count)
+    }
+    tasks["upper"] = {"cls": "SyncUpperTask", "parameters": {"text": "$context.t0"}}
+    return {"modules": ["tests.test_workflow.test_async"], "tasks": tasks}
+
+
+class TestAsyncRun:
+    def test_arun_concurrently(self):
+        workflow_instance = Workflow(raise_on_error=True, definitions=sleep_definitions(10))
+
+        start = time.monotonic()
+        asyncio.run(workflow_instance.arun())
+        elapsed = time.monotonic() - start
+
+        assert workflow_instance.status == RunStatus.SUCCESS
+        assert elapsed < 1
+        assert workflow_instance.context["upper"] == "T0"
+        assert workflow_instance.task_run_stats["t9"].status == RunStatus.SUCCESS
+
+    def test_max_concurrency(self):
+        workflow_instance = Workflow(raise_on_error=True, definitions=sleep_definitions(4, seconds=100))
+
+        start = time.monotonic()
+        asyncio.run(workflow_instance.arun(max_concurrency=2))
+        elapsed = time.monotonic() - start
+
+        assert workflow_instance.status == RunStatus.SUCCESS
+        assert elapsed >= 0.2
+
+    def test_run_async_task_synchronously(self):
+        workflow_instance = Workflow(raise_on_error=True, definitions=sleep_definitions(2, seconds=1))
+
+        workflow_instance.run()
+
+        assert workflow_instance.status == RunStatus.SUCCESS
+        assert workflow_instance.context["upper"] == "T0"
+
+    def test_pause_then_resume(self):
+        definitions = sleep_definitions(2, seconds=1)
+        definitions["tasks"]["pause"] = {"cls": "AsyncPauseOnceTask", "parameters": {}}
+        workflow_instance = Workflow(definitions=definitions)
+
+        asyncio.run(workflow_instance.arun())
+
+        assert workflow_instance.status == RunStatus.PAUSED
+        assert workflow_instance.task_run_stats["pause"].status == RunStatus.PAUSED
+        assert workflow_instance.task_run_stats["pause"].status_text == "pause once"
+
+        asyncio.run(workflow_instance.aresume())
+
+        assert workflow_instance.status == RunStatus.SUCCESS
+        assert workflow_instance.task_run_stats["pause"].status == RunStatus.SUCCESS
+
+    def test_error(self):
+        definitions = sleep_definitions(1, seconds=1)
+        definitions["tasks"]["fail"] = {"cls": "AsyncFailTask", "parameters": {}}
+        workflow_instance = Workflow(definitions=definitions)
+
+        asyncio.run(workflow_instance.arun())
+
+        assert workflow_instance.status == RunStatus.ERROR
+        assert str(workflow_instance.error) == "async fail"
+        assert workflow_instance.trace
+        assert workflow_instance.get_error_task().status == RunStatus.ERROR
@@ -0,0 +1,122 @@
+import os
+import pickle
+
+import pytest
+
+from yanwf.blobs import BlobRef, BlobStore, open_blob_store
+from yanwf.tasks import BaseTask, String
+from yanwf.workflows import Workflow
+
+PAYLOAD = b"x" * 10000
+
+
+class ProduceTask(BaseTask):
+    def run(self):
+        pass
+
+    def output(self):
+        return {"payload": PAYLOAD, "text": "é" * 5000, "small": "ok"}
+
+
+class ConsumeTask(BaseTask):
+    payload = String()
+    text = String()
+
+    def run(self):
+        self.received = (self.payload, self.text)
+
+    def output(self):
+        return {"size": len(self.payload)}
+
+
+DEFINITIONS = {
+    "modules": ["tests.test_workflow.test_blobs"],
+    "tasks": {
+        "produce": {"cls": "ProduceTask", "parameters": {}},
+        "consume": {
+            "cls": "ConsumeTask",
+            "parameters": {"payload": "$context.payload", "text": "$context.text"},
+        },
+    },
+}
+
+
+class TestBlobStore:
+    def test_put_and_view(self, tmp_path):
+        store = BlobStore(str(tmp_path / "blobs"), threshold=100)
+        ref = store.put(PAYLOAD)
+        same = store.put(bytes(PAYLOAD))
+
+        assert same == ref
+        assert len(store) == 1
+        assert os.path.getsize(store.path) < 2 * len(PAYLOAD)
+        assert store.view(ref) == PAYLOAD
+        assert store.put("text").load() == "text"
+        store.close()
+
+    def test_reopen(self, tmp_path):
+        path = str(tmp_path / "blobs")
+        store = BlobStore(path)
+        ref = store.put(PAYLOAD)
+        store.close()
+
+        # incomplete blob of an interrupted write
+        with open(path, "ab") as f:
+            f.write(b"\0" * 10)
+
+        store = BlobStore(path)
+        assert ref in store
+        assert bytes(ref.load()) == PAYLOAD
+        assert store.put(b"next").load() == b"next"
+        store.close()
+
+    def test_reader_keeps_blob_being_written(self, tmp_path):
+        path = str(tmp_path / "blobs")
+        writer = BlobStore(path)
+        ref = writer.put(PAYLOAD)
+        # header and first bytes of a blob the writer is still appending
+        with open(path, "ab") as f:
+            f.write(b"\1" * 100)
+        size = os.path.getsize(path)
+
+        reader = BlobStore(path)
+        assert ref in reader
+        assert len(reader) == 1
+        assert bytes(reader.view(ref)) == PAYLOAD
+        assert os.path.getsize(path) == size
+
+        # the file has a single writer
+        with pytest.raises(RuntimeError):
+            reader.put(b"other")
+        reader.close()
+        writer.close()
+
+    def test_pickle(self, tmp_path):
+        store = BlobStore(str(tmp_path / "blobs"))
+        ref = store.put(PAYLOAD)
+
+        assert pickle.loads(pickle.dumps(store)) is store
+        assert len(pickle.dumps(ref)) < 200
+        assert open_blob_store(store.path) is store
+        store.close()
+
+
+class TestWorkflowBlobs:
+    def test_large_outputs_stored_out_of_band(self, tmp_path):
+        store = BlobStore(str(tmp_path / "blobs"), threshold=1000)
+        workflow_instance = Workflow(raise_on_error=True, definitions=DEFINITIONS, blob_store=store)
+        workflow_instance.run()
+
+        context = workflow_instance.context
+        assert isinstance(context["payload"], BlobRef)
+        assert isinstance(context["text"], BlobRef)
+        assert context["small"] == "ok"
+        assert context["size"] == len(PAYLOAD)
+
+        payload, text = workflow_instance.get_task("consume").received
+        assert isinstance(payload, memoryview)
+        assert payload == PAYLOAD
+        assert text == "é" * 5000
+
+        assert len(pickle.dumps(workflow_instance.state)) < len(PAYLOAD) / 2
+        store.close()
@@ -0,0 +1,139 @@
+import pickle
+import time
+
+from yanwf.cache import MISS, DiskResultCache, MemoryResultCache
+from yanwf.tasks import BaseTask, String
+from yanwf.workflows import RunStatus, Workflow
+
+RUN_COUNT = {"count": 0}
+
+
+class LookupTask(BaseTask):
+    cacheable = True
+    key = String()
+
+    def run(self):
+        RUN_COUNT["count"] += 1
+        self.value = self.key.upper()
+
+    def output(self):
+        return {"value": self.value}
+
+
+def definitions(key="abc", **options):
+    task_definition = {"cls": "LookupTask", "parameters": {"key": "$context.key"}}
+    task_definition.update(options)
+    return {
+        "modules": ["tests.test_workflow.test_cache"],
+        "context": {"key": key},
+        "tasks": {"lookup": task_definition},
+    }
+
+
+def run_workflow(result_cache, **kwargs):
+    workflow_instance = Workflow(
+        raise_on_error=True, result_cache=result_cache, definitions=definitions(**kwargs)
+    )
+    workflow_instance.run()
+    return workflow_instance
+
+
+class TestResultCache:
+    def test_replay_cached_output(self):
+        cache = MemoryResultCache()
+        RUN_COUNT["count"] = 0
+
+        first = run_workflow(cache)
+        second = run_workflow(cache)
+        other = run_workflow(cache, key="def")
+
+        assert RUN_COUNT["count"] == 2
+        assert not first.task_run_stats["lookup"].cache_hit
+        assert second.task_run_stats["lookup"].cache_hit
+        assert second.task_run_stats["lookup"].status == RunStatus.SUCCESS
+        assert second.context["value"] == "ABC"
+        assert other.context["value"] == "DEF"
+        assert cache.stats == {"hits": 1, "misses": 2, "evictions": 0}
+
+    def test_opt_out_in_definitions(self):
+        cache = MemoryResultCache()
+        RUN_COUNT["count"] = 0
+
+        run_workflow(cache, cache=False)
+        run_workflow(cache, cache=False)
+
+        assert RUN_COUNT["count"] == 2
+        assert len(cache) == 0
+
+    def test_version(self):
+        cache = MemoryResultCache()
+        run_workflow(cache)
+
+        LookupTask.cache_version = "2"
+        try:
+            assert not run_workflow(cache).task_run_stats["lookup"].cache_hit
+        finally:
+            LookupTask.cache_version = "1"
+
+    def test_pickle_workflow_without_cache(self):
+        workflow_instance = run_workflow(MemoryResultCache())
+        assert pickle.loads(pickle.dumps(workflow_instance)).result_cache is None
+
+
+class TestMemoryResultCache:
+    def test_lru(self):
+        cache = MemoryResultCache(max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("b") is MISS
+        assert cache.get("a") == 1
+        assert cache.evictions == 1
+
+    def test_max_bytes(self):
+        cache = MemoryResultCache(max_bytes=300)
+        cache.set("a", "x" * 200)
+        cache.set("b", "y" * 200)
+
+        assert cache.get("a") is MISS
+        assert cache.get("b") == "y" * 200
+
+    def test_ttl(self):
+        cache = MemoryResultCache(ttl=0.05)
+        cache.set("a", None)
+        assert cache.get("a") is None
+
+        time.sleep(0.1)
+        assert cache.get("a") is MISS
+
+
+class TestDiskResultCache:
+    def test_shared_by_instances(self, tmp_path):
+        DiskResultCache(str(tmp_path)).set("a", {"value": 1})
+
+        cache = DiskResultCache(str(tmp_path))
+        assert cache.get("a") == {"value": 1}
+        assert cache.size > 0
+
+    def test_evict_least_recently_used(self, tmp_path):
+        cache = DiskResultCache(str(tmp_path), max_bytes=500)
+        cache.set("a", "x" * 200)
+        time.sleep(0.01)
+        cache.set("b", "y" * 200)
+        time.sleep(0.01)
+        cache.get("a")
+        cache.set("c", "z" * 200)
+
+        assert cache.get("b") is MISS
+        assert cache.get("a") == "x" * 200
+        assert cache.evictions == 1
+
+    def test_ttl(self, tmp_path):
+        cache = DiskResultCache(str(tmp_path), ttl=0.05)
+        cache.set("a", 1)
+        time.sleep(0.1)
+
+        assert cache.get("a") is MISS
+        assert cache.size == 0
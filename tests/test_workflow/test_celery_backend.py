@@ -0,0 +1,96 @@
+import pytest
+
+from yanwf.tasks import BaseTask, String
+from yanwf.workflows import RunStatus
+from yanwf.exceptions import PauseWorkflowException
+
+celery = pytest.importorskip("celery")
+
+from yanwf.celery_backend import CeleryWorkflowBackend  # noqa: E402
+
+
+class UpperTask(BaseTask):
+    text = String()
+
+    def run(self):
+        self.result = self.text.upper()
+
+    def output(self):
+        return self.result
+
+
+class JoinTask(BaseTask):
+    first = String()
+    second = String()
+
+    def run(self):
+        pass
+
+    def output(self):
+        return {"joined": f"{self.first} {self.second}"}
+
+
+class WaitApprovalTask(BaseTask):
+    approved = String()
+
+    def run(self):
+        if not self.approved:
+            raise PauseWorkflowException("wait for approval")
+
+
+class FailTask(BaseTask):
+    def run(self):
+        raise ValueError("celery fail")
+
+
+@pytest.fixture
+def backend():
+    app = celery.Celery("test_yanwf", broker="memory://", backend="cache+memory://")
+    app.conf.task_always_eager = True
+    app.conf.task_eager_propagates = True
+    return CeleryWorkflowBackend(app, checkpoints={})
+
+
+def definitions(**extra_tasks):
+    tasks = {
+        "hello": {"cls": "UpperTask", "parameters": {"text": "hello"}},
+        "world": {"cls": "UpperTask", "parameters": {"text": "world"}},
+        "join": {"cls": "JoinTask", "parameters": {"first": "$context.hello", "second": "$context.world"}},
+    }
+    tasks.update(extra_tasks)
+    return {"modules": ["tests.test_workflow.test_celery_backend"], "context": {"approved": ""}, "tasks": tasks}
+
+
+class TestCeleryBackend:
+    def test_fan_out(self, backend):
+        workflow_id = backend.start(definitions())
+
+        workflow_instance = backend.get_workflow(workflow_id)
+        assert workflow_instance.status == RunStatus.SUCCESS
+        assert workflow_instance.context["joined"] == "HELLO WORLD"
+        assert workflow_instance.task_run_stats["join"].status == RunStatus.SUCCESS
+
+    def test_pause_then_resume(self, backend):
+        wait = {"cls": "WaitApprovalTask", "parameters": {"approved": "$context.approved"}}
+        workflow_id = backend.start(definitions(wait=wait))
+
+        workflow_instance = backend.get_workflow(workflow_id)
+        assert workflow_instance.status == RunStatus.PAUSED
+        assert workflow_instance.task_run_stats["wait"].status == RunStatus.PAUSED
+
+        # update the checkpoint then let any worker continue
+        workflow_instance.context["approved"] = "yes"
+        backend.save_workflow(workflow_id, workflow_instance)
+        backend.resume(workflow_id)
+
+        workflow_instance = backend.get_workflow(workflow_id)
+        assert workflow_instance.status == RunStatus.SUCCESS
+        assert workflow_instance.task_run_stats["wait"].status == RunStatus.SUCCESS
+
+    def test_error(self, backend):
+        workflow_id = backend.start(definitions(fail={"cls": "FailTask", "parameters": {}}))
+
+        workflow_instance = backend.get_workflow(workflow_id)
+        assert workflow_instance.status == RunStatus.ERROR
+        assert workflow_instance.error == "celery fail"
+        assert "ValueError" in workflow_instance.trace
@@ -0,0 +1,207 @@
+import asyncio
+import pickle
+import threading
+
+import pytest
+
+from yanwf.exceptions import ContextConflictException
+from yanwf.tasks import BaseTask, ContextRef, String, WorkflowContext, compile_key
+from yanwf.workflows import STRICT, RunStatus, Workflow
+
+
+class TestDottedKeys:
+    def test_compiled_once(self):
+        assert compile_key("a.b.c") is compile_key("a.b.c")
+        assert compile_key("a.b.c").path == ("b", "c")
+
+    def test_write_copies_path(self):
+        nested = {"b": {"c": 1}, "d": {"e": 2}}
+        context = WorkflowContext({"a": nested})
+        context["a.b.c"] = 3
+
+        assert context["a.b.c"] == 3
+        # the dicts along the path are copied, the others are shared
+        assert nested["b"]["c"] == 1
+        assert context["a.d"] is nested["d"]
+
+    def test_write_creates_missing_dicts(self):
+        context = WorkflowContext()
+        context["a.b.c"] = 1
+        assert context["a"] == {"b": {"c": 1}}
+
+    def test_delete(self):
+        context = WorkflowContext({"a": {"b": 1, "c": 2}})
+        del context["a.b"]
+        assert context["a"] == {"c": 2}
+        with pytest.raises(KeyError):
+            del context["a.x"]
+
+    def test_resolved_reference_dropped_by_dotted_write(self):
+        context = WorkflowContext({"a": {"b": 1}})
+        assert context.resolve(ContextRef("a.b")) == 1
+        context["a.b"] = 2
+        assert context.resolve(ContextRef("a.b")) == 2
+
+
+class TestForks:
+    def test_fork_is_isolated(self):
+        context = WorkflowContext({"a": 1, "b": {"c": 2}})
+        fork = context.fork()
+        fork["a"] = 10
+        fork["d"] = 4
+        context["b.c"] = 20
+        del context["a"]
+
+        assert dict(fork) == {"a": 10, "b": {"c": 2}, "d": 4}
+        assert dict(context) == {"b": {"c": 20}}
+
+    def test_merge(self):
+        context = WorkflowContext({"a": 1, "b": 2, "config": {"x": 1, "y": 1}})
+        fork1 = context.fork()
+        fork2 = context.fork()
+        fork1["a"] = 10
+        fork1["config.x"] = 2
+        del fork1["b"]
+        fork2["config.y"] = 3
+
+        context.merge(fork1)
+        context.merge(fork2)
+        assert dict(context) == {"a": 10, "config": {"x": 2, "y": 3}}
+
+    @pytest.mark.parametrize(
+        "fork_key, context_key", [("a", "a"), ("a.b", "a"), ("a", "a.b"), ("a.b", "a.b.c")]
+    )
+    def test_conflict(self, fork_key, context_key):
+        context = WorkflowContext({"a": {"b": {"c": 1}}, "z": 0})
+        fork = context.fork()
+        fork[fork_key] = 2
+        fork["z"] = 1
+        context[context_key] = 3
+
+        with pytest.raises(ContextConflictException) as error:
+            context.merge(fork)
+        assert error.value.keys == [fork_key]
+        # nothing applied
+        assert context["z"] == 0
+
+    def test_same_value_is_not_a_conflict(self):
+        context = WorkflowContext({"a": {"b": 1}})
+        fork = context.fork()
+        fork["a.b"] = 2
+        context["a"] = {"b": 2}
+        context.merge(fork)
+        assert context["a"] == {"b": 2}
+
+    def test_merge_not_strict(self):
+        context = WorkflowContext({"a": 1})
+        fork = context.fork()
+        fork["a"] = 2
+        context["a"] = 3
+        context.merge(fork, strict=False)
+        assert context["a"] == 2
+
+    def test_snapshot_is_read_only(self):
+        context = WorkflowContext({"a": 1})
+        snapshot = context.snapshot()
+        context["a"] = 2
+        assert snapshot["a"] == 1
+        with pytest.raises(TypeError):
+            snapshot["a"] = 3
+
+    def test_many_writes_after_fork(self):
+        context = WorkflowContext({f"k{i}": i for i in range(100)})
+        fork = context.fork()
+        for i in range(0, 100, 2):
+            context[f"k{i}"] = -i
+        for i in range(1, 100, 4):
+            del context[f"k{i}"]
+        context["new"] = 1
+
+        assert len(fork) == 100 and fork["k2"] == 2 and fork["k1"] == 1
+        expected = {f"k{i}": -i if i % 2 == 0 else i for i in range(100) if i % 4 != 1}
+        expected["new"] = 1
+        assert len(context) == len(expected)
+        assert list(context.items()) == list(expected.items())
+
+    def test_pickle_fork(self):
+        context = WorkflowContext({"a": 1})
+        fork = context.fork()
+        fork["b"] = 2
+        assert pickle.loads(pickle.dumps(fork)) == {"a": 1, "b": 2}
+
+
+class CountTask(BaseTask):
+    """Writes to its context while it runs, sees the other tasks' writes only after they completed"""
+
+    key = String()
+    barrier = None
+
+    def run(self):
+        self.workflow_context[f"runs.{self.name}"] = self.workflow_context.get("runs", {}).get(self.name, 0) + 1
+        if self.barrier is not None:
+            self.barrier.wait(timeout=5)
+
+    def output(self):
+        return {self.key: self.name} if self.key else None
+
+
+class ConstantTask(CountTask):
+    def output(self):
+        return {self.key: 1}
+
+
+def make_definitions(keys):
+    return {
+        "modules": ["tests.test_workflow.test_context"],
+        "tasks": {name: {"cls": "CountTask", "parameters": {"key": key}} for name, key in keys.items()},
+    }
+
+
+class TestConcurrentTasks:
+    def setup_method(self):
+        CountTask.barrier = threading.Barrier(2)
+
+    def teardown_method(self):
+        CountTask.barrier = None
+
+    def test_writes_merged(self):
+        workflow = Workflow(definitions=make_definitions({"t1": "out1", "t2": "out2"}), max_workers=2)
+        workflow.run()
+        assert workflow.status == RunStatus.SUCCESS
+        assert workflow.context["runs"] == {"t1": 1, "t2": 1}
+        assert workflow.context["out1"] == "t1" and workflow.context["out2"] == "t2"
+        assert workflow.get_task("t1").workflow_context is workflow.context
+
+    def test_last_writer_wins(self):
+        workflow = Workflow(definitions=make_definitions({"t1": "out", "t2": "out"}), max_workers=2)
+        workflow.run()
+        assert workflow.status == RunStatus.SUCCESS
+        assert workflow.context["out"] in ("t1", "t2")
+
+    def test_strict_conflict_fails_task(self):
+        workflow = Workflow(
+            definitions=make_definitions({"t1": "out", "t2": "out"}), max_workers=2, context_conflicts=STRICT
+        )
+        workflow.run()
+        assert workflow.status == RunStatus.ERROR
+        assert isinstance(workflow.error, ContextConflictException)
+        assert workflow.error.keys == ["out"]
+
+    def test_strict_same_value(self):
+        definitions = make_definitions({"t1": "out", "t2": "out"})
+        for task_definition in definitions["tasks"].values():
+            task_definition["cls"] = "ConstantTask"
+        workflow = Workflow(definitions=definitions, max_workers=2, context_conflicts=STRICT)
+        workflow.run()
+        assert workflow.status == RunStatus.SUCCESS
+        assert workflow.context["out"] == 1
+
+    def test_unknown_conflict_policy(self):
+        with pytest.raises(ValueError):
+            Workflow(context_conflicts="first_writer_wins")
+
+    def test_arun(self):
+        workflow = Workflow(definitions=make_definitions({"t1": "out1", "t2": "out2"}))
+        asyncio.run(workflow.arun())
+        assert workflow.status == RunStatus.SUCCESS
+        assert workflow.context["runs"] == {"t1": 1, "t2": 1}
@@ -0,0 +1,240 @@
+import time
+import pickle
+
+import pytest
+
+from yanwf.dag import TaskGraph, infer_dependencies
+from yanwf.tasks import BaseTask, Number, String
+from yanwf.workflows import RunStatus, Workflow
+from yanwf.exceptions import PauseWorkflowException
+
+
+class SleepTask(BaseTask):
+    seconds = Number(default_value=0)
+    text = String()
+
+    def run(self):
+        time.sleep(float(self.seconds) / 1000)
+
+    def output(self):
+        return self.text
+
+
+class PauseOnceTask(BaseTask):
+    def init(self):
+        self.paused = False
+
+    def run(self):
+        if not self.paused:
+            self.paused = True
+            raise PauseWorkflowException("pause once")
+
+
+class PauseUntilReadyTask(BaseTask):
+    def run(self):
+        if not self.workflow_context.get("ready"):
+            raise PauseWorkflowException("not ready")
+
+
+class NoopTask(BaseTask):
+    def run(self):
+        pass
+
+
+class FailTask(BaseTask):
+    def run(self):
+        raise ValueError("fail")
+
+
+def sleep_definitions():
+    return {
+        "modules": ["tests.test_workflow.test_dag"],
+        "tasks": {
+            "a": {"cls": "SleepTask", "parameters": {"seconds": 200, "text": "a"}},
+            "b": {"cls": "SleepTask", "parameters": {"seconds": 200, "text": "b"}},
+            "c": {"cls": "SleepTask", "parameters": {"seconds": 200, "text": "c"}},
+            "d": {"cls": "SleepTask", "parameters": {"text": "$context.a"}},
+        },
+    }
+
+
+class TestTaskGraph:
+    def test_infer_dependencies(self):
+        dependencies = infer_dependencies({
+            "context": {"x": 1},
+            "tasks": {
+                "a": {"parameters": {}},
+                "b": {"parameters": {}, "outputs": ["content"]},
+                "c": {"parameters": {"p1": "$context.a", "p2": "$context.content.title"}},
+                "d": {"parameters": {"p1": "$context.x"}},
+                "e": {"depends_on": ["a"], "parameters": {"p1": "$context.x"}},
+            },
+        })
+
+        assert dependencies["a"] == []
+        assert dependencies["c"] == ["a", "b"]
+        # no task produces x
+        assert dependencies["d"] == []
+        assert dependencies["e"] == ["a"]
+
+    def test_order(self):
+        graph = TaskGraph({"a": ["c"], "b": [], "c": ["b"]})
+        assert graph.order == ["b", "c", "a"]
+
+    def test_order_is_definition_order(self):
+        graph = TaskGraph({"a": [], "b": ["a"], "c": []})
+        assert graph.order == ["a", "b", "c"]
+
+    def test_run_in_definition_order(self):
+        workflow_instance = Workflow(raise_on_error=True, definitions={
+            "modules": ["tests.test_workflow.test_dag"],
+            "context": {"x": "x"},
+            "tasks": {
+                "a": {"cls": "SleepTask", "parameters": {"text": "$context.x"}},
+                "b": {"cls": "SleepTask", "parameters": {"text": "$context.a"}},
+                "c": {"cls": "SleepTask", "parameters": {"text": "$context.x"}},
+            },
+        })
+        workflow_instance.run()
+
+        stats = workflow_instance.task_run_stats
+        assert stats["a"].end_time <= stats["b"].start_time
+        assert stats["b"].end_time <= stats["c"].start_time
+
+    def test_cycle(self):
+        with pytest.raises(ValueError):
+            TaskGraph({"a": ["b"], "b": ["a"]})
+
+    def test_unknown_dependency(self):
+        with pytest.raises(ValueError):
+            TaskGraph({"a": ["b"]})
+
+
+class TestParallelRun:
+    def test_run_independent_tasks_in_parallel(self):
+        workflow_instance = Workflow(raise_on_error=True, max_workers=4, definitions=sleep_definitions())
+
+        start = time.monotonic()
+        workflow_instance.run()
+        elapsed = time.monotonic() - start
+
+        assert workflow_instance.status == RunStatus.SUCCESS
+        assert elapsed < 0.5
+        assert workflow_instance.context["d"] == "a"
+        assert workflow_instance.task_run_stats["d"].end_time >= workflow_instance.task_run_stats["a"].end_time
+
+    def test_pause_then_resume(self):
+        definitions = sleep_definitions()
+        definitions["tasks"]["pause"] = {"cls": "PauseOnceTask", "parameters": {}}
+        definitions["tasks"]["e"] = {"cls": "SleepTask", "depends_on": ["pause"], "parameters": {}}
+        workflow_instance = Workflow(max_workers=4, definitions=definitions)
+
+        workflow_instance.run()
+
+        assert workflow_instance.status == RunStatus.PAUSED
+        assert workflow_instance.task_run_stats["pause"].status == RunStatus.PAUSED
+        assert workflow_instance.task_run_stats["a"].status == RunStatus.SUCCESS
+        assert "e" not in workflow_instance.task_run_stats
+
+        workflow_instance = pickle.loads(pickle.dumps(workflow_instance))
+        workflow_instance.resume()
+
+        assert workflow_instance.status == RunStatus.SUCCESS
+        assert all(stat.status == RunStatus.SUCCESS for stat in workflow_instance.task_run_stats.values())
+
+    def test_error_stops_dependents(self):
+        workflow_instance = Workflow(max_workers=2, definitions={
+            "modules": ["tests.test_workflow.test_dag"],
+            "tasks": {
+                "fail": {"cls": "FailTask", "parameters": {}},
+                "after": {"cls": "SleepTask", "depends_on": ["fail"], "parameters": {}},
+            },
+        })
+
+        workflow_instance.run()
+
+        assert workflow_instance.status == RunStatus.ERROR
+        assert isinstance(workflow_instance.error, ValueError)
+        assert workflow_instance.get_error_task().status_text == "fail"
+        assert "after" not in workflow_instance.task_run_stats
+
+
+class CountingWorkflow(Workflow):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.init_count()
+
+    def init_count(self):
+        self.started = []
+
+    def _start_task(self, task_name):
+        self.started.append(task_name)
+        return super()._start_task(task_name)
+
+
+def chain_definitions(task_count, pause_at):
+    tasks = {}
+    for i in range(task_count):
+        cls = "PauseOnceTask" if i == pause_at else "NoopTask"
+        tasks[f"t{i}"] = {"cls": cls, "depends_on": [f"t{i - 1}"] if i else [], "parameters": {}}
+    return {"modules": ["tests.test_workflow.test_dag"], "tasks": tasks}
+
+
+class TestFrontier:
+    @pytest.mark.parametrize("max_workers, task_count", [(1, 100000), (4, 1000)])
+    def test_resume_visits_remaining_tasks(self, max_workers, task_count):
+        workflow_instance = CountingWorkflow(
+            max_workers=max_workers, definitions=chain_definitions(task_count, pause_at=task_count - 2)
+        )
+        workflow_instance.run()
+
+        last, paused = f"t{task_count - 1}", f"t{task_count - 2}"
+        assert workflow_instance.status == RunStatus.PAUSED
+        assert workflow_instance.state.frontier == {paused: 0, last: 1}
+
+        workflow_instance = pickle.loads(pickle.dumps(workflow_instance))
+        workflow_instance.init_count()
+        workflow_instance.resume()
+
+        assert workflow_instance.status == RunStatus.SUCCESS
+        assert workflow_instance.started == [paused, last]
+        assert workflow_instance.state.frontier == {}
+
+    def test_without_frontier(self):
+        workflow_instance = CountingWorkflow(definitions=chain_definitions(5, pause_at=2))
+        workflow_instance.run()
+        workflow_instance.state.frontier = None
+        workflow_instance.init_count()
+        workflow_instance.resume()
+
+        assert workflow_instance.status == RunStatus.SUCCESS
+        assert workflow_instance.started == ["t2", "t3", "t4"]
+
+    def test_task_added_after_save(self):
+        definitions = chain_definitions(3, pause_at=None)
+        definitions["tasks"]["t1"]["cls"] = "PauseUntilReadyTask"
+        workflow_instance = CountingWorkflow(definitions=definitions)
+        workflow_instance.run()
+        assert workflow_instance.state.frontier == {"t1": 0, "t2": 1}
+
+        definitions["tasks"]["added"] = {"cls": "NoopTask", "parameters": {}}
+        workflow_instance = CountingWorkflow(definitions=definitions, state=workflow_instance.state)
+        workflow_instance.context["ready"] = True
+        workflow_instance.resume()
+
+        assert workflow_instance.status == RunStatus.SUCCESS
+        assert workflow_instance.started == ["t1", "t2", "added"]
+
+    def test_paused_task_in_dag(self):
+        definitions = sleep_definitions()
+        definitions["tasks"]["pause"] = {"cls": "PauseOnceTask", "parameters": {}}
+        definitions["tasks"]["e"] = {"cls": "SleepTask", "depends_on": ["pause", "a"], "parameters": {}}
+        workflow_instance = CountingWorkflow(max_workers=4, definitions=definitions)
+        workflow_instance.run()
+
+        # d is ready once a is done, no task starts after the pause
+        assert workflow_instance.state.frontier == {"d": 0, "pause": 0, "e": 1}
+        workflow_instance.init_count()
+        workflow_instance.resume()
+        assert sorted(workflow_instance.started) == ["d", "e", "pause"]
+        assert workflow_instance.started[-1] == "e"
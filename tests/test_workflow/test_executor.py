@@ -0,0 +1,129 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from yanwf.exceptions import PauseWorkflowException
+from yanwf.executor import WorkflowExecutor
+from yanwf.tasks import BaseTask, String
+from yanwf.workflows import RunStatus
+
+RUNNING = {}
+MAX_RUNNING = {}
+LOCK = threading.Lock()
+
+
+class TenantTask(BaseTask):
+    tenant = String()
+    text = String()
+
+    def run(self):
+        with LOCK:
+            RUNNING[self.tenant] = RUNNING.get(self.tenant, 0) + 1
+            MAX_RUNNING[self.tenant] = max(MAX_RUNNING.get(self.tenant, 0), RUNNING[self.tenant])
+        time.sleep(0.01)
+        with LOCK:
+            RUNNING[self.tenant] -= 1
+
+    def output(self):
+        return {"upper": self.text.upper()}
+
+
+class WaitEventTask(BaseTask):
+    def run(self):
+        self.workflow_context["event"].wait(5)
+
+
+class FailTask(BaseTask):
+    def run(self):
+        if self.workflow_context.get("pause"):
+            raise PauseWorkflowException("later")
+        raise ValueError("failed")
+
+
+def definitions(cls="TenantTask"):
+    return {
+        "modules": ["tests.test_workflow.test_executor"],
+        "context": {"tenant": None, "text": "a"},
+        "tasks": {"task": {"cls": cls, "parameters": {"tenant": "$context.tenant", "text": "$context.text"}}},
+    }
+
+
+class TestWorkflowExecutor:
+    def setup_method(self):
+        RUNNING.clear()
+        MAX_RUNNING.clear()
+
+    def test_results(self):
+        workflow_definitions = definitions()
+        with WorkflowExecutor(max_workers=4) as executor:
+            futures = [executor.submit(workflow_definitions, {"text": str(i)}) for i in range(20)]
+            results = [future.result(5) for future in futures]
+
+        assert [workflow.context["upper"] for workflow in results] == [str(i) for i in range(20)]
+        assert all(workflow.status == RunStatus.SUCCESS for workflow in results)
+        assert len(executor._templates) == 1
+        assert results[0].graph is results[1].graph
+
+    def test_template_key(self):
+        with WorkflowExecutor(max_workers=1) as executor:
+            first = executor.get_template(definitions(), key="tenant-flow")
+            assert executor.get_template(definitions(), key="tenant-flow") is first
+            assert executor.get_template(definitions()) is not first
+
+    def test_tenant_limits(self):
+        workflow_definitions = definitions()
+        with WorkflowExecutor(max_workers=8, tenant_limit=3, tenant_limits={"small": 1}) as executor:
+            futures = [
+                executor.submit(workflow_definitions, {"tenant": tenant}, tenant=tenant)
+                for _ in range(12)
+                for tenant in ("small", "large")
+            ]
+            for future in futures:
+                future.result(5)
+
+        assert MAX_RUNNING == {"small": 1, "large": 3}
+
+    def test_bounded_queue(self):
+        event = threading.Event()
+        executor = WorkflowExecutor(max_workers=1, queue_size=2)
+        running = executor.submit(definitions("WaitEventTask"), {"event": event})
+        while not running.running():
+            time.sleep(0.001)
+        executor.submit(definitions(), {"text": "b"})
+        executor.submit(definitions(), {"text": "c"})
+
+        with pytest.raises(queue.Full):
+            executor.submit(definitions(), block=False)
+        with pytest.raises(queue.Full):
+            executor.submit(definitions(), timeout=0.01)
+
+        event.set()
+        executor.shutdown()
+        assert running.result().status == RunStatus.SUCCESS
+        with pytest.raises(RuntimeError):
+            executor.submit(definitions())
+
+    def test_errors(self):
+        with WorkflowExecutor(max_workers=2, raise_on_error=True) as executor:
+            failed = executor.submit(definitions("FailTask"))
+            paused = executor.submit(definitions("FailTask"), {"pause": True})
+
+        with pytest.raises(ValueError):
+            failed.result()
+        assert paused.result().status == RunStatus.PAUSED
+
+    def test_cancel_pending(self):
+        event = threading.Event()
+        executor = WorkflowExecutor(max_workers=1)
+        running = executor.submit(definitions("WaitEventTask"), {"event": event})
+        while not running.running():
+            time.sleep(0.001)
+        pending = executor.submit(definitions())
+
+        executor.shutdown(wait=False, cancel_pending=True)
+        event.set()
+        executor.shutdown()
+        assert pending.cancelled()
+        assert running.result().status == RunStatus.SUCCESS
@@ -0,0 +1,157 @@
+import os
+import pickle
+import subprocess
+import sys
+
+from yanwf.journal import CheckpointJournal
+from yanwf.tasks import BaseTask, String
+from yanwf.templates import WorkflowTemplate
+from yanwf.workflows import RunStatus, Workflow
+from yanwf.exceptions import PauseWorkflowException
+
+
+class GreetTask(BaseTask):
+    text = String()
+
+    def run(self):
+        pass
+
+    def output(self):
+        return {"greeting": f"hello {self.text}"}
+
+
+class WaitApprovalTask(BaseTask):
+    approved = String()
+
+    def run(self):
+        if not self.approved:
+            raise PauseWorkflowException("wait for approval")
+
+    def output(self):
+        return "approved"
+
+
+class CrashTask(BaseTask):
+    def run(self):
+        if os.environ.get("YANWF_CRASH"):
+            # the process ends in the middle of the task
+            os._exit(1)
+
+    def output(self):
+        return {"crashed": False}
+
+
+CRASH_DEFINITIONS = {
+    "modules": ["tests.test_workflow.test_journal"],
+    "context": {"name": "world"},
+    "tasks": {
+        "greet": {"cls": "GreetTask", "parameters": {"text": "$context.name"}},
+        "crash": {"cls": "CrashTask", "parameters": {}},
+    },
+}
+
+DEFINITIONS = {
+    "modules": ["tests.test_workflow.test_journal"],
+    "context": {"name": "world", "approved": ""},
+    "tasks": {
+        "greet": {"cls": "GreetTask", "parameters": {"text": "$context.name"}},
+        "wait": {"cls": "WaitApprovalTask", "parameters": {"approved": "$context.approved"}},
+        "greet2": {"cls": "GreetTask", "parameters": {"text": "$context.wait"}},
+    },
+}
+
+
+def run_until_paused(path, compact_every=1000):
+    journal = CheckpointJournal(path, compact_every=compact_every)
+    workflow_instance = Workflow(definitions=DEFINITIONS, journal=journal)
+    workflow_instance.run()
+    journal.close()
+    return workflow_instance
+
+
+class TestCheckpointJournal:
+    def test_restore_from_journal(self, tmp_path):
+        path = str(tmp_path / "wf.journal")
+        paused = run_until_paused(path)
+        assert paused.status == RunStatus.PAUSED
+
+        workflow_instance = CheckpointJournal(path).restore(definitions=DEFINITIONS)
+
+        assert workflow_instance.status == RunStatus.PAUSED
+        assert workflow_instance.context["greeting"] == "hello world"
+        assert workflow_instance.task_run_stats["greet"].status == RunStatus.SUCCESS
+        assert workflow_instance.task_run_stats["wait"].status == RunStatus.PAUSED
+        assert workflow_instance.task_run_stats["wait"].status_text == "wait for approval"
+
+        workflow_instance.journal.update_context(workflow_instance, {"approved": "yes"})
+        workflow_instance.resume()
+        assert workflow_instance.status == RunStatus.SUCCESS
+
+        # restored again from the journal only
+        template = WorkflowTemplate(DEFINITIONS)
+        workflow_instance = CheckpointJournal(path).restore(template=template)
+        assert workflow_instance.status == RunStatus.SUCCESS
+        assert workflow_instance.context["greeting"] == "hello approved"
+
+    def test_compact(self, tmp_path):
+        path = str(tmp_path / "wf.journal")
+        run_until_paused(path, compact_every=3)
+
+        # start, finish and start of the first tasks are in the snapshot
+        assert os.path.exists(path + ".snapshot")
+        workflow_instance = CheckpointJournal(path).restore(definitions=DEFINITIONS)
+        assert workflow_instance.status == RunStatus.PAUSED
+        assert workflow_instance.task_run_stats["wait"].status == RunStatus.PAUSED
+
+        # each record is much smaller than the pickled workflow
+        assert os.path.getsize(path) < len(pickle.dumps(workflow_instance))
+
+    def test_ignore_interrupted_write(self, tmp_path):
+        path = str(tmp_path / "wf.journal")
+        run_until_paused(path)
+        with open(path, "ab") as f:
+            f.write(b"\x10\x00\x00\x00partial")
+
+        workflow_instance = CheckpointJournal(path).restore(definitions=DEFINITIONS)
+        assert workflow_instance.status == RunStatus.PAUSED
+
+    def test_skip_records_in_snapshot(self, tmp_path):
+        path = str(tmp_path / "wf.journal")
+        run_until_paused(path)
+        with open(path, "rb") as f:
+            records = f.read()
+
+        journal = CheckpointJournal(path)
+        state = journal.load()
+        journal.compact(state)
+        # truncating the journal was interrupted
+        with open(path, "wb") as f:
+            f.write(records)
+
+        workflow_instance = CheckpointJournal(path).restore(definitions=DEFINITIONS)
+        assert workflow_instance.task_run_stats["greet"].status == RunStatus.SUCCESS
+        assert workflow_instance.status == RunStatus.PAUSED
+
+    def test_resume_after_crash(self, tmp_path):
+        path = str(tmp_path / "wf.journal")
+        script = (
+            "from yanwf.journal import CheckpointJournal\n"
+            "from yanwf.workflows import Workflow\n"
+            "from tests.test_workflow.test_journal import CRASH_DEFINITIONS\n"
+            f"journal = CheckpointJournal({path!r})\n"
+            "Workflow(definitions=CRASH_DEFINITIONS, journal=journal).run()\n"
+        )
+        env = dict(os.environ, YANWF_CRASH="1", PYTHONPATH=os.pathsep.join(sys.path))
+        process = subprocess.run([sys.executable, "-c", script], env=env)
+        assert process.returncode == 1
+
+        workflow_instance = CheckpointJournal(path).restore(definitions=CRASH_DEFINITIONS)
+        stats = workflow_instance.task_run_stats
+        assert stats["greet"].status == RunStatus.SUCCESS
+        assert stats["crash"].status == RunStatus.PAUSED
+        assert stats["crash"].status_text == "interrupted"
+        assert workflow_instance.state.frontier is None
+
+        workflow_instance.resume()
+        assert workflow_instance.status == RunStatus.SUCCESS
+        assert workflow_instance.context["crashed"] is False
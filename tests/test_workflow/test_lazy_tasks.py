@@ -0,0 +1,100 @@
+import pickle
+
+from yanwf.tasks import BaseTask
+from yanwf.templates import WorkflowTemplate
+from yanwf.workflows import RunStatus, TaskInstances, Workflow
+
+CREATED = []
+
+
+class CountedTask(BaseTask):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        CREATED.append(self.name)
+
+    def run(self):
+        if self.name == "task9" and not self.workflow_context.get("fixed"):
+            raise ValueError("not fixed")
+
+
+def make_definitions(task_count=10):
+    tasks = {"task0": {"cls": "CountedTask", "parameters": {}}}
+    for i in range(1, task_count):
+        tasks[f"task{i}"] = {"cls": "CountedTask", "parameters": {}, "requires": [f"task{i - 1}"]}
+    return {"modules": ["tests.test_workflow.test_lazy_tasks"], "tasks": tasks}
+
+
+def make_resumable_state():
+    """State of a workflow whose last task failed"""
+    workflow = Workflow(definitions=make_definitions())
+    workflow.run()
+    assert workflow.status == RunStatus.ERROR
+    workflow.context["fixed"] = True
+    return workflow.state
+
+
+class TestTaskInstances:
+    def test_create_and_release(self):
+        tasks = TaskInstances(lambda task_name: CountedTask(name=task_name), ["a", "b"])
+        assert tasks.created() == []
+        assert list(tasks) == ["a", "b"]
+
+        task = tasks["a"]
+        assert tasks["a"] is task
+        assert tasks.created() == ["a"]
+
+        tasks.release("a")
+        assert tasks.created() == []
+        assert tasks["a"] is not task
+
+
+class TestLazyTasks:
+    def setup_method(self):
+        CREATED.clear()
+
+    def test_new_workflow_creates_all_tasks(self):
+        workflow = Workflow(definitions=make_definitions())
+        assert len(workflow.tasks.created()) == 10
+        assert len(CREATED) == 10
+
+    def test_restored_workflow_creates_remaining_tasks(self):
+        state = make_resumable_state()
+        CREATED.clear()
+
+        workflow = Workflow(definitions=make_definitions(), state=state)
+        assert workflow.tasks.created() == []
+
+        workflow.resume()
+        assert workflow.status == RunStatus.SUCCESS
+        assert CREATED == ["task9"]
+
+    def test_get_task_creates_task(self):
+        workflow = Workflow(definitions=make_definitions(), state=make_resumable_state())
+        task = workflow.get_task("task3")
+        assert task.name == "task3"
+        assert workflow.get_task("task3") is task
+
+    def test_release_completed(self):
+        workflow = Workflow(definitions=make_definitions(), release_completed=True)
+        workflow.context["fixed"] = True
+        workflow.run()
+        assert workflow.status == RunStatus.SUCCESS
+        assert workflow.tasks.created() == []
+
+    def test_template_restored_workflow(self):
+        template = WorkflowTemplate(make_definitions())
+        state = make_resumable_state()
+        CREATED.clear()
+
+        workflow = template.create(state=state)
+        assert workflow.tasks.created() == []
+        workflow.resume()
+        assert workflow.status == RunStatus.SUCCESS
+        assert workflow.tasks.created() == ["task9"]
+
+    def test_pickle(self):
+        workflow = Workflow(definitions=make_definitions(), state=make_resumable_state())
+        workflow = pickle.loads(pickle.dumps(workflow))
+        assert workflow.tasks.created() == []
+        workflow.resume()
+        assert workflow.status == RunStatus.SUCCESS
@@ -0,0 +1,135 @@
+import json
+import time
+import tracemalloc
+
+from yanwf.exceptions import PauseWorkflowException
+from yanwf.listeners import PrometheusExporter, SpanExporter, WorkflowListener
+from yanwf.tasks import BaseTask, String
+from yanwf.workflows import RunStatus, Workflow
+
+
+class AllocateTask(BaseTask):
+    text = String()
+
+    def run(self):
+        time.sleep(0.01)
+        self.data = [0] * 200000
+        self.result = self.text.upper()
+
+    def output(self):
+        return {"upper": self.result}
+
+
+class PauseTask(BaseTask):
+    upper = String()
+
+    def run(self):
+        raise PauseWorkflowException("wait")
+
+
+DEFINITIONS = {
+    "modules": ["tests.test_workflow.test_listeners"],
+    "context": {"text": "hello"},
+    "tasks": {
+        "allocate": {"cls": "AllocateTask", "parameters": {"text": "$context.text"}},
+        "pause": {"cls": "PauseTask", "parameters": {"upper": "$context.upper"}},
+    },
+}
+
+
+class RecordingListener(WorkflowListener):
+    def __init__(self):
+        self.events = []
+
+    def task_started(self, workflow, task_name):
+        self.events.append(("started", task_name))
+
+    def task_finished(self, workflow, task_name):
+        self.events.append(("finished", task_name))
+
+    def task_failed(self, workflow, task_name):
+        self.events.append(("failed", task_name, workflow.task_run_stats[task_name].status))
+
+    def workflow_finished(self, workflow):
+        self.events.append(("workflow", workflow.status))
+
+
+class TestInstrumentation:
+    def test_phase_timings(self):
+        workflow_instance = Workflow(definitions=DEFINITIONS)
+        workflow_instance.run()
+
+        stat = workflow_instance.task_run_stats["allocate"]
+        assert set(stat.timings) == {"run", "output", "merge"}
+        assert stat.timings["run"] >= 0.01
+        assert stat.duration >= sum(stat.timings.values())
+        assert stat.cpu_time is None
+        assert stat.peak_memory is None
+
+    def test_instrument(self):
+        workflow_instance = Workflow(definitions=DEFINITIONS, instrument=True)
+        workflow_instance.run()
+
+        stat = workflow_instance.task_run_stats["allocate"]
+        assert set(stat.timings) == {"resolve", "run", "output", "merge"}
+        assert stat.cpu_time >= 0
+        # the list of 200000 items
+        assert stat.peak_memory > 1000000
+        # started by the run, stopped when it ends
+        assert not tracemalloc.is_tracing()
+
+    def test_instrument_keeps_tracing_started_by_caller(self):
+        tracemalloc.start()
+        try:
+            Workflow(definitions=DEFINITIONS, instrument=True).run()
+            assert tracemalloc.is_tracing()
+        finally:
+            tracemalloc.stop()
+
+    def test_start_time_of_resumed_task(self):
+        workflow_instance = Workflow(definitions=DEFINITIONS)
+        workflow_instance.run()
+        first_start = workflow_instance.task_run_stats["pause"].start_time
+
+        workflow_instance.resume()
+        assert workflow_instance.task_run_stats["pause"].start_time > first_start
+
+
+class TestListeners:
+    def test_events(self):
+        listener = RecordingListener()
+        workflow_instance = Workflow(definitions=DEFINITIONS, listeners=[listener])
+        workflow_instance.run()
+
+        assert listener.events == [
+            ("started", "allocate"),
+            ("finished", "allocate"),
+            ("started", "pause"),
+            ("failed", "pause", RunStatus.PAUSED),
+            ("workflow", RunStatus.PAUSED),
+        ]
+
+    def test_exporters(self, tmp_path):
+        metrics_path = str(tmp_path / "metrics.prom")
+        spans_path = str(tmp_path / "spans.jsonl")
+        listeners = [PrometheusExporter(metrics_path), SpanExporter(spans_path)]
+        for _ in range(2):
+            Workflow(definitions=DEFINITIONS, listeners=listeners, instrument=True).run()
+        listeners[1].close()
+
+        with open(metrics_path) as f:
+            metrics = f.read()
+        assert 'yanwf_workflows_total{status="paused"} 2' in metrics
+        assert 'yanwf_task_runs_total{task="allocate",status="success"} 2' in metrics
+        assert 'yanwf_task_runs_total{task="pause",status="paused"} 2' in metrics
+        assert 'yanwf_task_phase_seconds_count{task="allocate",phase="run"} 2' in metrics
+        assert 'yanwf_task_peak_memory_bytes{task="allocate"}' in metrics
+
+        with open(spans_path) as f:
+            spans = [json.loads(line) for line in f]
+        assert [span["name"] for span in spans] == ["allocate", "pause", "Workflow"] * 2
+        workflow_span = spans[2]
+        assert workflow_span["parent_id"] is None
+        assert spans[0]["parent_id"] == workflow_span["span_id"]
+        assert spans[0]["trace_id"] == workflow_span["trace_id"] != spans[3]["trace_id"]
+        assert spans[1]["status"] == "PAUSED"
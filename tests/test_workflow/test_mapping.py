@@ -0,0 +1,149 @@
+import asyncio
+import os
+
+import pytest
+
+from yanwf.cache import MemoryResultCache
+
+from yanwf.exceptions import PauseWorkflowException
+from yanwf.tasks import AsyncBaseTask, BaseTask, String
+from yanwf.templates import WorkflowTemplate
+from yanwf.workflows import RunStatus, Workflow
+
+RUNS = []
+
+
+class SquareTask(BaseTask):
+    number = String(required=True)
+    suffix = String()
+
+    def run(self):
+        RUNS.append(self.number)
+        if self.number == 3 and not os.environ.get("YANWF_SQUARE_READY"):
+            raise PauseWorkflowException("not ready")
+
+    def output(self):
+        if isinstance(self.number, str):
+            return self.number + self.suffix
+        return self.number * self.number
+
+
+class AsyncSquareTask(AsyncBaseTask):
+    number = String(required=True)
+
+    async def run(self):
+        await asyncio.sleep(0)
+
+    def output(self):
+        return self.number * self.number
+
+
+def definitions(cls="SquareTask", **map_options):
+    map_options.setdefault("over", "$context.numbers")
+    map_options.setdefault("item", "number")
+    return {
+        "modules": ["tests.test_workflow.test_mapping"],
+        "context": {"numbers": [1, 2, 4, 5, 6], "suffix": "!"},
+        "tasks": {
+            "squares": {"cls": cls, "parameters": {"suffix": "$context.suffix"}, "map": map_options},
+            "total": {"cls": "SumTask", "parameters": {"numbers": "$context.squares"}},
+        },
+    }
+
+
+class SumTask(BaseTask):
+    numbers = String()
+
+    def run(self):
+        pass
+
+    def output(self):
+        return {"sum": sum(self.numbers)}
+
+
+class TestMapTask:
+    def setup_method(self):
+        RUNS.clear()
+        os.environ.pop("YANWF_SQUARE_READY", None)
+
+    @pytest.mark.parametrize(
+        "options",
+        [
+            {},
+            {"chunk_size": 2, "concurrency": 3},
+            {"chunk_size": 2, "concurrency": 2, "executor": "process"},
+        ],
+    )
+    def test_outputs_in_order(self, options):
+        workflow_instance = Workflow(raise_on_error=True, definitions=definitions(**options))
+        workflow_instance.run()
+
+        assert workflow_instance.context["squares"] == [1, 4, 16, 25, 36]
+        assert workflow_instance.context["sum"] == 82
+        assert workflow_instance.graph.dependencies["total"] == ["squares"]
+        items = workflow_instance.task_run_stats["squares"].items
+        assert len(items) == 5
+        assert items.count(0) == 5
+
+    def test_async_executor(self):
+        map_definitions = definitions("AsyncSquareTask", executor="async", concurrency=2)
+        workflow_instance = Workflow(raise_on_error=True, definitions=map_definitions)
+        workflow_instance.run()
+
+        assert workflow_instance.context["squares"] == [1, 4, 16, 25, 36]
+
+    def test_items_are_data(self):
+        template = WorkflowTemplate(definitions(output="strings"))
+        workflow_instance = template.create(context={"numbers": ["$context.suffix", "a"]})
+        workflow_instance.run()
+
+        assert workflow_instance.context["strings"] == ["$context.suffix!", "a!"]
+
+    def test_resume_failed_items(self):
+        workflow_instance = Workflow(definitions=definitions(chunk_size=2, concurrency=2))
+        workflow_instance.context["numbers"] = [1, 2, 3, 4]
+        workflow_instance.run()
+
+        assert workflow_instance.status == RunStatus.PAUSED
+        stat = workflow_instance.task_run_stats["squares"]
+        assert stat.status == RunStatus.PAUSED
+        assert stat.items.errors == {2: "not ready"}
+        assert sorted(RUNS) == [1, 2, 3, 4]
+
+        RUNS.clear()
+        os.environ["YANWF_SQUARE_READY"] = "1"
+        workflow_instance.resume()
+
+        assert workflow_instance.status == RunStatus.SUCCESS
+        assert RUNS == [3]
+        assert workflow_instance.context["squares"] == [1, 4, 9, 16]
+        assert not stat.items.errors
+
+    def test_cache_key_of_items(self):
+        cache = MemoryResultCache()
+        map_definitions = definitions()
+        map_definitions["tasks"]["squares"]["cache"] = True
+        first = Workflow(raise_on_error=True, definitions=map_definitions, result_cache=cache)
+        first.context["numbers"] = [1, 2, 3]
+        os.environ["YANWF_SQUARE_READY"] = "1"
+        first.run()
+
+        second = Workflow(raise_on_error=True, definitions=map_definitions, result_cache=cache)
+        second.context["numbers"] = [5, 6]
+        second.run()
+        assert second.context["squares"] == [25, 36]
+        assert not second.task_run_stats["squares"].cache_hit
+
+        third = Workflow(raise_on_error=True, definitions=map_definitions, result_cache=cache)
+        third.context["numbers"] = [5, 6]
+        third.run()
+        assert third.context["squares"] == [25, 36]
+        assert third.task_run_stats["squares"].cache_hit
+
+    def test_invalid_map(self):
+        with pytest.raises(ValueError):
+            Workflow(definitions=definitions(over=[1, 2]))
+        with pytest.raises(ValueError):
+            Workflow(definitions=definitions(item="unknown"))
+        with pytest.raises(ValueError):
+            Workflow(definitions=definitions(executor="gpu"))
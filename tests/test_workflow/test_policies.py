@@ -0,0 +1,165 @@
+import asyncio
+import time
+
+import pytest
+
+from yanwf.exceptions import PauseWorkflowException, TaskTimeoutException
+from yanwf.policies import LatencyHistory, RunPolicy, get_run_policy
+from yanwf.tasks import AsyncBaseTask, BaseTask, Number
+from yanwf.workflows import RunStatus, Workflow
+
+CALLS = []
+CANCELLED = []
+
+
+class SlowTask(BaseTask):
+    """The first `slow_calls` calls wait until cancelled, the others fail `fail_calls` times"""
+
+    slow_calls = Number(default_value=1)
+    fail_calls = Number(default_value=0)
+
+    def run(self):
+        CALLS.append(self)
+        call = len(CALLS)
+        if call <= self.slow_calls:
+            while not self.cancelled:
+                time.sleep(0.005)
+            CANCELLED.append(call)
+            self.check_cancelled()
+        if call <= self.slow_calls + self.fail_calls:
+            raise ValueError(f"call {call} failed")
+
+    def output(self):
+        return {"call": len(CALLS)}
+
+
+class PausingTask(BaseTask):
+    max_retries = 3
+
+    def run(self):
+        CALLS.append(self)
+        raise PauseWorkflowException("later")
+
+
+class AsyncSlowTask(AsyncBaseTask):
+    slow_calls = Number(default_value=1)
+
+    async def run(self):
+        CALLS.append(self)
+        if len(CALLS) <= self.slow_calls:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                CANCELLED.append(len(CALLS))
+                raise
+
+    def output(self):
+        return {"call": len(CALLS)}
+
+
+def wait_cancelled(count):
+    """Wait until the abandoned attempts have stopped"""
+    deadline = time.time() + 2
+    while len(CANCELLED) < count and time.time() < deadline:
+        time.sleep(0.005)
+
+
+def definitions(cls="SlowTask", parameters=None, **options):
+    task = {"cls": cls, "parameters": parameters or {}, **options}
+    return {"modules": ["tests.test_workflow.test_policies"], "tasks": {"task": task}}
+
+
+class TestRunPolicy:
+    def setup_method(self):
+        CALLS.clear()
+        CANCELLED.clear()
+
+    def test_no_policy(self):
+        task = SlowTask(name="task")
+        assert get_run_policy({}, task) is None
+        assert get_run_policy({"max_retries": 1}, task) == RunPolicy(max_retries=1)
+        with pytest.raises(ValueError):
+            get_run_policy({"hedge_after": "fast"}, task)
+
+    def test_timeout(self):
+        workflow_instance = Workflow(definitions=definitions(run_timeout=0.05))
+        workflow_instance.run()
+
+        assert workflow_instance.status == RunStatus.ERROR
+        assert isinstance(workflow_instance.error, TaskTimeoutException)
+        stat = workflow_instance.task_run_stats["task"]
+        assert (stat.attempts, stat.timeouts, stat.hedge_won) == (1, 1, False)
+        wait_cancelled(1)
+        assert CANCELLED == [1]
+
+    def test_retries(self):
+        parameters = {"slow_calls": 1, "fail_calls": 1}
+        workflow_definitions = definitions(
+            parameters=parameters, run_timeout=0.05, max_retries=2, retry_backoff=0
+        )
+        workflow_instance = Workflow(definitions=workflow_definitions)
+        workflow_instance.run()
+
+        assert workflow_instance.status == RunStatus.SUCCESS
+        assert workflow_instance.context["call"] == 3
+        stat = workflow_instance.task_run_stats["task"]
+        assert (stat.attempts, stat.timeouts) == (3, 1)
+        # the attempts after the first run on copies of the task
+        assert CALLS[0] is workflow_instance.tasks["task"] and CALLS[1] is not CALLS[0]
+        wait_cancelled(1)
+
+    def test_retries_exhausted(self):
+        parameters = {"slow_calls": 0, "fail_calls": 5}
+        workflow_definitions = definitions(parameters=parameters, max_retries=2, retry_backoff=0)
+        workflow_instance = Workflow(definitions=workflow_definitions)
+        workflow_instance.run()
+
+        assert workflow_instance.status == RunStatus.ERROR
+        assert str(workflow_instance.error) == "call 3 failed"
+        assert workflow_instance.task_run_stats["task"].attempts == 3
+
+    def test_pause_not_retried(self):
+        workflow_instance = Workflow(definitions=definitions("PausingTask"))
+        workflow_instance.run()
+
+        assert workflow_instance.status == RunStatus.PAUSED
+        assert len(CALLS) == 1
+
+    def test_hedge(self):
+        workflow_instance = Workflow(definitions=definitions(hedge_after=0.02))
+        workflow_instance.run()
+
+        assert workflow_instance.status == RunStatus.SUCCESS
+        stat = workflow_instance.task_run_stats["task"]
+        assert (stat.attempts, stat.hedge_won) == (2, True)
+        assert CALLS[0].cancelled
+        wait_cancelled(1)
+
+    def test_async_timeout_and_hedge(self):
+        workflow_instance = Workflow(definitions=definitions("AsyncSlowTask", run_timeout=0.05))
+        asyncio.run(workflow_instance.arun())
+        assert isinstance(workflow_instance.error, TaskTimeoutException)
+        assert CANCELLED == [1]
+
+        CALLS.clear()
+        CANCELLED.clear()
+        workflow_instance = Workflow(definitions=definitions("AsyncSlowTask", hedge_after=0.02))
+        asyncio.run(workflow_instance.arun())
+        stat = workflow_instance.task_run_stats["task"]
+        assert workflow_instance.status == RunStatus.SUCCESS
+        assert (stat.attempts, stat.hedge_won) == (2, True)
+        assert CANCELLED == [2]
+
+
+class TestLatencyHistory:
+    def test_percentile(self):
+        history = LatencyHistory(size=100, min_samples=10)
+        for i in range(5):
+            history.add("task", i)
+        assert history.percentile("task", 95) is None
+
+        for i in range(200):
+            history.add("task", float(i))
+        # the last 100 durations: 100..199
+        assert history.percentile("task", 50) == 150
+        assert history.percentile("task", 99) == 199
@@ -0,0 +1,90 @@
+import asyncio
+import os
+
+from yanwf import process_pool
+from yanwf.tasks import BaseTask, Number, String
+from yanwf.workflows import RunStatus, Workflow
+from yanwf.exceptions import PauseWorkflowException
+
+
+class CountWordsTask(BaseTask):
+    text = String()
+
+    def init(self):
+        self.count = None
+
+    def run(self):
+        self.count = len(self.text.split())
+        self.pid = os.getpid()
+
+    def output(self):
+        return {"count": self.count, "pid": self.pid, "context_keys": sorted(self.workflow_context)}
+
+
+class ProcessPauseTask(BaseTask):
+    run_count = Number(default_value=1)
+
+    def run(self):
+        if self.run_count == 1:
+            raise PauseWorkflowException("pause in process")
+
+
+def count_definitions():
+    return {
+        "modules": ["tests.test_workflow.test_process_pool"],
+        "context": {"text": "one two three", "unused": "x" * 1000, "lang": "en"},
+        "tasks": {
+            "CountWordsTask": {
+                "executor": "process",
+                "context_keys": ["lang"],
+                "parameters": {"text": "$context.text"},
+            }
+        },
+    }
+
+
+class TestProcessPool:
+    def test_run_in_process(self):
+        workflow_instance = Workflow(raise_on_error=True, definitions=count_definitions())
+
+        workflow_instance.run()
+
+        assert workflow_instance.status == RunStatus.SUCCESS
+        assert workflow_instance.context["count"] == 3
+        assert workflow_instance.context["pid"] != os.getpid()
+        # only the requested context keys are sent to the worker
+        assert workflow_instance.context["context_keys"] == ["lang"]
+        assert workflow_instance.task_run_stats["CountWordsTask"].output["count"] == 3
+
+    def test_arun_in_process(self):
+        workflow_instance = Workflow(raise_on_error=True, definitions=count_definitions())
+
+        asyncio.run(workflow_instance.arun())
+
+        assert workflow_instance.status == RunStatus.SUCCESS
+        assert workflow_instance.context["count"] == 3
+
+    def test_pause_in_process(self):
+        workflow_instance = Workflow(definitions={
+            "modules": ["tests.test_workflow.test_process_pool"],
+            "tasks": {"ProcessPauseTask": {"executor": "process", "parameters": {}}},
+        })
+
+        workflow_instance.run()
+
+        assert workflow_instance.status == RunStatus.PAUSED
+        assert workflow_instance.task_run_stats["ProcessPauseTask"].status_text == "pause in process"
+
+        workflow_instance.get_task("ProcessPauseTask").run_count = 2
+        workflow_instance.resume()
+
+        assert workflow_instance.status == RunStatus.SUCCESS
+
+    def test_dump_task_once(self):
+        task = CountWordsTask(text="a b")
+        task.workflow_context = {"big": "x" * 1000}
+
+        digest, data = process_pool.dump_task(task)
+
+        assert process_pool.dump_task(task) == (digest, data)
+        assert len(data) < 1000
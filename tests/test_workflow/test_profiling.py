@@ -0,0 +1,79 @@
+import pickle
+import pstats
+import time
+
+import pytest
+
+from yanwf.profiling import TaskProfiler
+from yanwf.tasks import BaseTask
+from yanwf.workflows import RunStatus, Workflow
+
+
+def busy_work(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class SlowTask(BaseTask):
+    def run(self):
+        busy_work(0.1)
+
+
+class FastTask(BaseTask):
+    def run(self):
+        pass
+
+
+DEFINITIONS = {
+    "modules": ["tests.test_workflow.test_profiling"],
+    "tasks": {"slow": {"cls": "SlowTask", "parameters": {}}, "fast": {"cls": "FastTask", "parameters": {}}},
+}
+
+
+def run_workflow(profiler, **kwargs):
+    workflow = Workflow(definitions=DEFINITIONS, profiler=profiler, **kwargs)
+    workflow.run()
+    assert workflow.status == RunStatus.SUCCESS
+    return workflow
+
+
+class TestTaskProfiler:
+    def test_slow_task_sampled(self, tmp_path):
+        workflow = run_workflow(TaskProfiler(str(tmp_path), threshold=0.05, interval=0.001))
+
+        path = workflow.task_run_stats["slow"].profile_path
+        assert path.endswith(".collapsed") and path.startswith(str(tmp_path))
+        with open(path) as f:
+            lines = f.read().splitlines()
+        assert any("busy_work (test_profiling.py" in line for line in lines)
+        stack, count = lines[0].rsplit(" ", 1)
+        assert int(count) > 0 and ";" in stack
+
+        assert workflow.task_run_stats["fast"].profile_path is None
+        assert len(list(tmp_path.iterdir())) == 1
+
+    def test_sample_rate_with_cprofile(self, tmp_path):
+        profiler = TaskProfiler(str(tmp_path), sample_rate=1.0, collector="cprofile")
+        workflow = run_workflow(profiler, max_workers=2)
+
+        for task_name in ("slow", "fast"):
+            path = workflow.task_run_stats[task_name].profile_path
+            assert path.endswith(".prof")
+            functions = [function for _, _, function in pstats.Stats(path).stats]
+            assert ("busy_work" in functions) == (task_name == "slow")
+
+    def test_off(self):
+        workflow = run_workflow(None)
+        assert workflow.task_run_stats["slow"].profile_path is None
+
+    def test_not_pickled(self, tmp_path):
+        workflow = run_workflow(TaskProfiler(str(tmp_path), threshold=1.0))
+        assert pickle.loads(pickle.dumps(workflow)).profiler is None
+
+    @pytest.mark.parametrize(
+        "kwargs", [{}, {"threshold": 1.0, "collector": "perf"}, {"sample_rate": 2.0}]
+    )
+    def test_invalid(self, tmp_path, kwargs):
+        with pytest.raises(ValueError):
+            TaskProfiler(str(tmp_path), **kwargs)
@@ -0,0 +1,88 @@
+import sys
+from importlib import metadata
+
+import pytest
+
+from yanwf import initializer
+from yanwf.registry import TaskRegistry, build_manifest, default_registry, register
+from yanwf.tasks import BaseTask
+from yanwf.workflows import RunStatus, Workflow
+
+
+@register(name="RegisteredNoopTask")
+class NoopTask(BaseTask):
+    def run(self):
+        pass
+
+
+class TestTaskRegistry:
+    def test_register(self):
+        assert "RegisteredNoopTask" in default_registry
+        assert default_registry.resolve("RegisteredNoopTask") is NoopTask
+
+        workflow_instance = Workflow(raise_on_error=True, definitions={
+            "tasks": {"noop": {"cls": "RegisteredNoopTask", "parameters": {}}}
+        })
+        workflow_instance.run()
+        assert workflow_instance.status == RunStatus.SUCCESS
+
+    def test_manifest(self, tmp_path):
+        path = str(tmp_path / "manifest.json")
+        manifest = build_manifest(["tests.test_workflow.test_workflow"], path)
+        assert manifest["tasks"]["ReadFileTask"] == [("tests.test_workflow.test_workflow", "ReadFileTask")]
+
+        registry = TaskRegistry()
+        registry.load_manifest(path)
+
+        task_cls = registry.resolve("HibernateTask")
+        assert task_cls is sys.modules["tests.test_workflow.test_workflow"].HibernateTask
+        assert registry.resolve("UnknownTask") is None
+
+    def test_lazy_import(self):
+        registry = TaskRegistry()
+        registry.add("NotImportedTask", "tests.test_workflow.not_a_module")
+
+        # nothing is imported until the class is resolved
+        assert "NotImportedTask" in registry
+        with pytest.raises(ImportError):
+            registry.resolve("NotImportedTask")
+
+    def test_prefer_definition_modules(self):
+        registry = TaskRegistry()
+        registry.add("MyWorkflow", "tests.test_workflow.test_tasks")
+        registry.add("MyWorkflow", "tests.test_workflow.test_workflow")
+
+        task_cls = registry.resolve("MyWorkflow", ["tests.test_workflow.test_workflow"])
+        assert task_cls.__module__ == "tests.test_workflow.test_workflow"
+        assert registry.resolve("MyWorkflow").__module__ == "tests.test_workflow.test_tasks"
+
+    def test_same_name_in_other_module(self):
+        registry = TaskRegistry()
+        registry.add("SumTask", "tests.test_workflow.test_streams")
+        modules = ["tests.test_workflow.test_mapping"]
+
+        assert registry.resolve("SumTask", modules) is None
+        task_cls = initializer.get_task_cls(modules, "SumTask", registry=registry)
+        assert task_cls.__module__ == "tests.test_workflow.test_mapping"
+        # not found in the modules of the definitions
+        task_cls = initializer.get_task_cls(["tests.test_workflow.test_tasks"], "SumTask", registry=registry)
+        assert task_cls.__module__ == "tests.test_workflow.test_streams"
+
+    def test_entry_points(self, monkeypatch):
+        entry_point = metadata.EntryPoint(
+            name="EntryPointTask", value="tests.test_workflow.test_registry:NoopTask", group="yanwf.tasks"
+        )
+        monkeypatch.setattr(metadata, "entry_points", lambda: metadata.EntryPoints([entry_point]))
+
+        registry = TaskRegistry()
+        registry.load_entry_points()
+
+        assert registry.resolve("EntryPointTask") is NoopTask
+
+
+class TestGetTaskCls:
+    def test_failed_import_cached(self):
+        with pytest.raises(ValueError):
+            initializer.get_task_cls(["tests.test_workflow.missing_module"], "MissingTask")
+
+        assert "tests.test_workflow.missing_module" in initializer._failed_imports
@@ -0,0 +1,148 @@
+import asyncio
+
+from yanwf.journal import CheckpointJournal
+from yanwf.serialization import dump_state, load_state
+from yanwf.tasks import AsyncBaseTask, BaseTask, String
+from yanwf.workflows import RunStatus, Workflow
+
+RUNS = []
+
+
+class LoadTask(BaseTask):
+    source = String()
+
+    def run(self):
+        RUNS.append(self.name)
+
+    def output(self):
+        return {"data": f"data of {self.source}"}
+
+
+class ScaleTask(BaseTask):
+    data = String()
+    factor = String()
+
+    def run(self):
+        RUNS.append(self.name)
+
+    def output(self):
+        return {"scaled": f"{self.data} x {self.factor}"}
+
+
+class LabelTask(BaseTask):
+    label = String()
+
+    def run(self):
+        RUNS.append(self.name)
+
+    def output(self):
+        # read in output(), without a parameter
+        return f"{self.label} {self.workflow_context['config.threshold']}"
+
+
+class AsyncLabelTask(AsyncBaseTask):
+    label = String()
+
+    async def run(self):
+        await asyncio.sleep(0)
+        RUNS.append(self.name)
+
+    def output(self):
+        return self.label
+
+
+DEFINITIONS = {
+    "modules": ["tests.test_workflow.test_rerun"],
+    "context": {"source": "a", "factor": 2, "label": "x", "config": {"threshold": 1, "other": 2}},
+    "tasks": {
+        "load": {"cls": "LoadTask", "parameters": {"source": "$context.source"}},
+        "scale": {"cls": "ScaleTask", "parameters": {"data": "$context.data", "factor": "$context.factor"}},
+        "labelled": {"cls": "LabelTask", "parameters": {"label": "$context.label"}},
+        "other": {"cls": "AsyncLabelTask", "parameters": {"label": "$context.config.other"}},
+    },
+}
+
+
+def run_workflow(**kwargs):
+    workflow = Workflow(definitions=DEFINITIONS, track_reads=True, **kwargs)
+    workflow.run()
+    assert workflow.status == RunStatus.SUCCESS
+    RUNS.clear()
+    return workflow
+
+
+class TestTrackReads:
+    def test_reads_and_writes(self):
+        workflow = run_workflow()
+        stats = workflow.task_run_stats
+        assert stats["load"].reads == ("source",)
+        assert stats["load"].writes == ("data",)
+        assert stats["scale"].reads == ("data", "factor")
+        assert stats["labelled"].reads == ("config.threshold", "label")
+        assert stats["labelled"].writes == ("labelled",)
+        assert stats["other"].reads == ("config.other",)
+
+    def test_not_tracked_by_default(self):
+        workflow = Workflow(definitions=DEFINITIONS)
+        workflow.run()
+        assert workflow.task_run_stats["load"].reads is None
+
+    def test_arun(self):
+        workflow = Workflow(definitions=DEFINITIONS, track_reads=True)
+        asyncio.run(workflow.arun())
+        assert workflow.task_run_stats["other"].reads == ("config.other",)
+        assert workflow.task_run_stats["scale"].reads == ("data", "factor")
+
+    def test_encoded_state(self):
+        workflow = run_workflow()
+        state = load_state(dump_state(workflow.state))
+        assert state.task_run_stats["scale"].reads == ("data", "factor")
+        assert state.task_run_stats["scale"].writes == ("scaled",)
+
+
+class TestRerun:
+    def test_rerun_reader(self):
+        workflow = run_workflow()
+        load_stat = workflow.task_run_stats["load"]
+
+        workflow.context["factor"] = 3
+        assert workflow.rerun(["factor"]) == ["scale"]
+        assert RUNS == ["scale"]
+        assert workflow.context["scaled"] == "data of a x 3"
+        assert workflow.task_run_stats["load"] is load_stat
+
+    def test_rerun_transitive(self):
+        workflow = run_workflow()
+        workflow.context["source"] = "b"
+        assert workflow.rerun(["source"]) == ["load", "scale"]
+        assert workflow.context["scaled"] == "data of b x 2"
+
+    def test_rerun_nested_keys(self):
+        workflow = run_workflow()
+        workflow.context["config"]["threshold"] = 5
+        assert workflow.rerun(["config.threshold"]) == ["labelled"]
+        assert workflow.context["labelled"] == "x 5"
+
+        workflow.context["config"] = {"threshold": 1, "other": 3}
+        assert workflow.rerun(["config"]) == ["labelled", "other"]
+        assert workflow.context["other"] == 3
+
+    def test_rerun_unknown_key(self):
+        workflow = run_workflow()
+        assert workflow.rerun(["missing"]) == []
+        assert RUNS == []
+
+    def test_rerun_without_tracked_reads(self):
+        workflow = Workflow(definitions=DEFINITIONS)
+        workflow.run()
+        # in dependency order
+        assert workflow.rerun(["factor"]) == ["load", "scale", "labelled", "other"]
+
+    def test_journal_replays_reset(self, tmp_path):
+        path = str(tmp_path / "wf.journal")
+        workflow = run_workflow(journal=CheckpointJournal(path))
+        workflow.invalidate(["factor"])
+
+        restored = CheckpointJournal(path).restore(definitions=DEFINITIONS)
+        assert "scale" not in restored.task_run_stats
+        assert restored.task_run_stats["load"].reads == ("source",)
@@ -0,0 +1,119 @@
+import base64
+import pickle
+from datetime import datetime
+
+from yanwf.workflows import RunStatus, TaskRunStat, TaskRunStats, Workflow, WorkflowState
+
+# pickled by the first release: RunLimit and VerifyConnectTask succeeded, HibernateTask paused
+BASELINE_STATE = base64.b64decode(
+    "gASVKAIAAAAAAACMD3lhbndmLndvcmtmbG93c5SMDVdvcmtmbG93U3RhdGWUk5QpgZR9lCiMBnN0YXR1c5RoAIwJUnVuU3Rh"
+    "dHVzlJOUSwSFlIWUUpSMBXRyYWNllE6MBWVycm9ylE6MB2NvbnRleHSUjAt5YW53Zi50YXNrc5SMD1dvcmtmbG93Q29udGV4"
+    "dJSTlCmBlH2UjAVzdG9yZZR9lCiMD2JhY2tlbmRfcHJvZmlsZZSMCnNxbDo6Y29ubjGUjAhncmVldGluZ5SMBWhlbGxvlHVz"
+    "YowOdGFza19ydW5fc3RhdHOUfZQojAhSdW5MaW1pdJRoAIwLVGFza1J1blN0YXSUk5QpgZR9lCiMCnN0YXJ0X3RpbWWUjAhi"
+    "dWlsdGluc5SMB2dldGF0dHKUk5SMCGRhdGV0aW1llIwIZGF0ZXRpbWWUk5SMBnV0Y25vd5SGlFKUjAhlbmRfdGltZZRoJkMK"
+    "B+oKEg4vGQVjCJSFlFKUaAVoB0sAhZRSlIwLc3RhdHVzX3RleHSUTowGb3V0cHV0lE51YowRVmVyaWZ5Q29ubmVjdFRhc2uU"
+    "aB0pgZR9lChoIGgpaCpoJkMKB+oKEg4vGQVjZ5SFlFKUaAVoL2gwTmgxTnVijA1IaWJlcm5hdGVUYXNrlGgdKYGUfZQoaCBo"
+    "KWgqaCZDCgfqChIOLxkFY3eUhZRSlGgFaApoMIwTdGVzdCBwYXVzZSB3b3JrZmxvd5RoMU51YnV1Yi4="
+)
+BASELINE_WORKFLOW = base64.b64decode(
+    "gASVbwMAAAAAAACMIXRlc3RzLnRlc3Rfd29ya2Zsb3cudGVzdF93b3JrZmxvd5SMCk15V29ya2Zsb3eUk5QpgZR9lCiMDnJh"
+    "aXNlX29uX2Vycm9ylImMBXN0YXRllIwPeWFud2Yud29ya2Zsb3dzlIwNV29ya2Zsb3dTdGF0ZZSTlCmBlH2UKIwGc3RhdHVz"
+    "lGgHjAlSdW5TdGF0dXOUk5RLBIWUhZRSlIwFdHJhY2WUTowFZXJyb3KUTowHY29udGV4dJSMC3lhbndmLnRhc2tzlIwPV29y"
+    "a2Zsb3dDb250ZXh0lJOUKYGUfZSMBXN0b3JllH2UKIwPYmFja2VuZF9wcm9maWxllIwKc3FsOjpjb25uMZSMCGdyZWV0aW5n"
+    "lIwFaGVsbG+UdXNijA50YXNrX3J1bl9zdGF0c5R9lCiMCFJ1bkxpbWl0lGgHjAtUYXNrUnVuU3RhdJSTlCmBlH2UKIwKc3Rh"
+    "cnRfdGltZZSMCGJ1aWx0aW5zlIwHZ2V0YXR0cpSTlIwIZGF0ZXRpbWWUjAhkYXRldGltZZSTlIwGdXRjbm93lIaUUpSMCGVu"
+    "ZF90aW1llGgtQwoH6goSDi8ZBWMIlIWUUpRoDGgOSwCFlFKUjAtzdGF0dXNfdGV4dJROjAZvdXRwdXSUTnVijBFWZXJpZnlD"
+    "b25uZWN0VGFza5RoJCmBlH2UKGgnaDBoMWgtQwoH6goSDi8ZBWNnlIWUUpRoDGg2aDdOaDhOdWKMDUhpYmVybmF0ZVRhc2uU"
+    "aCQpgZR9lChoJ2gwaDFoLUMKB+oKEg4vGQVjd5SFlFKUaAxoEWg3jBN0ZXN0IHBhdXNlIHdvcmtmbG93lGg4TnVidXVijAV0"
+    "YXNrc5R9lChoImgAaCKTlCmBlH2UKIwEbmFtZZRoIowRX3dvcmtmbG93X2NvbnRleHSUaBiMBl9saW1pdJRLAYwGX2NvdW50"
+    "lEsBdWJoOWgAaDmTlCmBlH2UKGhLaDloTGgYjAhfY29udGVudJSMESRjb250ZXh0LmdyZWV0aW5nlIwPX3ZlcmlmeV9jb250"
+    "ZW50lGgfjBFfcmVxdWlyZWRfY29udGVudJSMGCRjb250ZXh0LmJhY2tlbmRfcHJvZmlsZZR1Ymg/aABoP5OUKYGUfZQoaEto"
+    "P2hMaBiMCl9ydW5fY291bnSUSwJ1YnV1Yi4="
+)
+
+
+def make_stats(count=5):
+    stats = TaskRunStats()
+    for i in range(count):
+        stats[f"task{i}"] = TaskRunStat(status=RunStatus.SUCCESS, output={"value": i})
+    return stats
+
+
+class TestTaskRunStats:
+    def test_status_index(self):
+        stats = make_stats()
+        stats["task3"].status = RunStatus.ERROR
+        stats["task1"].status = RunStatus.PAUSED
+        stats["task4"].status = RunStatus.ERROR
+
+        assert stats.with_status(RunStatus.ERROR) == ["task3", "task4"]
+        assert stats.first_with_status(RunStatus.PAUSED) == "task1"
+        assert stats.first_with_status(RunStatus.RUNNING) is None
+        assert stats.count(RunStatus.SUCCESS) == 2
+
+        del stats["task3"]
+        stats["task4"] = TaskRunStat(status=RunStatus.RUNNING)
+        assert stats.with_status(RunStatus.ERROR) == []
+        assert stats.with_status(RunStatus.RUNNING) == ["task4"]
+        assert len(stats) == 4
+
+    def test_slotted(self):
+        stat = TaskRunStat()
+        assert not hasattr(stat, "__dict__")
+        assert isinstance(stat.start_time, datetime)
+
+    def test_pickle_columns(self):
+        stats = make_stats(1000)
+        stats["task7"].status = RunStatus.ERROR
+        stats["task7"].status_text = "failed"
+        stats["task8"].end_time = datetime(2024, 1, 2, 3, 4, 5, 678901)
+        stats["task9"].timings["run"] = 0.5
+
+        loaded = pickle.loads(pickle.dumps(stats))
+        assert loaded == stats
+        assert loaded["task8"].end_time == datetime(2024, 1, 2, 3, 4, 5, 678901)
+        assert loaded["task1"].end_time is None
+        assert loaded.with_status(RunStatus.ERROR) == ["task7"]
+
+        # the index follows the unpickled stats
+        loaded["task7"].status = RunStatus.SUCCESS
+        assert loaded.count(RunStatus.ERROR) == 0
+
+        records = pickle.dumps({name: stat for name, stat in stats.items()})
+        assert len(pickle.dumps(stats)) < len(records)
+
+    def test_pickled_dict_stat(self):
+        stat = TaskRunStat.__new__(TaskRunStat)
+        stat.__setstate__({"status": RunStatus.PAUSED, "output": 1, "start_time": None})
+        assert stat.status == RunStatus.PAUSED
+        assert stat.output == 1
+        assert stat.timings == {}
+
+    def test_state_converts_dict(self):
+        state = WorkflowState(task_run_stats={"a": TaskRunStat(status=RunStatus.ERROR)})
+        workflow_instance = Workflow(state=state)
+
+        assert isinstance(state.task_run_stats, TaskRunStats)
+        assert workflow_instance.get_error_task() is state.task_run_stats["a"]
+
+
+class TestBaselinePickles:
+    def test_state(self):
+        state = pickle.loads(BASELINE_STATE)
+
+        assert isinstance(state.task_run_stats, TaskRunStats)
+        assert state.task_run_stats.with_status(RunStatus.PAUSED) == ["HibernateTask"]
+        assert state.frontier is None
+        assert state.context["backend_profile"] == "sql::conn1"
+
+    def test_resume_workflow(self):
+        workflow_instance = pickle.loads(BASELINE_WORKFLOW)
+        assert workflow_instance.graph.order == ["RunLimit", "VerifyConnectTask", "HibernateTask"]
+        assert workflow_instance.max_workers == 1
+
+        workflow_instance.resume()
+        assert workflow_instance.status == RunStatus.SUCCESS
+        assert workflow_instance.task_run_stats["HibernateTask"].status == RunStatus.SUCCESS
+        # the $context. parameters of the tasks are resolved
+        task = workflow_instance.get_task("VerifyConnectTask")
+        assert task.required_content == "sql::conn1"
@@ -0,0 +1,139 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from yanwf.exceptions import PauseWorkflowException
+from yanwf.journal import CheckpointJournal
+from yanwf.scheduler import WakeupScheduler
+from yanwf.stores import MemoryStateStore
+from yanwf.tasks import BaseTask, Number, String
+from yanwf.templates import WorkflowTemplate
+from yanwf.workflows import RunStatus, Workflow
+
+
+class SleepTask(BaseTask):
+    seconds = Number(default_value=60)
+
+    def run(self):
+        if not self.workflow_context.get("woken"):
+            self.workflow_context["woken"] = True
+            raise PauseWorkflowException("sleeping", wake_at=self.seconds)
+
+
+class ApprovalTask(BaseTask):
+    event = String(default_value="approved")
+
+    def run(self):
+        if not self.workflow_context.get(self.event):
+            raise PauseWorkflowException("waiting", wait_for=self.event)
+
+    def output(self):
+        return {"result": self.workflow_context[self.event]}
+
+
+def definitions(cls, **parameters):
+    return {
+        "modules": ["tests.test_workflow.test_scheduler"],
+        "tasks": {"task": {"cls": cls, "parameters": parameters}},
+    }
+
+
+def create_scheduler(template, **kwargs):
+    def factory(workflow_id, state):
+        return template.create(state=state)
+
+    return WakeupScheduler(MemoryStateStore(), factory, **kwargs)
+
+
+class TestPauseCondition:
+    def test_stat(self):
+        workflow_instance = Workflow(definitions=definitions("SleepTask", seconds=60))
+        workflow_instance.run()
+
+        stat = workflow_instance.task_run_stats["task"]
+        assert stat.wake_at is not None and stat.wait_for is None
+        assert workflow_instance.get_wakeup() == (stat.wake_at, [])
+
+        workflow_instance.resume()
+        assert stat.wake_at is None
+        assert workflow_instance.get_wakeup() == (None, [])
+
+    def test_journal(self, tmp_path):
+        journal = CheckpointJournal(str(tmp_path / "wf.journal"), compact_every=1000)
+        workflow_instance = Workflow(definitions=definitions("ApprovalTask"), journal=journal)
+        workflow_instance.run()
+        journal.close()
+
+        restored = CheckpointJournal(journal.path).restore(definitions=definitions("ApprovalTask"))
+        assert restored.get_wakeup() == (None, ["approved"])
+
+
+class TestWakeupScheduler:
+    def test_wake_at(self):
+        now = [time.time()]
+        template = WorkflowTemplate(definitions("SleepTask", seconds=60))
+        scheduler = create_scheduler(template, clock=lambda: now[0])
+        for i in range(3):
+            workflow_instance = template.create()
+            workflow_instance.run()
+            assert scheduler.schedule(f"wf{i}", workflow_instance)
+        scheduler.cancel("wf2")
+
+        assert len(scheduler) == 2
+        assert scheduler.next_wake_time() > now[0] + 59
+        assert scheduler.run_due() == []
+
+        now[0] += 61
+        assert sorted(scheduler.run_due()) == ["wf0", "wf1"]
+        assert len(scheduler) == 0
+        assert scheduler.store.load("wf0").status == RunStatus.SUCCESS
+        assert scheduler.store.load("wf2").status == RunStatus.PAUSED
+
+    def test_signal(self):
+        template = WorkflowTemplate(definitions("ApprovalTask"))
+        scheduler = create_scheduler(template)
+        workflow_instance = template.create()
+        workflow_instance.run()
+        scheduler.schedule("wf", workflow_instance)
+
+        assert scheduler.signal("other") == []
+        assert scheduler.signal("approved", "yes") == ["wf"]
+        state = scheduler.store.load("wf")
+        assert state.status == RunStatus.SUCCESS
+        assert state.context["result"] == "yes"
+        assert "wf" not in scheduler
+
+    def test_not_scheduled(self):
+        template = WorkflowTemplate(definitions("ApprovalTask"))
+        scheduler = create_scheduler(template)
+        workflow_instance = template.create(context={"approved": True})
+        workflow_instance.run()
+
+        assert not scheduler.schedule("wf", workflow_instance)
+        assert scheduler.store.load("wf").status == RunStatus.SUCCESS
+
+    def test_background_thread(self):
+        template = WorkflowTemplate(definitions("SleepTask", seconds=0.05))
+        with ThreadPoolExecutor(2) as executor:
+            scheduler = create_scheduler(template, executor=executor)
+            scheduler.start()
+            try:
+                workflow_instance = template.create()
+                workflow_instance.run()
+                scheduler.schedule("wf", workflow_instance)
+                deadline = time.time() + 5
+                while scheduler.store.load("wf").status != RunStatus.SUCCESS and time.time() < deadline:
+                    time.sleep(0.01)
+            finally:
+                scheduler.stop()
+        assert scheduler.store.load("wf").status == RunStatus.SUCCESS
+
+    def test_recover(self):
+        template = WorkflowTemplate(definitions("ApprovalTask"))
+        scheduler = create_scheduler(template)
+        workflow_instance = template.create()
+        workflow_instance.run()
+        scheduler.schedule("wf", workflow_instance)
+
+        restarted = WakeupScheduler(scheduler.store, scheduler.factory)
+        assert restarted.recover() == 1
+        assert restarted.signal("approved") == ["wf"]
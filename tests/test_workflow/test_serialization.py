@@ -0,0 +1,135 @@
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+
+from yanwf.exceptions import PauseWorkflowException
+from yanwf.serialization import (
+    SCHEMA_VERSION,
+    dump_definitions,
+    dump_state,
+    load_definitions,
+    load_state,
+)
+from yanwf.stores import MemoryStateStore
+from yanwf.tasks import BaseTask
+from yanwf.workflows import RunStatus, TaskRunStat, TaskRunStats, Workflow, WorkflowState
+
+class WaitTask(BaseTask):
+    def run(self):
+        if not self.workflow_context.get("ready"):
+            raise PauseWorkflowException("not ready", wait_for="ready")
+
+
+DEFINITIONS = {
+    "modules": ["tests.test_workflow.test_serialization"],
+    "context": {"text": "a", "nested": {"n": 1}},
+    "tasks": {"WaitTask": {"parameters": {}}},
+}
+
+
+def make_state():
+    state = WorkflowState(status=RunStatus.PAUSED, frontier={"b": 0}, error=PauseWorkflowException("x"))
+    state.context.update(
+        {
+            "int": -(1 << 70),
+            "float": 1.5,
+            "text": "t" * 100,
+            "data": b"\x00\x01",
+            "items": [1, (True, None), {2: "two"}],
+            "time": datetime(2024, 1, 2, 3, 4, 5, 6),
+            "status": RunStatus.ERROR,
+            "set": {1, 2},
+        }
+    )
+    state.task_run_stats["a"] = TaskRunStat(status=RunStatus.SUCCESS, output={"a": 1}, timings={"run": 0.5})
+    state.task_run_stats["b\0"] = TaskRunStat(status=RunStatus.PAUSED, end_time=None, wait_for="event")
+    state.task_run_stats["c"] = TaskRunStat(status=RunStatus.NOT_STARTED, start_time=None)
+    return state
+
+
+class TestStateEncoding:
+    def test_round_trip(self):
+        state = make_state()
+        data = dump_state(state)
+        loaded = load_state(data)
+
+        assert len(data) < len(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+        assert loaded.status == RunStatus.PAUSED
+        assert loaded.frontier == {"b": 0}
+        assert str(loaded.error) == "x"
+        assert loaded.context.store == state.context.store
+        assert dict(loaded.task_run_stats.items()) == dict(state.task_run_stats.items())
+        assert load_state(data, lazy=False).task_run_stats == state.task_run_stats
+
+    def test_lazy_stats(self):
+        loaded = load_state(dump_state(make_state()))
+        stats = loaded.task_run_stats
+
+        assert stats.with_status(RunStatus.PAUSED) == ["b\0"]
+        assert stats.count(RunStatus.SUCCESS) == 1
+        assert stats.decoded_count() == 0
+        assert stats["a"].output == {"a": 1}
+        assert stats.decoded_count() == 1
+
+        # status changes of the decoded stats update the index
+        stats["b\0"].status = RunStatus.SUCCESS
+        assert stats.with_status(RunStatus.SUCCESS) == ["a", "b\0"]
+        stats["c"] = TaskRunStat(status=RunStatus.ERROR)
+        assert stats.count(RunStatus.NOT_STARTED) == 0
+        del stats["a"]
+        assert stats.with_status(RunStatus.SUCCESS) == ["b\0"]
+
+        unpickled = pickle.loads(pickle.dumps(stats))
+        assert type(unpickled) is TaskRunStats
+        assert unpickled == stats
+
+    def test_lazy_stats_from_threads(self):
+        state = WorkflowState()
+        for i in range(500):
+            state.task_run_stats[f"task{i}"] = TaskRunStat(
+                status=RunStatus.ERROR, status_text=f"error {i}", output={"i": [i, str(i)]}, attempts=i
+            )
+        data = dump_state(state)
+
+        for _ in range(10):
+            stats = load_state(data).task_run_stats
+            names = list(stats)
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                decoded = list(pool.map(lambda name: stats[name], names * 4))
+            assert all(stat is stats[name] for stat, name in zip(decoded, names * 4))
+            assert [stats[name] for name in names] == [state.task_run_stats[name] for name in names]
+
+    def test_resume_loaded_state(self):
+        workflow_instance = Workflow(definitions=DEFINITIONS)
+        workflow_instance.run()
+        assert workflow_instance.status == RunStatus.PAUSED
+
+        store = MemoryStateStore()
+        store.save("wf", workflow_instance.state)
+        resumed = Workflow(definitions=DEFINITIONS, state=store.load("wf"))
+        assert resumed.get_wakeup() == (None, ["ready"])
+        resumed.context["ready"] = True
+        resumed.resume()
+        assert resumed.status == RunStatus.SUCCESS
+
+    def test_pickled_state_in_store(self):
+        store = MemoryStateStore()
+        store._states["old"] = pickle.dumps(make_state())
+        assert store.load("old").frontier == {"b": 0}
+        store._states["encoded"] = dump_state(make_state())
+        assert store.load("encoded").frontier == {"b": 0}
+
+    def test_schema_version(self):
+        data = bytearray(dump_state(make_state()))
+        data[4] = SCHEMA_VERSION + 1
+        with pytest.raises(ValueError):
+            load_state(bytes(data))
+        with pytest.raises(ValueError):
+            load_state(dump_definitions(DEFINITIONS))
+
+
+class TestDefinitionsEncoding:
+    def test_round_trip(self):
+        assert load_definitions(dump_definitions(DEFINITIONS)) == DEFINITIONS
@@ -0,0 +1,116 @@
+import sqlite3
+import threading
+
+import pytest
+
+from yanwf.stores import MemoryStateStore, SQLiteStateStore
+from yanwf.workflows import RunStatus, TaskRunStat, WorkflowState
+
+
+def make_state(status, task_statuses):
+    state = WorkflowState(status=status)
+    state.context["value"] = status.name
+    for task_name, task_status in task_statuses.items():
+        state.task_run_stats[task_name] = TaskRunStat(status=task_status, output=task_name)
+    return state
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        store = MemoryStateStore()
+    else:
+        store = SQLiteStateStore(str(tmp_path / "states.db"), batch_size=10)
+    yield store
+    store.close()
+
+
+class TestStateStore:
+    def test_save_load(self, store):
+        store.save("wf1", make_state(RunStatus.PAUSED, {"a": RunStatus.SUCCESS, "b": RunStatus.PAUSED}))
+
+        state = store.load("wf1")
+        assert state.status == RunStatus.PAUSED
+        assert state.context["value"] == "PAUSED"
+        assert state.task_run_stats["b"].status == RunStatus.PAUSED
+
+        store.flush()
+        state = store.load("wf1")
+        assert state.task_run_stats["a"].output == "a"
+        assert store.load("unknown") is None
+
+    def test_save_copy(self, store):
+        state = make_state(RunStatus.RUNNING, {})
+        store.save("wf1", state)
+        state.status = RunStatus.ERROR
+
+        assert store.load("wf1").status == RunStatus.RUNNING
+
+    def test_find(self, store):
+        store.save("wf1", make_state(RunStatus.PAUSED, {"a": RunStatus.SUCCESS, "b": RunStatus.PAUSED}))
+        store.save("wf2", make_state(RunStatus.ERROR, {"a": RunStatus.ERROR}))
+        store.save("wf3", make_state(RunStatus.SUCCESS, {"a": RunStatus.SUCCESS, "b": RunStatus.SUCCESS}))
+        # overwritten
+        store.save("wf2", make_state(RunStatus.PAUSED, {"b": RunStatus.PAUSED}))
+
+        assert sorted(store.find(status=RunStatus.PAUSED)) == ["wf1", "wf2"]
+        assert sorted(store.find(task_status=RunStatus.SUCCESS)) == ["wf1", "wf3"]
+        assert store.find(task_status=RunStatus.SUCCESS, task_name="b") == ["wf3"]
+        assert store.find(status=RunStatus.PAUSED, task_status=RunStatus.SUCCESS) == ["wf1"]
+        assert store.find(task_status=RunStatus.ERROR) == []
+
+        store.delete("wf1")
+        assert store.load("wf1") is None
+        assert store.find(status=RunStatus.PAUSED) == ["wf2"]
+
+    def test_concurrent_saves(self, store):
+        def save(thread_index):
+            for i in range(50):
+                store.save(f"wf{thread_index}-{i}", make_state(RunStatus.SUCCESS, {"a": RunStatus.SUCCESS}))
+
+        threads = [threading.Thread(target=save, args=(index,)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        store.flush()
+
+        assert len(store.find(status=RunStatus.SUCCESS)) == 200
+        assert store.load("wf3-49").status == RunStatus.SUCCESS
+
+
+class TestSQLiteStateStore:
+    def test_reopen(self, tmp_path):
+        path = str(tmp_path / "states.db")
+        with SQLiteStateStore(path) as store:
+            store.save("wf1", make_state(RunStatus.PAUSED, {"a": RunStatus.PAUSED}))
+
+        with SQLiteStateStore(path) as store:
+            assert store.load("wf1").status == RunStatus.PAUSED
+            assert store.find(task_status=RunStatus.PAUSED) == ["wf1"]
+
+    def test_temporary_database(self):
+        store = SQLiteStateStore()
+        store.save("wf1", make_state(RunStatus.SUCCESS, {}))
+        store.flush()
+        assert store.load("wf1").status == RunStatus.SUCCESS
+        store.close()
+
+    def test_failed_batch(self, monkeypatch):
+        store = SQLiteStateStore()
+        write_batch = store._write_batch
+
+        def fail_once(connection, batch):
+            monkeypatch.setattr(store, "_write_batch", write_batch)
+            raise sqlite3.OperationalError("disk I/O error")
+
+        monkeypatch.setattr(store, "_write_batch", fail_once)
+        store.save("wf1", make_state(RunStatus.SUCCESS, {}))
+        with pytest.raises(sqlite3.OperationalError):
+            store.flush()
+
+        # the writer keeps writing the next batches
+        store.save("wf2", make_state(RunStatus.SUCCESS, {}))
+        store.flush()
+        assert store.find() == ["wf2"]
+        store.close()
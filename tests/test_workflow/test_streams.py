@@ -0,0 +1,127 @@
+import asyncio
+import pickle
+import time
+
+from yanwf.exceptions import PauseWorkflowException
+from yanwf.streams import TaskStream
+from yanwf.tasks import AsyncBaseTask, BaseTask, StreamingTask, String
+from yanwf.workflows import RunStatus, Workflow
+
+PRODUCED = []
+PAUSE_AT = {"item": None}
+
+
+class NumbersTask(StreamingTask):
+    def stream(self):
+        for number in range(10):
+            PRODUCED.append(number)
+            yield number
+
+
+class AsyncNumbersTask(StreamingTask):
+    async def numbers(self):
+        for number in range(10):
+            await asyncio.sleep(0)
+            yield number
+
+    def stream(self):
+        return self.numbers()
+
+
+class SumTask(BaseTask):
+    numbers = String()
+
+    def init(self):
+        self.seen = []
+
+    def run(self):
+        for number in self.numbers:
+            if number == PAUSE_AT["item"]:
+                PAUSE_AT["item"] = None
+                raise PauseWorkflowException(f"pause at {number}")
+            # the producer is at most one buffer ahead
+            time.sleep(0.001)
+            assert len(PRODUCED) <= number + 4
+            self.seen.append(number)
+
+    def output(self):
+        return {"total": sum(self.seen)}
+
+
+class AsyncSumTask(AsyncBaseTask):
+    numbers = String()
+
+    async def run(self):
+        self.seen = [number async for number in self.numbers]
+
+    def output(self):
+        return {"total": sum(self.seen)}
+
+
+def definitions(producer="NumbersTask", consumer="SumTask"):
+    return {
+        "modules": ["tests.test_workflow.test_streams"],
+        "tasks": {
+            "numbers": {"cls": producer, "parameters": {}, "buffer_size": 2},
+            "sum": {"cls": consumer, "parameters": {"numbers": "$context.numbers"}},
+        },
+    }
+
+
+class TestStreamingTask:
+    def setup_method(self):
+        PRODUCED.clear()
+        PAUSE_AT["item"] = None
+
+    def test_consume_while_producing(self):
+        for max_workers in (1, 2):
+            PRODUCED.clear()
+            workflow_instance = Workflow(
+                raise_on_error=True, definitions=definitions(), max_workers=max_workers
+            )
+            workflow_instance.run()
+
+            assert workflow_instance.status == RunStatus.SUCCESS
+            assert workflow_instance.context["total"] == 45
+            stat = workflow_instance.task_run_stats["numbers"]
+            assert stat.stream_position == 10
+            assert stat.stream_done
+
+    def test_resume_after_position(self):
+        PAUSE_AT["item"] = 4
+        workflow_instance = Workflow(definitions=definitions())
+        workflow_instance.run()
+
+        assert workflow_instance.status == RunStatus.PAUSED
+        assert workflow_instance.task_run_stats["numbers"].stream_position == 4
+        assert not workflow_instance.task_run_stats["numbers"].stream_done
+
+        # the paused workflow is saved and loaded, the stream is a closed placeholder
+        workflow_instance = pickle.loads(pickle.dumps(workflow_instance))
+        PRODUCED.clear()
+        workflow_instance.resume()
+
+        assert workflow_instance.status == RunStatus.SUCCESS
+        assert workflow_instance.get_task("sum").seen == [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+        assert workflow_instance.context["total"] == 45
+
+    def test_async_iterator(self):
+        workflow_instance = Workflow(
+            raise_on_error=True, definitions=definitions("AsyncNumbersTask", "AsyncSumTask")
+        )
+        asyncio.run(workflow_instance.arun())
+
+        assert workflow_instance.context["total"] == 45
+
+    def test_producer_error(self):
+        def fail():
+            yield 1
+            raise ValueError("broken")
+
+        stream = TaskStream("numbers", fail())
+        assert next(stream) == 1
+        try:
+            next(stream)
+            assert False
+        except ValueError as e:
+            assert str(e) == "broken"
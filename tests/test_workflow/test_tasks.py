@@ -1,7 +1,7 @@
 import pytest
 import pickle
 
-from yanwf.tasks import BaseTask, Number, String, WorkflowContext
+from yanwf.tasks import BaseTask, ContextRef, Number, String, WorkflowContext
 from yanwf.workflows import RunStatus, Workflow
 
 
@@ -121,3 +121,32 @@ class TestWorkflowContext:
             }
         })
         assert pickle.loads(pickle.dumps(context)) == context
+
+    def test_resolve_reference(self):
+        context = WorkflowContext({"a": {"b": {"c": 1}}, "d": 2})
+        task = MyTask(param1="$context.a.b.c", param2="$context.d")
+        task.workflow_context = context
+
+        # references are parsed once when set
+        assert task._param1 == ContextRef("a.b.c")
+        assert task.param1 == 1
+        assert task.param2 == 2
+
+        # the values are read again when the top level key changes
+        context["a"] = {"b": {"c": 3}}
+        context["d"] = 4
+        assert task.param1 == 3
+        assert task.param2 == 4
+
+        del context["a"]
+        with pytest.raises(KeyError):
+            _ = task.param1
+
+    def test_resolve_value_changed_in_place(self):
+        context = WorkflowContext({"a": {"b": 1}})
+        ref = ContextRef("a.b")
+        assert context.resolve(ref) == 1
+
+        context["a"]["b"] = 2
+        context.get("a").update(b=3)
+        assert context.resolve(ref) == context["a.b"] == 3
@@ -0,0 +1,78 @@
+from yanwf.tasks import BaseTask, String
+from yanwf.templates import WorkflowTemplate
+from yanwf.workflows import RunStatus, Workflow
+
+
+class AppendTask(BaseTask):
+    text = String()
+
+    def init(self):
+        self.items = []
+
+    def run(self):
+        self.items.append(self.text)
+
+    def output(self):
+        return {"items": self.items}
+
+
+class CountedTask(BaseTask):
+    def __init__(self, **kwargs):
+        self.run_count = 0
+        super(CountedTask, self).__init__(**kwargs)
+
+    def run(self):
+        self.run_count += 1
+
+
+class MyWorkflow(Workflow):
+    def __init__(self, **kwargs):
+        super(MyWorkflow, self).__init__(**kwargs)
+
+
+DEFINITIONS = {
+    "modules": ["tests.test_workflow.test_templates"],
+    "context": {"text": "default"},
+    "tasks": {
+        "AppendTask": {"name": "append", "parameters": {"text": "$context.text"}},
+        "CountedTask": {"parameters": {}},
+    },
+}
+
+
+class TestWorkflowTemplate:
+    def test_create(self):
+        template = WorkflowTemplate(DEFINITIONS, workflow_cls=MyWorkflow)
+
+        workflow1 = template.create(raise_on_error=True)
+        workflow2 = template.create(context={"text": "other"})
+        workflow1.run()
+        workflow2.run()
+
+        assert isinstance(workflow1, MyWorkflow)
+        assert workflow1.status == workflow2.status == RunStatus.SUCCESS
+        assert workflow1.context["items"] == ["default"]
+        assert workflow2.context["items"] == ["other"]
+        assert workflow1.get_task("AppendTask").name == "append"
+        # tasks are not shared between workflows
+        assert workflow1.get_task("AppendTask") is not workflow2.get_task("AppendTask")
+        assert workflow1.get_task("CountedTask").run_count == workflow2.get_task("CountedTask").run_count == 1
+        assert template.prototypes["CountedTask"].run_count == 0
+
+    def test_same_as_constructor(self):
+        workflow1 = WorkflowTemplate(DEFINITIONS).create()
+        workflow2 = Workflow(definitions=DEFINITIONS)
+
+        assert workflow1.graph.order == workflow2.graph.order
+        assert dict(workflow1.context) == dict(workflow2.context)
+        assert list(workflow1.tasks) == list(workflow2.tasks)
+
+    def test_create_from_state(self):
+        template = WorkflowTemplate(DEFINITIONS)
+        workflow1 = template.create()
+        workflow1.run()
+
+        workflow2 = template.create(state=workflow1.state)
+
+        assert workflow2.status == RunStatus.SUCCESS
+        assert workflow2.get_task("AppendTask").workflow_context is workflow1.context